@@ -10,6 +10,7 @@ from spaceport.models import (
     Spaceport,
     Route,
     Spaceflight,
+    SeatHold,
 )
 
 
@@ -23,11 +24,16 @@ class OrderAdmin(admin.ModelAdmin):
     inlines = (TicketInLine,)
 
 
+@admin.register(Spaceflight)
+class SpaceflightAdmin(admin.ModelAdmin):
+    readonly_fields = ("tickets_sold",)
+
+
 admin.site.register(SpaceshipType)
 admin.site.register(Crew)
 admin.site.register(Spaceship)
 admin.site.register(Planet)
 admin.site.register(Spaceport)
 admin.site.register(Route)
-admin.site.register(Spaceflight)
 admin.site.register(Ticket)
+admin.site.register(SeatHold)
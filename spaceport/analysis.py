@@ -0,0 +1,269 @@
+"""
+Query plan report for ``manage.py analyze_endpoints``.
+
+Every GET route of the API is called against the configured database as it
+is (seed it first), and each SELECT it runs is explained. The report leaves
+out timings and ids, so reports of two releases on the same data diff
+cleanly.
+"""
+
+import re
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from spaceport.models import Order, Route, Spaceflight
+
+URLCONFS = ("spaceport.urls", "user.urls")
+N_PLUS_ONE = 3
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\((?:\?, )+\?\)")
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: AS \S+)?$")
+_TEMP_BTREE = re.compile(r"USE TEMP B-TREE FOR (.+)$")
+
+
+def _route_ends():
+    route = Route.objects.order_by("pk").first()
+    return route and {"from": route.source_id, "to": route.destination_id}
+
+
+def _itinerary_search():
+    spaceflight = (
+        Spaceflight.objects.select_related("route").order_by("departure_time").first()
+    )
+    return spaceflight and {
+        "from": spaceflight.route.source_id,
+        "to": spaceflight.route.destination_id,
+        "depart_after": spaceflight.departure_time.isoformat(),
+        "arrive_by": (spaceflight.departure_time + timedelta(days=7)).isoformat(),
+    }
+
+
+# Query parameters that routes need to do their work, by route name.
+SAMPLE_PARAMS = {
+    "spaceport:route-plan": _route_ends,
+    "spaceport:spaceflight-itineraries": _itinerary_search,
+    "spaceport:spaceflight-best-seats": lambda: {"party": 2},
+}
+
+
+def get_routes():
+    """``(name, pattern)`` of the GET routes in ``URLCONFS``."""
+    routes = []
+
+    def walk(patterns, namespace):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns, pattern.namespace or namespace)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                routes.append((f"{namespace}:{pattern.name}", pattern))
+
+    for urlconf in URLCONFS:
+        module = get_resolver(urlconf).urlconf_module
+        walk(module.urlpatterns, module.app_name)
+
+    seen = set()
+    for name, pattern in routes:
+        callback = pattern.callback
+        actions = getattr(callback, "actions", None)
+        handles_get = (
+            "get" in actions
+            if actions is not None
+            else hasattr(getattr(callback, "cls", None), "get")
+        )
+        # Format suffix patterns repeat the route they extend.
+        if handles_get and name not in seen:
+            seen.add(name)
+            yield name, pattern
+
+
+def normalize(sql):
+    """``sql`` with its literals as ``?``, the same for every row of an N+1."""
+    return _LISTS.sub("(...)", _LITERALS.sub("?", sql))
+
+
+def explain(alias, sql):
+    connection = connections[alias]
+    if connection.vendor != "sqlite":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_flags(plan):
+    flags = []
+    for detail in plan or ():
+        if match := _SCAN.match(detail):
+            flags.append(f"full_scan:{match[1]}")
+        elif match := _TEMP_BTREE.search(detail):
+            flags.append(f"temp_btree:{match[1]}")
+    return flags
+
+
+class EndpointAnalyzer:
+    """
+    Calls routes as a customer (the owner of the newest order), or as the
+    first superuser where customers are refused, without throttling.
+    """
+
+    def __init__(self, page_size=20, n_plus_one=N_PLUS_ONE):
+        self.page_size = page_size
+        self.n_plus_one = n_plus_one
+        # Any host the settings accept; with DEBUG, localhost always is.
+        host = next(
+            (host.lstrip(".") for host in settings.ALLOWED_HOSTS if host != "*"),
+            "localhost",
+        )
+        self.factory = APIRequestFactory(HTTP_HOST=host)
+        users = get_user_model().objects
+        order = Order.objects.select_related("user").order_by("-created_at").first()
+        self.users = {
+            "customer": order.user if order else users.filter(is_staff=False).first(),
+            "staff": users.filter(is_superuser=True).first(),
+        }
+
+    def report(self):
+        # Calls clear the cache, so they get one of their own rather than the
+        # one the server shares.
+        private = {
+            alias: {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": f"analyze-endpoints-{alias}",
+            }
+            for alias in settings.CACHES
+        }
+        with override_settings(CACHES=private):
+            endpoints = [
+                self.analyze(name, pattern) for name, pattern in sorted(get_routes())
+            ]
+        flagged = [endpoint for endpoint in endpoints if endpoint.get("flags")]
+        return {
+            "vendor": connections["default"].vendor,
+            "endpoints": endpoints,
+            "summary": {
+                "endpoints": len(endpoints),
+                "skipped": sum("skipped" in endpoint for endpoint in endpoints),
+                "flagged": [endpoint["name"] for endpoint in flagged],
+            },
+        }
+
+    def analyze(self, name, pattern):
+        result = {"name": name, "route": str(pattern.pattern)}
+        kwargs = {}
+        if "pk" in pattern.pattern.regex.groupindex:
+            pk = self.sample_pk(pattern.callback)
+            if pk is None:
+                return {**result, "skipped": "no object to request"}
+            kwargs["pk"] = pk
+        if set(pattern.pattern.regex.groupindex) - {"pk"}:
+            return {**result, "skipped": "unknown url arguments"}
+        params = {"page_size": self.page_size}
+        if name in SAMPLE_PARAMS:
+            sample = SAMPLE_PARAMS[name]()
+            if sample is None:
+                return {**result, "skipped": "no data for the query parameters"}
+            params.update(sample)
+
+        for role, user in self.users.items():
+            if user is None:
+                continue
+            status, queries = self.call(
+                pattern.callback, reverse(name, kwargs=kwargs), params, user, kwargs
+            )
+            if status != 403:
+                break
+        else:
+            return {**result, "skipped": "no user allowed to call it"}
+        return {**result, "user": role, "status": status, **self.summarize(queries)}
+
+    def sample_pk(self, callback):
+        """The first object a list of the same view would show."""
+        initkwargs = {**callback.initkwargs, "detail": False}
+        for user in self.users.values():
+            if user is None:
+                continue
+            view = callback.cls(**initkwargs)
+            view.action_map, view.args, view.kwargs = {}, (), {}
+            request = self.factory.get("/")
+            force_authenticate(request, user)
+            view.request = view.initialize_request(request)
+            view.action, view.format_kwarg = "list", None
+            pk = view.get_queryset().values_list("pk", flat=True).first()
+            if pk is not None:
+                return pk
+        return None
+
+    def call(self, callback, path, params, user, kwargs):
+        actions = getattr(callback, "actions", None)
+        initkwargs = {**callback.initkwargs, "throttle_classes": ()}
+        if actions is None:
+            view = callback.cls.as_view(**initkwargs)
+        else:
+            view = callback.cls.as_view(actions, **initkwargs)
+        request = self.factory.get(path, params)
+        request.resolver_match = resolve(path)
+        force_authenticate(request, user)
+
+        # Cached lists and seat maps would hide the queries behind them.
+        cache.clear()
+        with ExitStack() as stack:
+            captured = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in (
+                    "default",
+                    *settings.SPACEPORT_SHARDS,
+                    *settings.SPACEPORT_REPLICAS,
+                )
+            }
+            response = view(request, **kwargs)
+            if response.streaming:
+                # The first chunk runs the queries of the whole export.
+                next(iter(response.streaming_content), None)
+                response.close()
+            else:
+                response.render()
+        queries = [
+            (alias, query["sql"])
+            for alias, context in captured.items()
+            for query in context.captured_queries
+        ]
+        return response.status_code, queries
+
+    def summarize(self, queries):
+        statements = {}
+        for alias, sql in queries:
+            if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                continue
+            key = (alias, normalize(sql))
+            if key in statements:
+                statements[key]["executions"] += 1
+                continue
+            plan = explain(alias, sql)
+            statements[key] = {
+                "database": alias,
+                "sql": key[1],
+                "executions": 1,
+                "plan": plan,
+                "flags": plan_flags(plan),
+            }
+
+        flags = set()
+        for statement in statements.values():
+            if statement["executions"] >= self.n_plus_one:
+                statement["flags"].append("n_plus_one")
+            flags.update(statement["flags"])
+        return {
+            "queries": len(queries),
+            "flags": sorted(flags),
+            "statements": list(statements.values()),
+        }
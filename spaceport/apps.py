@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SpaceportConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "spaceport"
+
+    def ready(self):
+        import spaceport.signals  # noqa: F401
@@ -0,0 +1,384 @@
+"""
+Benchmark scenarios for ``manage.py benchmark``.
+
+Each scenario runs against the configured database as it is (seed it first)
+and returns a dict of measurements that the command prints as JSON.
+"""
+
+import multiprocessing
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Max, Min
+from django.test import override_settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from spaceport.filters import filter_spaceflights
+from spaceport.models import Order, Route, Spaceflight, Ticket
+from spaceport.pagination import SpaceflightPagination
+from spaceport.serializers import OrderSerializer
+from spaceport.sharding import shard_for_id, ticket_databases
+from spaceport.views import RouteViewSet, SpaceflightViewSet
+
+SCENARIOS = {}
+
+
+def scenario(function):
+    SCENARIOS[function.__name__.replace("_", "-")] = function
+    return function
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        "runs": len(timings),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1] * 1000, 3),
+        "max_ms": round(timings[-1] * 1000, 3),
+    }
+
+
+def query_plan(queryset):
+    if connection.vendor != "sqlite":
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def search_space():
+    """Source/destination pairs and the departure span to search within."""
+    routes = list(Route.objects.values_list("source_id", "destination_id")[:1000])
+    bounds = Spaceflight.objects.aggregate(
+        first=Min("departure_time"), last=Max("departure_time")
+    )
+    return routes, bounds
+
+
+def random_search(rng, routes, bounds):
+    """First page of a week of spaceflights on a random route."""
+    span = (bounds["last"] - bounds["first"]).total_seconds()
+    source, destination = rng.choice(routes)
+    after = bounds["first"] + timedelta(seconds=rng.uniform(0, span))
+    return filter_spaceflights(
+        Spaceflight.objects.select_related("spaceship"),
+        {
+            "source": source,
+            "destination": destination,
+            "departure_after": after,
+            "departure_before": after + timedelta(days=7),
+            "min_seats": 1,
+        },
+    ).order_by(*SpaceflightPagination.ordering)[: SpaceflightPagination.page_size + 1]
+
+
+@scenario
+def spaceflight_search(rng, repeat):
+    """Filtered first page of GET /spaceflights/ for random route and week."""
+    routes, bounds = search_space()
+    if not routes or bounds["first"] is None:
+        return {"error": "No spaceflights to search, seed the database first."}
+
+    timings = []
+    for _ in range(repeat):
+        queryset = random_search(rng, routes, bounds)
+        started = time.perf_counter()
+        list(queryset)
+        timings.append(time.perf_counter() - started)
+
+    return {
+        "spaceflights": Spaceflight.objects.count(),
+        **summarize(timings),
+        "plan": query_plan(queryset),
+    }
+
+
+@scenario
+def list_serialization(rng, repeat):
+    """
+    GET /spaceflights/ and /routes/ pages with and without the values() fast
+    list path, listing the queries whose responses differ (``spaceport.tests``
+    asserts they do not).
+    """
+    user = get_user_model().objects.first()
+    if user is None or not Spaceflight.objects.exists():
+        return {"error": "No users or spaceflights, seed the database first."}
+
+    host = next(
+        (host for host in settings.ALLOWED_HOSTS if host.lstrip(".*")),
+        "localhost",
+    ).lstrip(".")
+    factory = APIRequestFactory(SERVER_NAME=host)
+    results = {}
+    for name, viewset, queries in (
+        (
+            "spaceflights",
+            SpaceflightViewSet,
+            ["page_size=20", "page_size=100", "page_size=20&fields=id,route"],
+        ),
+        ("routes", RouteViewSet, ["page_size=20", "page_size=100"]),
+    ):
+        view = viewset.as_view({"get": "list"}, throttle_classes=())
+        original = viewset.fast_list
+        timings, mismatches = {True: [], False: []}, []
+        try:
+            for _ in range(repeat):
+                query = rng.choice(queries)
+                bodies = {}
+                for fast in (True, False):
+                    viewset.fast_list = fast
+                    cache.clear()
+                    request = factory.get(f"/{name}/?{query}")
+                    force_authenticate(request, user=user)
+                    started = time.perf_counter()
+                    response = view(request).render()
+                    timings[fast].append(time.perf_counter() - started)
+                    bodies[fast] = response.content
+                if bodies[True] != bodies[False]:
+                    mismatches.append(query)
+        finally:
+            viewset.fast_list = original
+
+        results[name] = {
+            "fast": summarize(timings[True]),
+            "serializer": summarize(timings[False]),
+            "mismatches": mismatches,
+        }
+    return results
+
+
+READERS = 4
+WRITES_PER_SECOND = 50
+
+
+@scenario
+def concurrent_reads(rng, repeat):
+    """
+    ``repeat`` spaceflight searches in each of ``READERS`` processes while
+    another process books a ticket ``WRITES_PER_SECOND`` times a second,
+    first with SQLite's rollback journal and then with the production profile
+    of ``SPACEPORT_SQLITE_PROFILES``. The orders booked are deleted again.
+    """
+    if connection.vendor != "sqlite":
+        return {"error": "Only SQLite profiles are compared."}
+    user = get_user_model().objects.first()
+    routes, bounds = search_space()
+    spaceflights = list(
+        Spaceflight.objects.filter(tickets_sold=0)
+        .select_related("spaceship")
+        .order_by("-departure_time")[:200]
+    )
+    if user is None or not routes or not spaceflights:
+        return {"error": "No users or free spaceflights, seed the database first."}
+
+    seats = [
+        (spaceflight.id, row, seat)
+        for spaceflight in spaceflights
+        for row in range(1, spaceflight.spaceship.rows + 1)
+        for seat in range(1, spaceflight.spaceship.seats_in_row + 1)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode")
+        (journal_mode,) = cursor.fetchone()
+
+    results = {}
+    try:
+        for profile in ("development", "production"):
+            pragmas = {
+                "journal_mode": "DELETE",
+                **settings.SPACEPORT_SQLITE_PROFILES[profile],
+            }
+            with override_settings(SPACEPORT_SQLITE_PRAGMAS=pragmas):
+                # The journal mode sticks to the file, switch it while no
+                # other connection is open.
+                connection.close()
+                connection.ensure_connection()
+                results[profile], booked = read_while_booking(
+                    rng, repeat, routes, bounds, user, seats
+                )
+            Order.objects.filter(pk__in=booked).delete()
+    finally:
+        connection.close()
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+    return results
+
+
+def read_while_booking(rng, repeat, routes, bounds, user, seats):
+    """Returns the measurements and the ids of the orders booked."""
+    processes = multiprocessing.get_context("fork")
+    messages = processes.Queue()
+    stop = processes.Event()
+
+    def read(seed):
+        reader_rng = random.Random(seed)
+        timings, errors = [], 0
+        for _ in range(repeat):
+            queryset = random_search(reader_rng, routes, bounds)
+            started = time.perf_counter()
+            try:
+                list(queryset)
+            except OperationalError:
+                errors += 1
+            timings.append(time.perf_counter() - started)
+        messages.put((timings, errors))
+
+    def book():
+        interval = 1 / WRITES_PER_SECOND
+        timings, errors, booked = [], 0, []
+        for spaceflight_id, row, seat in seats:
+            if stop.is_set():
+                break
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    order = Order.objects.create(user=user)
+                    Ticket.objects.create(
+                        order=order, spaceflight_id=spaceflight_id, row=row, seat=seat
+                    )
+                booked.append(order.id)
+            except OperationalError:
+                errors += 1
+            elapsed = time.perf_counter() - started
+            timings.append(elapsed)
+            stop.wait(max(0, interval - elapsed))
+        messages.put((timings, errors, booked))
+
+    # Forked workers must open connections of their own.
+    connections.close_all()
+    writer = processes.Process(target=book)
+    readers = [
+        processes.Process(target=read, args=(rng.random(),)) for _ in range(READERS)
+    ]
+    started = time.perf_counter()
+    writer.start()
+    for reader in readers:
+        reader.start()
+
+    reads, errors = [], 0
+    for _ in readers:
+        timings, failed = messages.get()
+        reads.extend(timings)
+        errors += failed
+    elapsed = time.perf_counter() - started
+    stop.set()
+    writes, failed, booked = messages.get()
+    for process in (writer, *readers):
+        process.join()
+
+    return {
+        "reads_per_second": round(len(reads) / elapsed, 1),
+        "reads": summarize(reads),
+        "writes": summarize(writes) if writes else None,
+        "errors": errors + failed,
+    }, booked
+
+
+WRITERS = 4
+
+
+@scenario
+def sharded_booking(rng, repeat):
+    """
+    ``repeat`` single-ticket orders from each of ``WRITERS`` processes through
+    ``OrderSerializer``, first with every order on default and then spread
+    over ``SPACEPORT_SHARDS``. The orders booked are deleted again.
+    """
+    if not settings.SPACEPORT_SHARDS:
+        return {"error": "Set SPACEPORT_SHARD_DBS and migrate the shards first."}
+    user = get_user_model().objects.first()
+    spaceflights = list(
+        Spaceflight.objects.filter(tickets_sold=0)
+        .select_related("spaceship")
+        .order_by("-departure_time")[:200]
+    )
+    if user is None or not spaceflights:
+        return {"error": "No users or free spaceflights, seed the database first."}
+
+    seats = [
+        (spaceflight.id, row, seat)
+        for spaceflight in spaceflights
+        for row in range(1, spaceflight.spaceship.rows + 1)
+        for seat in range(1, spaceflight.spaceship.seats_in_row + 1)
+    ]
+    rng.shuffle(seats)
+    results = {}
+    for layout, shards in (
+        ("default", []),
+        ("sharded", settings.SPACEPORT_SHARDS),
+    ):
+        with override_settings(SPACEPORT_SHARDS=shards):
+            results[layout], booked = book_concurrently(repeat, user, seats)
+            for using, ids in group_orders(booked).items():
+                Order.objects.using(using).filter(pk__in=ids).delete()
+    return results
+
+
+def group_orders(order_ids):
+    groups = {}
+    for order_id in order_ids:
+        groups.setdefault(shard_for_id(order_id), []).append(order_id)
+    return groups
+
+
+def book_concurrently(repeat, user, seats):
+    """Returns the measurements and the ids of the orders booked."""
+    processes = multiprocessing.get_context("fork")
+    messages = processes.Queue()
+    request = APIRequestFactory().post("/api/spaceport/orders/")
+    request.user = user
+
+    def book(seats):
+        timings, errors, booked = [], 0, []
+        for spaceflight_id, row, seat in seats[:repeat]:
+            serializer = OrderSerializer(
+                data={
+                    "tickets": [
+                        {"spaceflight": spaceflight_id, "row": row, "seat": seat}
+                    ]
+                },
+                context={"request": request},
+            )
+            started = time.perf_counter()
+            try:
+                serializer.is_valid(raise_exception=True)
+                booked.append(serializer.save(user=user).id)
+            except (OperationalError, ValidationError):
+                errors += 1
+            timings.append(time.perf_counter() - started)
+        messages.put((timings, errors, booked))
+
+    # Forked workers must open connections of their own.
+    connections.close_all()
+    writers = [
+        processes.Process(target=book, args=(seats[number::WRITERS],))
+        for number in range(WRITERS)
+    ]
+    started = time.perf_counter()
+    for writer in writers:
+        writer.start()
+
+    writes, errors, booked = [], 0, []
+    for _ in writers:
+        timings, failed, ids = messages.get()
+        writes.extend(timings)
+        errors += failed
+        booked.extend(ids)
+    elapsed = time.perf_counter() - started
+    for writer in writers:
+        writer.join()
+
+    return {
+        "databases": len(ticket_databases()),
+        "bookings_per_second": round(len(booked) / elapsed, 1),
+        "writes": summarize(writes),
+        "errors": errors,
+    }, booked
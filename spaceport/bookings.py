@@ -0,0 +1,143 @@
+import time
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import DatabaseError, OperationalError, transaction
+from django.db.models import Subquery
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from spaceport.models import BookingRequest
+from spaceport.serializers import BookingRequestSerializer, OrderSerializer
+
+Status = BookingRequest.Status
+
+# Pause after a locked database, doubled for every failure in a row; drain()
+# gives up after LOCKED_RETRIES of them.
+LOCKED_BACKOFF = 0.05
+LOCKED_BACKOFF_MAX = 2.0
+LOCKED_RETRIES = 10
+
+
+class QueuedCreateMixin:
+    """
+    With ``SPACEPORT_ASYNC_BOOKING`` on, validates the order without writing
+    it, queues it as a ``BookingRequest`` and answers 202 with a status URL.
+    """
+
+    def create(self, request, *args, **kwargs):
+        if not settings.SPACEPORT_ASYNC_BOOKING:
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return queue_order(request, serializer)
+
+
+def queue_order(request, serializer):
+    """Queues the validated ``OrderSerializer`` data; answers 202."""
+    booking = BookingRequest.objects.create(
+        user=request.user,
+        spaceflight=serializer.validated_data["tickets"][0]["spaceflight"],
+        payload=serializer.initial_data,
+    )
+
+    url = reverse("spaceport:booking-detail", args=[booking.id], request=request)
+    return Response(
+        BookingRequestSerializer(booking, context={"request": request}).data,
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": url},
+    )
+
+
+def claim_batch(size):
+    """
+    Claims up to ``size`` pending bookings of the spaceflight at the head of
+    the queue with a single UPDATE, so competing workers never share one.
+    """
+    claim = uuid.uuid4().hex
+    pending = BookingRequest.objects.filter(status=Status.PENDING).order_by("id")
+    head = pending.values("spaceflight_id")[:1]
+
+    BookingRequest.objects.filter(
+        pk__in=Subquery(
+            pending.filter(spaceflight_id=Subquery(head)).values("pk")[:size]
+        )
+    ).update(status=Status.PROCESSING, claim=claim, updated_at=timezone.now())
+    return list(
+        BookingRequest.objects.filter(claim=claim).select_related("user").order_by("id")
+    )
+
+
+def process_batch(batch):
+    """Books a claimed batch of one spaceflight in a single transaction."""
+    with transaction.atomic():
+        # Take the write lock up front so the batch waits for other writers
+        # instead of failing to upgrade a read transaction.
+        BookingRequest.objects.filter(pk__in=[booking.pk for booking in batch]).update(
+            updated_at=timezone.now()
+        )
+        for booking in batch:
+            serializer = OrderSerializer(
+                data=booking.payload,
+                context={"request": SimpleNamespace(user=booking.user)},
+            )
+            try:
+                with transaction.atomic():
+                    serializer.is_valid(raise_exception=True)
+                    booking.order = serializer.save(user=booking.user)
+                booking.status = Status.DONE
+            except serializers.ValidationError as error:
+                booking.status, booking.errors = Status.FAILED, error.detail
+            except DjangoValidationError as error:
+                booking.status = Status.FAILED
+                booking.errors = getattr(error, "message_dict", error.messages)
+            except OperationalError:
+                # Locked or busy, not the booking's fault: drain() requeues
+                # the whole batch.
+                raise
+            except DatabaseError as error:
+                booking.status, booking.errors = Status.FAILED, {"detail": str(error)}
+            booking.updated_at = timezone.now()
+
+        BookingRequest.objects.bulk_update(
+            batch, ["status", "order", "errors", "updated_at"]
+        )
+
+
+def requeue_stale(older_than):
+    """Returns bookings of workers that died mid-batch to the queue."""
+    return BookingRequest.objects.filter(
+        status=Status.PROCESSING,
+        updated_at__lt=timezone.now() - timedelta(seconds=older_than),
+    ).update(status=Status.PENDING, claim="")
+
+
+def drain(batch_size):
+    """Processes batches until the queue is empty; returns bookings handled."""
+    handled = failures = 0
+    while True:
+        try:
+            batch = claim_batch(batch_size)
+            if not batch:
+                return handled
+            try:
+                process_batch(batch)
+            except OperationalError:
+                BookingRequest.objects.filter(
+                    pk__in=[booking.pk for booking in batch]
+                ).update(status=Status.PENDING, claim="")
+                raise
+        except OperationalError:
+            failures += 1
+            if failures > LOCKED_RETRIES:
+                raise
+            time.sleep(min(LOCKED_BACKOFF * 2 ** (failures - 1), LOCKED_BACKOFF_MAX))
+            continue
+        handled += len(batch)
+        failures = 0
@@ -0,0 +1,177 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+PURGE_EVERY = 1000
+# Below SQLite's limit of variables per statement.
+CHUNK_SIZE = 500
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start : start + CHUNK_SIZE]
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache shared by every worker on the host through one SQLite file, like
+    ``SQLiteThrottleStore``. ``add`` and ``incr`` are single statements, so
+    locks and version counters built on them hold across processes.
+
+    Integers are stored as such for ``incr``, other values pickled.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = str(location)
+        self._local = threading.local()
+        self._sets = 0
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+            )
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    @staticmethod
+    def _dumps(value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _loads(value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def _store(self, key, value, timeout, version, only_if_missing):
+        key = self.make_and_validate_key(key, version)
+        sql = (
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE "
+            "SET value = excluded.value, expires = excluded.expires"
+        )
+        params = [key, self._dumps(value), self.get_backend_timeout(timeout)]
+        if only_if_missing:
+            sql += " WHERE cache.expires IS NOT NULL AND cache.expires <= ?"
+            params.append(time.time())
+        stored = self.connection.execute(sql, params).rowcount == 1
+        self._sets += 1
+        if self._sets % PURGE_EVERY == 0:
+            self._cull()
+        return stored
+
+    def _cull(self):
+        connection = self.connection
+        connection.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        (entries,) = connection.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if entries > self._max_entries:
+            # Soonest to expire first, entries without a timeout last.
+            connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                "ORDER BY expires IS NULL, expires LIMIT ?)",
+                (entries // self._cull_frequency,),
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store(key, value, timeout, version, only_if_missing=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(key, value, timeout, version, only_if_missing=False)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_and_validate_key(key, version)
+            rows.append((key, self._dumps(value), expires))
+        self.connection.executemany(
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE "
+            "SET value = excluded.value, expires = excluded.expires",
+            rows,
+        )
+        return []
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version)
+        row = self.connection.execute(
+            "SELECT value FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else self._loads(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version): key for key in keys}
+        found = {}
+        now = time.time()
+        for chunk in _chunks(keys):
+            rows = self.connection.execute(
+                f"SELECT key, value FROM cache WHERE key IN "
+                f"({', '.join('?' * len(chunk))}) "
+                f"AND (expires IS NULL OR expires > ?)",
+                (*chunk, now),
+            )
+            found.update((keys[key], self._loads(value)) for key, value in rows)
+        return found
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version)
+        row = self.connection.execute(
+            "SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        cursor = self.connection.execute(
+            "UPDATE cache SET expires = ? WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        validated = self.make_and_validate_key(key, version)
+        # fetchall() finishes the statement, releasing the write lock.
+        rows = self.connection.execute(
+            "UPDATE cache SET value = value + ? WHERE key = ? "
+            "AND typeof(value) = 'integer' AND (expires IS NULL OR expires > ?) "
+            "RETURNING value",
+            (delta, validated, time.time()),
+        ).fetchall()
+        if not rows:
+            raise ValueError(f"Key '{key}' not found")
+        return rows[0][0]
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version)
+        cursor = self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version) for key in keys]
+        for chunk in _chunks(keys):
+            self.connection.execute(
+                f"DELETE FROM cache WHERE key IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+
+    def clear(self):
+        self.connection.execute("DELETE FROM cache")
@@ -0,0 +1,158 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+
+from spaceport.models import Route, Spaceport
+
+REBUILD_DELAY = 1.0
+
+
+class DistanceMatrix:
+    """
+    Shortest route distance between every pair of spaceports.
+
+    ``spaceports`` holds the sorted spaceport ids and ``distances[i, j]`` the
+    distance from ``spaceports[i]`` to ``spaceports[j]``, ``inf`` when there
+    is no path.
+    """
+
+    def __init__(self, spaceports, distances):
+        self.spaceports = spaceports
+        self.distances = distances
+
+    @classmethod
+    def build(cls, spaceports, routes):
+        """Floyd–Warshall over ``(source, destination, distance)`` routes."""
+        spaceports = np.unique(np.asarray(spaceports, dtype=np.int64))
+        routes = np.asarray(routes, dtype=np.int64).reshape(-1, 3)
+
+        size = len(spaceports)
+        distances = np.full((size, size), np.inf)
+        np.minimum.at(
+            distances,
+            (
+                np.searchsorted(spaceports, routes[:, 0]),
+                np.searchsorted(spaceports, routes[:, 1]),
+            ),
+            routes[:, 2].astype(np.float64),
+        )
+        np.fill_diagonal(distances, 0)
+
+        for k in range(size):
+            np.minimum(
+                distances, distances[:, k, None] + distances[None, k, :], out=distances
+            )
+        return cls(spaceports, distances)
+
+    @classmethod
+    def load_from_db(cls):
+        return cls.build(
+            Spaceport.objects.values_list("id", flat=True),
+            list(Route.objects.values_list("source_id", "destination_id", "distance")),
+        )
+
+    def save(self, path):
+        """
+        Writes the ids as the first row above the matrix, to a temporary file
+        that then replaces ``path``, so readers never see a partial matrix.
+        """
+        data = np.empty((len(self.spaceports) + 1, len(self.spaceports)))
+        data[0] = self.spaceports
+        data[1:] = self.distances
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".npy")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                np.save(file, data)
+            # mkstemp creates the file readable by its owner only.
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @classmethod
+    def open(cls, path):
+        """Maps a saved matrix read-only; pages are shared between processes."""
+        data = np.load(path, mmap_mode="r")
+        return cls(np.asarray(data[0], dtype=np.int64), data[1:])
+
+    def lookup(self, pairs):
+        """Distances for ``(source, destination)`` id pairs, ``None`` if none."""
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        if not len(self.spaceports):
+            return [None] * len(pairs)
+
+        positions = np.searchsorted(self.spaceports, pairs).clip(
+            max=len(self.spaceports) - 1
+        )
+        known = (self.spaceports[positions] == pairs).all(axis=1)
+
+        distances = np.full(len(pairs), np.inf)
+        distances[known] = self.distances[positions[known, 0], positions[known, 1]]
+        return [
+            int(distance) if np.isfinite(distance) else None for distance in distances
+        ]
+
+
+_matrix = None
+_matrix_file = None
+_lock = threading.Lock()
+_rebuild_lock = threading.Lock()
+_rebuild_timer = None
+
+
+def rebuild():
+    path = settings.SPACEPORT_DISTANCE_MATRIX
+    with _rebuild_lock:
+        DistanceMatrix.load_from_db().save(path)
+
+
+def get_distance_matrix():
+    """
+    Returns the saved matrix, mapping it again whenever another process has
+    replaced the file, and building it first if there is none yet.
+    """
+    global _matrix, _matrix_file
+
+    path = settings.SPACEPORT_DISTANCE_MATRIX
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        rebuild()
+        stat = os.stat(path)
+
+    file = (stat.st_ino, stat.st_mtime_ns)
+    if file != _matrix_file:
+        with _lock:
+            if file != _matrix_file:
+                _matrix, _matrix_file = DistanceMatrix.open(path), file
+    return _matrix
+
+
+def schedule_rebuild(delay=REBUILD_DELAY):
+    """
+    Rebuilds the matrix in a background thread ``delay`` seconds after the
+    last call, so a burst of route changes is only computed once.
+    """
+    global _rebuild_timer
+
+    with _lock:
+        if _rebuild_timer is not None:
+            _rebuild_timer.cancel()
+        _rebuild_timer = threading.Timer(delay, _rebuild_in_background)
+        _rebuild_timer.daemon = True
+        _rebuild_timer.start()
+
+
+def _rebuild_in_background():
+    try:
+        rebuild()
+    finally:
+        connections.close_all()
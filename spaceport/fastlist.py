@@ -0,0 +1,154 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, FileField, OuterRef, Subquery, Value
+from django.db.models.functions import Concat
+from rest_framework import serializers
+from rest_framework.relations import RelatedField
+from rest_framework.response import Response
+
+from spaceport.models import Crew, Route, Spaceflight, Spaceport, Spaceship
+
+
+def _spaceport_name(lookup):
+    return Subquery(
+        Spaceport.objects.filter(pk=OuterRef(lookup)).values("spaceport_name")
+    )
+
+
+# SQL for the model properties that list serializers read, by the lookup
+# prefix of the model they are read from. Rows join at most one relation
+# deep (see ``spaceport.optimizer.QueryPlan.collect``), farther values are
+# subqueries.
+PROPERTY_EXPRESSIONS = {
+    (Crew, "full_name"): lambda prefix: Concat(
+        F(f"{prefix}first_name"), Value(" "), F(f"{prefix}last_name")
+    ),
+    (Spaceship, "num_seats"): lambda prefix: F(f"{prefix}seats_in_row")
+    * F(f"{prefix}rows"),
+    (Route, "full_route"): lambda prefix: Concat(
+        _spaceport_name(f"{prefix}source"),
+        Value(" - "),
+        _spaceport_name(f"{prefix}destination"),
+    ),
+    (Spaceflight, "tickets_available"): lambda prefix: F(
+        f"{prefix}spaceship__seats_in_row"
+    )
+    * F(f"{prefix}spaceship__rows")
+    - F(f"{prefix}tickets_sold"),
+}
+
+
+class ValuesPlan:
+    """
+    Flat ``values()`` columns and SQL expressions that reproduce a read-only
+    serializer, with each field's ``to_representation`` for the output.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.expressions = {}
+
+    @classmethod
+    def for_serializer(cls, serializer, model):
+        """Returns ``None`` when a field cannot be read from a flat row."""
+        plan = cls()
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            lookup = plan.resolve(model, field)
+            if lookup is None:
+                return None
+            plan.columns[name] = (lookup, field.to_representation)
+        return plan
+
+    def resolve(self, model, field):
+        if (
+            isinstance(
+                field,
+                (
+                    serializers.BaseSerializer,
+                    serializers.ManyRelatedField,
+                    serializers.SerializerMethodField,
+                    serializers.FileField,
+                ),
+            )
+            or field.source == "*"
+        ):
+            return None
+
+        names = field.source_attrs
+        prefix = ""
+        for position, name in enumerate(names):
+            last = position == len(names) - 1
+            try:
+                model_field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                expression = PROPERTY_EXPRESSIONS.get((model, name))
+                if expression is None or not last:
+                    return None
+                alias = f"_{prefix}{name}"
+                self.expressions[alias] = expression(prefix)
+                return alias
+
+            if isinstance(model_field, FileField) or model_field.many_to_many:
+                return None
+            if not model_field.is_relation:
+                return f"{prefix}{name}" if last else None
+            if model_field.one_to_many or not model_field.concrete:
+                return None
+            if last:
+                # A key-only related field renders the foreign key.
+                if isinstance(field, RelatedField) and field.use_pk_only_optimization():
+                    return f"{prefix}{model_field.attname}"
+                return None
+            if prefix:
+                return None
+            model = model_field.related_model
+            prefix = f"{prefix}{name}__"
+        return None
+
+    def values(self, queryset, extra=()):
+        lookups = dict.fromkeys(
+            [*(lookup for lookup, _ in self.columns.values()), *extra]
+        )
+        return queryset.annotate(**self.expressions).values(*lookups)
+
+    def represent(self, rows):
+        columns = list(self.columns.items())
+        return [
+            {
+                name: None if row[lookup] is None else to_representation(row[lookup])
+                for name, (lookup, to_representation) in columns
+            }
+            for row in rows
+        ]
+
+
+class FastListMixin:
+    """
+    Serves ``list`` from ``queryset.values()`` rows when every field of the
+    list serializer maps to a column or a ``PROPERTY_EXPRESSIONS`` entry,
+    skipping model instances and serializer field binding. Other requests
+    (e.g. with ``?expand=``) use the serializer as usual.
+
+    Off unless a viewset sets ``fast_list``, once a test shows that both
+    paths render the same responses for it.
+    """
+
+    fast_list = False
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        plan = self.fast_list and ValuesPlan.for_serializer(
+            self.get_serializer(), queryset.model
+        )
+        if not plan:
+            return super().list(request, *args, **kwargs)
+
+        ordering = [
+            field.lstrip("-") for field in getattr(self.paginator, "ordering", ())
+        ]
+        rows = plan.values(self.filter_queryset(queryset), ordering)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(plan.represent(rows))
+        return self.get_paginated_response(plan.represent(page))
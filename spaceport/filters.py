@@ -0,0 +1,52 @@
+from django.db.models import F
+
+from spaceport.models import Route, Spaceship
+
+
+def filter_spaceflights(queryset, params):
+    """
+    Narrows spaceflights by validated ``SpaceflightFilterSerializer`` data.
+
+    Route conditions are resolved through ``Route`` subqueries so the search
+    stays on the ``(route, departure_time)`` index of ``Spaceflight``.
+    """
+    routes = Route.objects.all()
+    route_filters = {
+        "source": "source_id",
+        "destination": "destination_id",
+        "source_planet": "source__closest_planet_id",
+        "destination_planet": "destination__closest_planet_id",
+    }
+    route_params = {
+        lookup: params[name] for name, lookup in route_filters.items() if name in params
+    }
+    if route_params:
+        queryset = queryset.filter(route__in=routes.filter(**route_params).values("id"))
+
+    time_filters = {
+        "departure_after": "departure_time__gte",
+        "departure_before": "departure_time__lte",
+        "arrival_after": "arrival_time__gte",
+        "arrival_before": "arrival_time__lte",
+    }
+    queryset = queryset.filter(
+        **{
+            lookup: params[name]
+            for name, lookup in time_filters.items()
+            if name in params
+        }
+    )
+
+    if "spaceship_type" in params:
+        queryset = queryset.filter(
+            spaceship__in=Spaceship.objects.filter(
+                spaceship_types=params["spaceship_type"]
+            ).values("id")
+        )
+
+    if "min_seats" in params:
+        queryset = queryset.alias(
+            seats_left=F("spaceship__rows") * F("spaceship__seats_in_row")
+            - F("tickets_sold")
+        ).filter(seats_left__gte=params["min_seats"])
+    return queryset
@@ -0,0 +1,123 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from spaceport.replicas import replica_lag
+
+RESPONSE_TIMEOUT = 5 * 60
+# Change marks outlive every response computed before them.
+CHANGE_TIMEOUT = 2 * RESPONSE_TIMEOUT
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+ALL_SPACEFLIGHTS = "all"
+SPACEFLIGHT_LISTS = "lists"
+
+
+def _changed_key(dependency):
+    return f"spaceport:spaceflight:{dependency}:changed"
+
+
+def forget_spaceflights(*spaceflight_ids):
+    """Invalidates the cached responses that include these spaceflights."""
+    now = time.time()
+    cache.set_many(
+        {_changed_key(spaceflight_id): now for spaceflight_id in spaceflight_ids},
+        CHANGE_TIMEOUT,
+    )
+
+
+def forget_spaceflight_lists(*spaceflight_ids):
+    """
+    Invalidates every cached list page as well, for changes that can move
+    spaceflights onto other pages or into other filter results.
+    """
+    forget_spaceflights(SPACEFLIGHT_LISTS, *spaceflight_ids)
+
+
+def forget_all_spaceflights():
+    """Invalidates every cached response, e.g. after a route is renamed."""
+    forget_spaceflights(ALL_SPACEFLIGHTS)
+
+
+def _is_fresh(entry):
+    computed_at, dependencies, _ = entry
+    keys = [
+        _changed_key(dependency) for dependency in (ALL_SPACEFLIGHTS, *dependencies)
+    ]
+    return all(changed < computed_at for changed in cache.get_many(keys).values())
+
+
+def get_or_compute(key, compute):
+    """
+    Returns the cached data under ``key`` unless one of its dependencies
+    changed after it was computed. ``compute`` returns ``(data,
+    dependencies)``, spaceflight ids or ``SPACEFLIGHT_LISTS``; only the
+    worker holding the lock runs it, the others wait up to ``LOCK_TIMEOUT``
+    for its result.
+    """
+    entry = cache.get(key)
+    if entry is not None and _is_fresh(entry):
+        return entry[2]
+
+    lock = f"{key}:lock"
+    if cache.add(lock, True, LOCK_TIMEOUT):
+        try:
+            # Data read from a replica is only as recent as the replica.
+            computed_at = time.time() - replica_lag()
+            data, dependencies = compute()
+            cache.set(key, (computed_at, dependencies, data), RESPONSE_TIMEOUT)
+            return data
+        finally:
+            cache.delete(lock)
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and _is_fresh(entry):
+            return entry[2]
+    return compute()[0]
+
+
+class SpaceflightCacheMixin:
+    """
+    Caches spaceflight list pages and details per URL. Bookings mark the
+    spaceflights they touch as changed (see ``forget_spaceflights``), which
+    invalidates just the responses showing those spaceflights.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            lambda response: [
+                SPACEFLIGHT_LISTS,
+                *(spaceflight["id"] for spaceflight in response.data["results"]),
+            ],
+            super().list,
+            request,
+            *args,
+            **kwargs,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            lambda response: [response.data["id"]],
+            super().retrieve,
+            request,
+            *args,
+            **kwargs,
+        )
+
+    def cached_response(self, dependencies, handler, request, *args, **kwargs):
+        digest = hashlib.sha1(
+            f"{request.build_absolute_uri()}\n{request.accepted_media_type}".encode()
+        ).hexdigest()
+
+        def compute():
+            response = handler(request, *args, **kwargs)
+            return response.data, dependencies(response)
+
+        data = get_or_compute(f"spaceport:spaceflights:response:{digest}", compute)
+        return Response(data)
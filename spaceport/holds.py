@@ -0,0 +1,82 @@
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from spaceport.models import SeatHold
+from spaceport.seatmap import get_seat_map
+
+DEFAULT_HOLD_MINUTES = 10
+MAX_HOLD_MINUTES = 30
+
+
+class SeatsUnavailable(Exception):
+    def __init__(self, seats):
+        super().__init__("Some of the seats are already taken or on hold.")
+        self.seats = seats
+
+
+def active_holds(**filters):
+    return SeatHold.objects.filter(expires_at__gt=timezone.now(), **filters)
+
+
+def place_holds(spaceflight, user, seats, minutes=DEFAULT_HOLD_MINUTES):
+    """
+    Holds ``seats`` (``(row, seat)`` pairs) of ``spaceflight`` for ``user``.
+
+    Seats that are sold or held by someone else are refused from the cached
+    seat map and one read of the flight's active holds, before any write
+    transaction starts. Expired holds of the flight are swept on the way in,
+    so they never need a separate clean-up job.
+    """
+    requested = set(seats)
+    seats = sorted(requested)
+    seat_map = get_seat_map(spaceflight)
+    rows = {row for row, _ in seats}
+
+    unavailable = {seat for seat in seats if seat in seat_map}
+    unavailable.update(
+        active_holds(spaceflight=spaceflight, row__in=rows)
+        .exclude(user=user)
+        .values_list("row", "seat")
+    )
+    unavailable.intersection_update(requested)
+    if unavailable:
+        raise SeatsUnavailable(sorted(unavailable))
+
+    now = timezone.now()
+    token = uuid.uuid4()
+    holds = [
+        SeatHold(
+            token=token,
+            spaceflight=spaceflight,
+            user=user,
+            row=row,
+            seat=seat,
+            expires_at=now + timedelta(minutes=minutes),
+        )
+        for row, seat in seats
+    ]
+
+    try:
+        with transaction.atomic():
+            SeatHold.objects.filter(
+                spaceflight=spaceflight, expires_at__lte=now
+            ).delete()
+            replaced = [
+                pk
+                for pk, row, seat in SeatHold.objects.filter(
+                    spaceflight=spaceflight, user=user, row__in=rows
+                ).values_list("pk", "row", "seat")
+                if (row, seat) in requested
+            ]
+            SeatHold.objects.filter(pk__in=replaced).delete()
+            SeatHold.objects.bulk_create(holds)
+    except IntegrityError:
+        raise SeatsUnavailable(seats)
+    return holds
+
+
+def release_holds(user, token):
+    return SeatHold.objects.filter(user=user, token=token).delete()[0]
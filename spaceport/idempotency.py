@@ -0,0 +1,117 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from spaceport.models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+RESPONSE_TTL = timedelta(hours=24)
+IN_FLIGHT_TTL = timedelta(minutes=1)
+WAIT_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = f"{HEADER} was already used with a different request body."
+    default_code = "idempotency_key_reused"
+
+
+class IdempotencyKeyInFlight(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = f"A request with this {HEADER} is still being processed."
+    default_code = "idempotency_key_in_flight"
+
+
+def claim_key(user, key, fingerprint):
+    """
+    Claims ``key`` for ``user`` and returns ``(record, replay)``.
+
+    The first request inserts an in-flight record; concurrent duplicates
+    poll until it stores its response (``replay`` is then ``True``) or
+    ``WAIT_TIMEOUT`` runs out. In-flight records of crashed requests expire
+    after ``IN_FLIGHT_TTL``.
+    """
+    deadline = time.monotonic() + WAIT_TIMEOUT
+
+    while True:
+        now = timezone.now()
+        record = IdempotencyKey.objects.filter(
+            user=user, key=key, expires_at__gt=now
+        ).first()
+
+        if record is None:
+            IdempotencyKey.objects.filter(user=user, expires_at__lte=now).delete()
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=user,
+                        key=key,
+                        fingerprint=fingerprint,
+                        expires_at=now + IN_FLIGHT_TTL,
+                    )
+                return record, False
+            except IntegrityError:
+                continue
+
+        if record.fingerprint != fingerprint:
+            raise IdempotencyKeyReused()
+        if record.status_code is not None:
+            return record, True
+        if time.monotonic() > deadline:
+            raise IdempotencyKeyInFlight()
+        time.sleep(POLL_INTERVAL)
+
+
+def idempotent(request, create):
+    """
+    Returns ``create()``, or the response stored for a repeated
+    ``Idempotency-Key`` header of the same user.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return create()
+
+    fingerprint = hashlib.sha256(
+        json.dumps(request.data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    record, replay = claim_key(request.user, key[:255], fingerprint)
+    if replay:
+        return Response(
+            record.response,
+            status=record.status_code,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        response = create()
+    except Exception:
+        record.delete()
+        raise
+
+    if response.status_code >= 500:
+        record.delete()
+    else:
+        record.status_code = response.status_code
+        record.response = response.data
+        record.expires_at = timezone.now() + RESPONSE_TTL
+        record.save(update_fields=("status_code", "response", "expires_at"))
+    return response
+
+
+class IdempotentCreateMixin:
+    """
+    Replays the stored response of ``create`` for a repeated
+    ``Idempotency-Key`` header of the same user.
+    """
+
+    def create(self, request, *args, **kwargs):
+        return idempotent(request, partial(super().create, request, *args, **kwargs))
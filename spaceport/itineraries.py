@@ -0,0 +1,88 @@
+import bisect
+from collections import namedtuple
+
+from django.db.models import F
+
+from spaceport.models import Spaceflight
+
+Connection = namedtuple(
+    "Connection",
+    ("spaceflight", "departure_time", "arrival_time", "source", "destination"),
+)
+
+
+def load_connections(depart_after, arrive_by, seats):
+    """All flights of the window with ``seats`` free, in one query."""
+    return [
+        Connection(*row)
+        for row in Spaceflight.objects.filter(
+            departure_time__gte=depart_after, arrival_time__lte=arrive_by
+        )
+        .alias(
+            seats_left=F("spaceship__rows") * F("spaceship__seats_in_row")
+            - F("tickets_sold")
+        )
+        .filter(seats_left__gte=seats)
+        .order_by("departure_time", "id")
+        .values_list(
+            "id",
+            "departure_time",
+            "arrival_time",
+            "route__source_id",
+            "route__destination_id",
+        )
+    ]
+
+
+def find_itineraries(connections, origin, target, min_layover, max_layover, limit):
+    """
+    Connection scan over ``connections`` sorted by departure time.
+
+    A flight is reachable when it leaves ``origin`` or leaves a spaceport
+    that a reachable flight arrived at between ``max_layover`` and
+    ``min_layover`` before. Each reachable flight keeps the latest such
+    arrival as its previous leg. Returns up to ``limit`` itineraries (lists
+    of connections) ordered by arrival time.
+    """
+    arrivals = {}
+    previous = {}
+    finished = []
+
+    for index, connection in enumerate(connections):
+        if connection.destination == origin:
+            continue
+
+        if connection.source == origin:
+            previous[index] = None
+        else:
+            landed = arrivals.get(connection.source, ())
+            latest = (
+                bisect.bisect_right(
+                    landed, (connection.departure_time - min_layover, index)
+                )
+                - 1
+            )
+            if (
+                latest < 0
+                or landed[latest][0] < connection.departure_time - max_layover
+            ):
+                continue
+            previous[index] = landed[latest][1]
+
+        if connection.destination == target:
+            finished.append(index)
+        else:
+            bisect.insort(
+                arrivals.setdefault(connection.destination, []),
+                (connection.arrival_time, index),
+            )
+
+    finished.sort(key=lambda index: (connections[index].arrival_time, index))
+    itineraries = []
+    for index in finished[:limit]:
+        legs = []
+        while index is not None:
+            legs.append(connections[index])
+            index = previous[index]
+        itineraries.append(legs[::-1])
+    return itineraries
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from spaceport.analysis import N_PLUS_ONE, EndpointAnalyzer
+
+
+class Command(BaseCommand):
+    help = (
+        "Explain the queries of every GET route of the API and flag full "
+        "scans, temporary B-trees and N+1 queries, as a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument(
+            "--n-plus-one",
+            type=int,
+            default=N_PLUS_ONE,
+            help="Runs of one statement per request that count as N+1.",
+        )
+        parser.add_argument("--output", help="Write the report to this file.")
+
+    def handle(self, *args, **options):
+        report = EndpointAnalyzer(
+            page_size=options["page_size"], n_plus_one=options["n_plus_one"]
+        ).report()
+        text = json.dumps(report, indent=2, sort_keys=True, default=str)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(text + "\n")
+            summary = report["summary"]
+            self.stdout.write(
+                f"Analyzed {summary['endpoints']} endpoints, "
+                f"{len(summary['flagged'])} flagged."
+            )
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,30 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from spaceport.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = "Run performance scenarios against the current database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios",
+            nargs="*",
+            help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)}).",
+        )
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        unknown = set(options["scenarios"]) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        for name in options["scenarios"] or SCENARIOS:
+            result = SCENARIOS[name](
+                rng=random.Random(options["seed"]), repeat=options["repeat"]
+            )
+            self.stdout.write(json.dumps({"scenario": name, **result}, default=str))
@@ -0,0 +1,22 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from spaceport.distances import DistanceMatrix, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the all-pairs spaceport distance matrix file."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rebuild()
+        matrix = DistanceMatrix.open(settings.SPACEPORT_DISTANCE_MATRIX)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote distances between {len(matrix.spaceports)} spaceports "
+                f"to {settings.SPACEPORT_DISTANCE_MATRIX} "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
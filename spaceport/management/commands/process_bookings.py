@@ -0,0 +1,60 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from spaceport.bookings import drain, requeue_stale
+
+
+def work(batch_size, poll_interval, once):
+    try:
+        while True:
+            handled = drain(batch_size)
+            if once and not handled:
+                return
+            if not handled:
+                time.sleep(poll_interval)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Book queued order requests, one spaceflight batch per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--poll-interval", type=float, default=0.5)
+        parser.add_argument(
+            "--requeue-after",
+            type=int,
+            default=300,
+            help="Seconds after which unfinished claimed bookings are requeued.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling for more.",
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale(options["requeue_after"])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale bookings.")
+
+        worker_args = (options["batch_size"], options["poll_interval"], options["once"])
+        if options["workers"] == 1:
+            work(*worker_args)
+            return
+
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=work, args=worker_args)
+            for _ in range(options["workers"])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from spaceport.flightcache import forget_spaceflights
+from spaceport.models import Spaceflight, Ticket
+from spaceport.sharding import ticket_databases
+
+
+class Command(BaseCommand):
+    help = "Recount Spaceflight.tickets_sold from the ticket table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report drifted counters and fail if there are any.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            sold = {}
+            for using in ticket_databases():
+                sold.update(
+                    Ticket.objects.using(using)
+                    .values_list("spaceflight")
+                    .annotate(sold=Count("id"))
+                    .order_by()
+                )
+            drifted = [
+                Spaceflight(pk=pk, tickets_sold=sold.get(pk, 0))
+                for pk, tickets_sold in Spaceflight.objects.values_list(
+                    "pk", "tickets_sold"
+                ).iterator(chunk_size=options["batch_size"])
+                if tickets_sold != sold.get(pk, 0)
+            ]
+
+            for spaceflight in drifted:
+                self.stdout.write(
+                    f"Spaceflight {spaceflight.pk}: "
+                    f"tickets_sold should be {spaceflight.tickets_sold}"
+                )
+
+            if options["verify"]:
+                if drifted:
+                    raise CommandError(f"{len(drifted)} counters are out of date.")
+            else:
+                Spaceflight.objects.bulk_update(
+                    drifted, ["tickets_sold"], batch_size=options["batch_size"]
+                )
+                forget_spaceflights(*(spaceflight.pk for spaceflight in drifted))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {Spaceflight.objects.count()} spaceflights, "
+                f"{len(drifted)} out of date"
+                + ("." if options["verify"] else ", fixed.")
+            )
+        )
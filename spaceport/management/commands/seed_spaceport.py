@@ -0,0 +1,98 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from spaceport.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a reproducible synthetic dataset: planets, "
+        "spaceports, routes, spaceships with crews, users, spaceflights, "
+        "orders and tickets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--planets", type=int, default=12)
+        parser.add_argument("--spaceports", type=int, default=200)
+        parser.add_argument("--routes", type=int, default=2000)
+        parser.add_argument("--spaceships", type=int, default=100)
+        parser.add_argument("--crews", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--spaceflights", type=int, default=100_000)
+        parser.add_argument(
+            "--tickets",
+            type=int,
+            default=1_000_000,
+            help="Tickets to book, fewer if the spaceflights run out of seats.",
+        )
+        parser.add_argument(
+            "--start",
+            type=datetime.fromisoformat,
+            default=datetime(2030, 1, 1),
+            help="First departure date, UTC unless it has an offset "
+            "(default 2030-01-01).",
+        )
+        parser.add_argument(
+            "--days", type=int, default=365, help="Days spaceflights depart over."
+        )
+        parser.add_argument("--password", default="spaceport")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        for name in (
+            "planets",
+            "spaceports",
+            "routes",
+            "spaceships",
+            "users",
+            "spaceflights",
+            "days",
+            "batch_size",
+        ):
+            if options[name] < 1:
+                flag = name.replace("_", "-")
+                raise CommandError(f"--{flag} must be at least 1.")
+        for name in ("crews", "tickets"):
+            if options[name] < 0:
+                raise CommandError(f"--{name} must not be negative.")
+
+        start = options["start"]
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start, dt_timezone.utc)
+        else:
+            start = start.astimezone(dt_timezone.utc)
+
+        started = time.perf_counter()
+        seeder = Seeder(
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            log=self.stdout.write,
+        )
+        try:
+            counts = seeder.seed(
+                planets=options["planets"],
+                spaceports=options["spaceports"],
+                routes=options["routes"],
+                spaceships=options["spaceships"],
+                crews=options["crews"],
+                users=options["users"],
+                spaceflights=options["spaceflights"],
+                tickets=options["tickets"],
+                start=start,
+                days=options["days"],
+                password=options["password"],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                ", ".join(f"{count} {label}" for label, count in counts.items())
+                + f" created in {elapsed:.1f}s."
+            )
+        )
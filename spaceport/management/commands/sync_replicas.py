@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from spaceport.replicas import sync_replica
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the read replicas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every",
+            type=float,
+            help="Keep copying every this many seconds instead of once.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.SPACEPORT_REPLICAS:
+            raise CommandError("No replicas configured, set SPACEPORT_REPLICA_DBS.")
+        for alias in ("default", *settings.SPACEPORT_REPLICAS):
+            if connections[alias].vendor != "sqlite":
+                raise CommandError(f"Database {alias} is not SQLite.")
+
+        while True:
+            for alias in settings.SPACEPORT_REPLICAS:
+                started = time.perf_counter()
+                sync_replica(alias)
+                self.stdout.write(
+                    f"Synced {alias} in {time.perf_counter() - started:.2f}s."
+                )
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_tickets_sold(apps, schema_editor):
+    Spaceflight = apps.get_model("spaceport", "Spaceflight")
+    Ticket = apps.get_model("spaceport", "Ticket")
+
+    counts = Ticket.objects.values("spaceflight").annotate(sold=Count("id"))
+    for row in counts.iterator():
+        Spaceflight.objects.filter(pk=row["spaceflight"]).update(
+            tickets_sold=row["sold"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spaceport", "0005_alter_ticket_spaceflight_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="spaceflight",
+            name="tickets_sold",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name="spaceflight",
+            name="route",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="routes",
+                to="spaceport.route",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="spaceflight",
+            name="spaceship",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="spaceships",
+                to="spaceport.spaceship",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ticket",
+            name="spaceflight",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tickets",
+                to="spaceport.spaceflight",
+            ),
+        ),
+        migrations.RunPython(count_tickets_sold, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spaceport", "0006_spaceflight_tickets_sold"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="ticket",
+            unique_together={("spaceflight", "row", "seat")},
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:52
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spaceport", "0007_ticket_unique_row_seat"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SeatHold",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("token", models.UUIDField(db_index=True, default=uuid.uuid4)),
+                ("row", models.IntegerField()),
+                ("seat", models.IntegerField()),
+                ("expires_at", models.DateTimeField()),
+                (
+                    "spaceflight",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="seat_holds",
+                        to="spaceport.spaceflight",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="seat_holds",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["spaceflight", "expires_at"],
+                        name="spaceport_s_spacefl_1d07b1_idx",
+                    )
+                ],
+                "unique_together": {("spaceflight", "row", "seat")},
+            },
+        ),
+    ]
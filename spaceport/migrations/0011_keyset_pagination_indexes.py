@@ -0,0 +1,28 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spaceport", "0010_bookingrequest"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["user", "-created_at", "id"],
+                name="spaceport_o_user_id_4ff3b1_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="spaceflight",
+            index=models.Index(
+                fields=["departure_time", "id"], name="spaceport_s_departu_d41924_idx"
+            ),
+        ),
+    ]
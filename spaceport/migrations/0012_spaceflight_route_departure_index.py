@@ -0,0 +1,20 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spaceport", "0011_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="spaceflight",
+            index=models.Index(
+                fields=["route", "departure_time"],
+                name="spaceport_s_route_i_2fb099_idx",
+            ),
+        ),
+    ]
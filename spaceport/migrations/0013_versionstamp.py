@@ -0,0 +1,24 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spaceport", "0012_spaceflight_route_departure_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VersionStamp",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("token", models.CharField(max_length=32)),
+                ("updated_at", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("spaceport", "0014_cross_database_foreign_keys"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="route",
+            name="distance",
+            field=models.PositiveIntegerField(),
+        ),
+    ]
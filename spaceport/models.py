@@ -1,11 +1,23 @@
 import os
 import uuid
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, IntegerField, Value, When
 from django.template.defaultfilters import slugify
 
 
+def depends_on(*lookups):
+    """Records the fields a property reads, for ``spaceport.optimizer``."""
+
+    def decorator(function):
+        function.depends_on = lookups
+        return function
+
+    return decorator
+
+
 def spaceship_image_file_path(instance, filename):
     _, extension = os.path.splitext(filename)
     filename = f"{slugify(instance.spaceship_name)}-{uuid.uuid4()}{extension}"
@@ -27,6 +39,7 @@ class Crew(models.Model):
     last_name = models.CharField(max_length=150)
 
     @property
+    @depends_on("first_name", "last_name")
     def full_name(self):
         return self.first_name + " " + self.last_name
 
@@ -50,6 +63,7 @@ class Spaceship(models.Model):
         verbose_name_plural = "spaceships"
 
     @property
+    @depends_on("rows", "seats_in_row")
     def num_seats(self):
         return self.seats_in_row * self.rows
 
@@ -77,7 +91,8 @@ class Spaceport(models.Model):
 
 
 class Route(models.Model):
-    distance = models.IntegerField()
+    # Shortest path searches rely on distances never being negative.
+    distance = models.PositiveIntegerField()
     source = models.ForeignKey(
         Spaceport,
         on_delete=models.CASCADE,
@@ -97,6 +112,7 @@ class Route(models.Model):
         ]
 
     @property
+    @depends_on("source__spaceport_name", "destination__spaceport_name")
     def full_route(self):
         return self.source.spaceport_name + " - " + self.destination.spaceport_name
 
@@ -117,6 +133,31 @@ class Spaceflight(models.Model):
         on_delete=models.CASCADE,
         related_name="spaceships",
     )
+    tickets_sold = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["departure_time", "id"]),
+            models.Index(fields=["route", "departure_time"]),
+        ]
+
+    @property
+    @depends_on("spaceship__num_seats", "tickets_sold")
+    def tickets_available(self):
+        return self.spaceship.num_seats - self.tickets_sold
+
+    @classmethod
+    def add_tickets_sold(cls, counts):
+        """Shifts ``tickets_sold`` by ``{spaceflight_id: delta}`` in one UPDATE."""
+        counts = {pk: delta for pk, delta in counts.items() if delta}
+        if counts:
+            cls.objects.filter(pk__in=counts).update(
+                tickets_sold=F("tickets_sold")
+                + Case(
+                    *(When(pk=pk, then=Value(delta)) for pk, delta in counts.items()),
+                    output_field=IntegerField(),
+                )
+            )
 
     def __str__(self):
         return f"{self.route}: {self.departure_time}"
@@ -124,10 +165,14 @@ class Spaceflight(models.Model):
 
 class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Users stay on default when orders are sharded, see spaceport.sharding.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False
+    )
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["user", "-created_at", "id"])]
 
     def __str__(self):
         return str(self.created_at)
@@ -136,20 +181,28 @@ class Order(models.Model):
 class Ticket(models.Model):
     row = models.IntegerField()
     seat = models.IntegerField()
+    # Spaceflights stay on default when tickets are sharded.
     spaceflight = models.ForeignKey(
         "Spaceflight",
         on_delete=models.CASCADE,
         related_name="tickets",
+        db_constraint=False,
     )
     order = models.ForeignKey("Order", on_delete=models.CASCADE, related_name="tickets")
 
     class Meta:
-        unique_together = ("spaceflight", "seat")
+        unique_together = ("spaceflight", "row", "seat")
         ordering = ("seat",)
 
     def __str__(self):
         return f"{self.spaceflight.spaceship.spaceship_name} (row: {self.row}, seat: {self.seat})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_spaceflight_id = instance.__dict__.get("spaceflight_id")
+        return instance
+
     @staticmethod
     def validate_seat(seat: int, num_seats: int, error_to_raise):
         if not (1 <= seat <= num_seats):
@@ -157,7 +210,19 @@ class Ticket(models.Model):
                 {"seat": f"seat must be in range [1, {num_seats}], not {seat}"}
             )
 
+    @staticmethod
+    def validate_row(row: int, rows: int, error_to_raise):
+        if not (1 <= row <= rows):
+            raise error_to_raise(
+                {"row": f"row must be in range [1, {rows}], not {row}"}
+            )
+
     def clean(self):
+        Ticket.validate_row(
+            self.row,
+            self.spaceflight.spaceship.rows,
+            ValidationError,
+        )
         Ticket.validate_seat(
             self.seat,
             self.spaceflight.spaceship.seats_in_row,
@@ -169,6 +234,103 @@ class Ticket(models.Model):
     ):
 
         self.full_clean()
-        return super(Ticket, self).save(
-            force_insert, force_update, using, update_fields
-        )
+        with transaction.atomic(using=using):
+            return super(Ticket, self).save(
+                force_insert, force_update, using, update_fields
+            )
+
+
+class SeatHold(models.Model):
+    token = models.UUIDField(default=uuid.uuid4, db_index=True)
+    row = models.IntegerField()
+    seat = models.IntegerField()
+    spaceflight = models.ForeignKey(
+        Spaceflight,
+        on_delete=models.CASCADE,
+        related_name="seat_holds",
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="seat_holds",
+    )
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("spaceflight", "row", "seat")
+        indexes = [models.Index(fields=["spaceflight", "expires_at"])]
+
+    def __str__(self):
+        return f"{self.spaceflight} (row: {self.row}, seat: {self.seat})"
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="idempotency_keys",
+    )
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "key")
+        indexes = [models.Index(fields=["user", "expires_at"])]
+
+    def __str__(self):
+        return f"{self.user} {self.key}"
+
+
+class BookingRequest(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        PROCESSING = "processing"
+        DONE = "done"
+        FAILED = "failed"
+
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="booking_requests",
+    )
+    spaceflight = models.ForeignKey(
+        Spaceflight,
+        on_delete=models.CASCADE,
+        related_name="booking_requests",
+    )
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    order = models.OneToOneField(
+        Order,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="booking_request",
+    )
+    errors = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    claim = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"]),
+            models.Index(fields=["status", "spaceflight", "id"]),
+            models.Index(fields=["claim"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.status} ({self.created_at})"
+
+
+class VersionStamp(models.Model):
+    key = models.CharField(max_length=100, primary_key=True)
+    token = models.CharField(max_length=32)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key} {self.token}"
@@ -0,0 +1,196 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+from spaceport.sharding import is_sharded
+
+
+class QueryPlan:
+    """
+    Columns, joins and prefetches one model needs to be serialized.
+
+    ``fields`` are loaded with ``only()``, unless ``complete`` says the whole
+    row is needed (e.g. an attribute with no known dependencies). ``joins``
+    map forward relations to ``select_related`` plans, one hop deep, and
+    ``prefetches`` map to-many relations to plans of their own querysets.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = {model._meta.pk.name}
+        self.complete = False
+        self.joins = {}
+        self.prefetches = {}
+
+    @classmethod
+    def for_serializer(cls, serializer, model):
+        plan = cls(model)
+        plan.add_serializer(serializer)
+        return plan
+
+    def add_serializer(self, serializer):
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if field.source == "*":
+                if isinstance(field, serializers.BaseSerializer):
+                    self.add_serializer(field)
+                else:
+                    self.complete = True
+                continue
+
+            names = field.source_attrs
+            if isinstance(field, serializers.ListSerializer):
+                self.add_nested(names, field.child)
+            elif isinstance(field, serializers.BaseSerializer):
+                self.add_nested(names, field)
+            elif isinstance(field, ManyRelatedField):
+                plan = self.add_path(names, load=False)
+                if plan is not None:
+                    plan.add_related_field(field.child_relation)
+            elif isinstance(field, RelatedField):
+                self.add_related(names, field)
+            elif isinstance(field, serializers.SerializerMethodField):
+                self.complete = True
+            else:
+                self.add_path(names)
+
+    def add_nested(self, names, serializer):
+        plan = self.add_path(names, load=False)
+        if plan is None:
+            self.complete = True
+        else:
+            plan.add_serializer(serializer)
+
+    def add_related(self, names, field):
+        """A to-one related field, which reads only the key if it can."""
+        *path, name = names
+        plan = self.add_path(path, load=False) if path else self
+        if plan is None:
+            return
+        try:
+            model_field = plan.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            model_field = None
+
+        if (
+            model_field is not None
+            and model_field.concrete
+            and field.use_pk_only_optimization()
+        ):
+            plan.fields.add(name)
+        else:
+            target = plan.add_path([name], load=False)
+            if target is not None:
+                target.add_related_field(field)
+
+    def add_related_field(self, field):
+        """What the target of ``field`` needs to render itself."""
+        if isinstance(field, serializers.SlugRelatedField):
+            self.add_path(field.slug_field.split("__"))
+        elif not field.use_pk_only_optimization():
+            self.complete = True
+
+    def add_path(self, names, load=True):
+        """
+        Loads the attribute path ``names`` from this model and returns the
+        plan of the model it ends on, or ``None`` if it ends on a plain value.
+        With ``load`` off, a related object the path ends on is not marked as
+        needed in full; the caller says which of its fields it reads instead.
+        """
+        name, *rest = names
+        try:
+            field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            self.add_property(name)
+            return None
+
+        if not field.is_relation:
+            self.fields.add(name)
+            return None
+
+        if field.one_to_many or field.many_to_many:
+            plan = self.prefetches.setdefault(name, QueryPlan(field.related_model))
+            if field.one_to_many:
+                plan.fields.add(field.field.name)
+        else:
+            if field.concrete:
+                self.fields.add(name)
+            plan = self.joins.setdefault(name, QueryPlan(field.related_model))
+
+        if rest:
+            return plan.add_path(rest, load)
+        if load:
+            plan.complete = True
+        return plan
+
+    def add_property(self, name):
+        attribute = getattr(self.model, name, None)
+        lookups = getattr(getattr(attribute, "fget", None), "depends_on", None)
+        if lookups is None:
+            self.complete = True
+            return
+        for lookup in lookups:
+            self.add_path(lookup.split("__"))
+
+    def collect(self, prefix, select, only, prefetch):
+        if self.complete:
+            only.extend(
+                f"{prefix}{field.name}" for field in self.model._meta.concrete_fields
+            )
+        else:
+            only.extend(f"{prefix}{name}" for name in self.fields)
+
+        for name, plan in self.joins.items():
+            if prefix or is_sharded(self.model) != is_sharded(plan.model):
+                # SQLite may start a chain of inner joins from its far end,
+                # e.g. a spaceflight page from the spaceports, and sort every
+                # row; relations past the first hop are prefetched instead,
+                # as are relations to another database.
+                prefetch.append(
+                    Prefetch(
+                        f"{prefix}{name}",
+                        queryset=plan.apply(plan.model._default_manager.all()),
+                    )
+                )
+                continue
+            select.append(name)
+            plan.collect(f"{name}__", select, only, prefetch)
+        for name, plan in self.prefetches.items():
+            prefetch.append(
+                Prefetch(
+                    f"{prefix}{name}",
+                    queryset=plan.apply(plan.model._default_manager.all()),
+                )
+            )
+
+    def apply(self, queryset):
+        select, only, prefetch = [], [], []
+        self.collect("", select, only, prefetch)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset.only(*only)
+
+
+class QuerysetOptimizerMixin:
+    """
+    Loads what the serializer of a read action needs in a fixed number of
+    queries: joins for to-one sources, prefetches for nested lists and only
+    the columns read, plus the ones the paginator orders by.
+    """
+
+    optimized_actions = ("list", "retrieve")
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in self.optimized_actions:
+            return queryset
+
+        plan = QueryPlan.for_serializer(self.get_serializer(), queryset.model)
+        if self.action == "list":
+            for field in getattr(self.paginator, "ordering", ()):
+                plan.add_path(field.lstrip("-").split("__"))
+        return plan.apply(queryset)
@@ -0,0 +1,192 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over a composite ``ordering`` whose last
+    field is unique. Pages are found with an indexed range condition on the
+    ordering instead of ``OFFSET``, and the total ``COUNT(*)`` is only run
+    when the client asks for it with ``?count=true``.
+    """
+
+    ordering = ("id",)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, instance, reverse):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip("-")
+            # Rows of values() querysets are dicts.
+            value = (
+                instance[name]
+                if isinstance(instance, dict)
+                else getattr(instance, name)
+            )
+            values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        token = json.dumps({"v": values, "r": reverse})
+        return base64.urlsafe_b64encode(token.encode()).decode()
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()))
+            values = [
+                self.model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, cursor["v"], strict=True)
+            ]
+            return values, bool(cursor["r"])
+        except (
+            binascii.Error,
+            ValueError,
+            TypeError,
+            KeyError,
+            DjangoValidationError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+    def seek(self, values, reverse):
+        """``ordering`` tuple strictly after (or before) ``values``."""
+        conditions = []
+        for position, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            condition = Q(
+                **{f"{name}__{'lt' if descending else 'gt'}": values[position]}
+            )
+            for previous, value in zip(self.ordering[:position], values):
+                condition &= Q(**{previous.lstrip("-"): value})
+            conditions.append(condition)
+
+        # The leading range lets the database walk the index from ``values``.
+        first = self.ordering[0].lstrip("-")
+        descending = self.ordering[0].startswith("-") != reverse
+        leading = Q(**{f"{first}__{'lte' if descending else 'gte'}": values[0]})
+        return leading & reduce(or_, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [
+                field[1:] if field.startswith("-") else f"-{field}"
+                for field in ordering
+            ]
+
+        self.count = (
+            queryset.count()
+            if request.query_params.get(self.count_query_param) == "true"
+            else None
+        )
+        page = queryset.order_by(*ordering)
+        if values is not None:
+            page = page.filter(self.seek(values, reverse))
+        page = list(page[: page_size + 1])
+
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if page:
+            if has_more or reverse:
+                self.next_cursor = self.encode_cursor(page[-1], False)
+            if values is not None and (has_more or not reverse):
+                self.previous_cursor = self.encode_cursor(page[0], True)
+        return page
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        response = {
+            "next": self.get_link(self.next_cursor),
+            "previous": self.get_link(self.previous_cursor),
+            "results": data,
+        }
+        if self.count is not None:
+            response = {"count": self.count, **response}
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Include the total count of results (slow).",
+                "schema": {"type": "boolean"},
+            },
+        ]
+
+
+class SpaceflightPagination(KeysetPagination):
+    ordering = ("departure_time", "id")
+
+
+class RoutePagination(KeysetPagination):
+    ordering = ("id",)
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ("-created_at", "id")
+    page_size = 5
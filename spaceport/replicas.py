@@ -0,0 +1,113 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+# Reads go to the primary unless a ``ReplicaReadMixin`` view allows replicas
+# for the request it is serving.
+_use_replica = ContextVar("spaceport_use_replica", default=False)
+
+_WRITES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def _pin_key(user):
+    return f"spaceport:primary:{user.pk}"
+
+
+def reading_from_replica():
+    return _use_replica.get() and bool(settings.SPACEPORT_REPLICAS)
+
+
+def replica_lag():
+    """How stale the data read right now may be, in seconds."""
+    return settings.SPACEPORT_REPLICA_LAG if reading_from_replica() else 0
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a random alias of ``SPACEPORT_REPLICAS`` where allowed and
+    everything else to ``default``.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return random.choice(settings.SPACEPORT_REPLICAS)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are copies of the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.SPACEPORT_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Serves safe requests from the read replicas, after authentication and
+    permission checks ran against the primary. Users pinned to the primary by
+    ``PrimaryPinMiddleware`` keep reading from it.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _use_replica.set(False)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            settings.SPACEPORT_REPLICAS
+            and request.method in SAFE_METHODS
+            and not (
+                request.user.is_authenticated and cache.get(_pin_key(request.user))
+            )
+        ):
+            _use_replica.set(True)
+
+
+def _read_after_write_from_primary(execute, sql, params, many, context):
+    if sql.lstrip()[:7].upper().startswith(_WRITES):
+        _use_replica.set(False)
+    return execute(sql, params, many, context)
+
+
+class PrimaryPinMiddleware:
+    """
+    Keeps a user who sent a write, through any view, on the primary for
+    ``SPACEPORT_REPLICA_LAG`` seconds, until the replicas have caught up.
+    A request that writes reads the rest of what it needs from the primary.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SPACEPORT_REPLICAS:
+            return self.get_response(request)
+
+        with connections["default"].execute_wrapper(_read_after_write_from_primary):
+            response = self.get_response(request)
+        # REST framework views hand the user they authenticated back to
+        # the request.
+        if request.method not in SAFE_METHODS and request.user.is_authenticated:
+            cache.set(_pin_key(request.user), True, settings.SPACEPORT_REPLICA_LAG)
+        return response
+
+
+def sync_replica(alias):
+    """Copies the primary into the SQLite replica ``alias`` with the backup API."""
+    primary, replica = connections["default"], connections[alias]
+    primary.ensure_connection()
+    replica.ensure_connection()
+    primary.connection.backup(replica.connection)
@@ -0,0 +1,229 @@
+import heapq
+import threading
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from spaceport.models import Route
+
+VERSION_KEY = "spaceport:route-graph:version"
+
+Path = namedtuple("Path", ("distance", "spaceports", "routes"))
+
+
+class RouteGraph:
+    """
+    Directed graph of spaceports weighted by ``Route.distance``.
+
+    Adjacency lists are replaced rather than mutated on updates, so searches
+    running in other threads keep a consistent view.
+    """
+
+    def __init__(self, routes=()):
+        self.adjacency = {}
+        self.edges = {}
+        for route in routes:
+            self.add_route(*route)
+
+    @classmethod
+    def load(cls):
+        return cls(
+            Route.objects.values_list("id", "source_id", "destination_id", "distance")
+        )
+
+    def add_route(self, route_id, source, destination, distance):
+        self.remove_route(route_id)
+        self.edges[route_id] = (source, destination, distance)
+        self.adjacency[source] = [
+            *self.adjacency.get(source, ()),
+            (destination, distance, route_id),
+        ]
+
+    def remove_route(self, route_id):
+        edge = self.edges.pop(route_id, None)
+        if edge is not None:
+            self.adjacency[edge[0]] = [
+                neighbour
+                for neighbour in self.adjacency.get(edge[0], ())
+                if neighbour[2] != route_id
+            ]
+
+    def shortest_path(
+        self, source, target, banned_spaceports=(), banned_routes=(), max_routes=None
+    ):
+        """
+        Dijkstra from ``source`` that stops as soon as ``target`` settles,
+        over paths of at most ``max_routes`` routes if given.
+        """
+        if max_routes is not None:
+            return self._bounded_shortest_path(
+                source, target, banned_spaceports, banned_routes, max_routes
+            )
+
+        distances = {source: 0}
+        previous = {}
+        queue = [(0, source)]
+
+        while queue:
+            distance, spaceport = heapq.heappop(queue)
+            if spaceport == target:
+                break
+            if distance > distances[spaceport]:
+                continue
+            for neighbour, weight, route_id in self.adjacency.get(spaceport, ()):
+                if neighbour in banned_spaceports or route_id in banned_routes:
+                    continue
+                candidate = distance + weight
+                if candidate < distances.get(neighbour, candidate + 1):
+                    distances[neighbour] = candidate
+                    previous[neighbour] = (spaceport, route_id)
+                    heapq.heappush(queue, (candidate, neighbour))
+        else:
+            return None
+
+        spaceports, routes = [target], []
+        while spaceports[-1] != source:
+            spaceport, route_id = previous[spaceports[-1]]
+            spaceports.append(spaceport)
+            routes.append(route_id)
+        return Path(distances[target], spaceports[::-1], routes[::-1])
+
+    def _bounded_shortest_path(
+        self, source, target, banned_spaceports, banned_routes, max_routes
+    ):
+        # A spaceport is worth reaching again over a longer distance only in
+        # fewer routes, so labels are kept per (spaceport, routes taken).
+        labels = {source: {0: 0}}
+        previous = {}
+        queue = [(0, 0, source)]
+
+        while queue:
+            distance, taken, spaceport = heapq.heappop(queue)
+            if spaceport == target:
+                break
+            if distance > labels[spaceport][taken] or taken == max_routes:
+                continue
+            for neighbour, weight, route_id in self.adjacency.get(spaceport, ()):
+                if neighbour in banned_spaceports or route_id in banned_routes:
+                    continue
+                candidate = distance + weight
+                known = labels.setdefault(neighbour, {})
+                if any(
+                    other <= candidate
+                    for routes, other in known.items()
+                    if routes <= taken + 1
+                ):
+                    continue
+                known[taken + 1] = candidate
+                previous[neighbour, taken + 1] = (spaceport, route_id)
+                heapq.heappush(queue, (candidate, taken + 1, neighbour))
+        else:
+            return None
+
+        spaceports, routes = [target], []
+        for step in range(taken, 0, -1):
+            spaceport, route_id = previous[spaceports[-1], step]
+            spaceports.append(spaceport)
+            routes.append(route_id)
+        return Path(distance, spaceports[::-1], routes[::-1])
+
+    def k_shortest_paths(self, source, target, k, max_routes=None):
+        """
+        Yen's algorithm for the ``k`` shortest loopless paths, of at most
+        ``max_routes`` routes if given.
+        """
+        first = self.shortest_path(source, target, max_routes=max_routes)
+        if first is None:
+            return []
+
+        paths, candidates, seen = [first], [], {tuple(first.routes)}
+        while len(paths) < k:
+            last = paths[-1]
+            for index, spur in enumerate(last.spaceports[:-1]):
+                root_spaceports = last.spaceports[: index + 1]
+                root_routes = last.routes[:index]
+                banned_routes = {
+                    path.routes[index]
+                    for path in paths
+                    if path.routes[:index] == root_routes and len(path.routes) > index
+                }
+                spur_path = self.shortest_path(
+                    spur,
+                    target,
+                    set(root_spaceports[:-1]),
+                    banned_routes,
+                    None if max_routes is None else max_routes - index,
+                )
+                if spur_path is None:
+                    continue
+
+                routes = root_routes + spur_path.routes
+                if tuple(routes) in seen:
+                    continue
+                seen.add(tuple(routes))
+                heapq.heappush(
+                    candidates,
+                    Path(
+                        sum(self.edges[route_id][2] for route_id in root_routes)
+                        + spur_path.distance,
+                        root_spaceports[:-1] + spur_path.spaceports,
+                        routes,
+                    ),
+                )
+            if not candidates:
+                break
+            paths.append(heapq.heappop(candidates))
+        return paths
+
+
+_graph = None
+_graph_version = None
+_lock = threading.Lock()
+
+
+def get_route_graph():
+    """
+    Returns this process's graph, reloading it with one query when another
+    process has bumped the shared version.
+    """
+    global _graph, _graph_version
+
+    version = cache.get(VERSION_KEY)
+    if _graph is None or version != _graph_version:
+        with _lock:
+            if _graph is None or version != _graph_version:
+                _graph, _graph_version = RouteGraph.load(), version
+    return _graph
+
+
+def route_saved(route):
+    _apply_change(
+        lambda graph: graph.add_route(
+            route.id, route.source_id, route.destination_id, route.distance
+        )
+    )
+
+
+def route_deleted(route_id):
+    _apply_change(lambda graph: graph.remove_route(route_id))
+
+
+def _apply_change(change):
+    """
+    Patches this process's graph in place when it was current, otherwise
+    drops it to be reloaded; either way bumps the shared version.
+    """
+    global _graph, _graph_version
+
+    with _lock:
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            version = 1
+            cache.set(VERSION_KEY, version, None)
+
+        if _graph is not None and (_graph_version or 0) == version - 1:
+            change(_graph)
+            _graph_version = version
+        else:
+            _graph = None
@@ -0,0 +1,167 @@
+import base64
+
+from django.core.cache import cache
+
+from spaceport.models import Ticket
+from spaceport.sharding import shard_for_spaceflight
+
+CACHE_KEY = "spaceport:seatmap:{}"
+CACHE_TIMEOUT = 60 * 60
+
+
+class SeatMap:
+    """
+    Occupied seats of a spaceflight packed one bit per seat.
+
+    Bit ``i`` (least significant bit first) stands for row
+    ``i // seats_in_row + 1``, seat ``i % seats_in_row + 1``.
+    """
+
+    def __init__(self, rows, seats_in_row, bits=None):
+        self.rows = rows
+        self.seats_in_row = seats_in_row
+        self.bits = bytearray(bits or (rows * seats_in_row + 7) // 8)
+
+    def _index(self, row, seat):
+        if 1 <= row <= self.rows and 1 <= seat <= self.seats_in_row:
+            return (row - 1) * self.seats_in_row + seat - 1
+        return None
+
+    def add(self, row, seat):
+        index = self._index(row, seat)
+        if index is not None:
+            self.bits[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, row_seat):
+        index = self._index(*row_seat)
+        return index is not None and bool(self.bits[index >> 3] & 1 << (index & 7))
+
+    @property
+    def taken(self):
+        return int.from_bytes(self.bits, "little").bit_count()
+
+    def row_mask(self, row):
+        """Occupied seats of ``row`` as an int, bit 0 being seat 1."""
+        start = (row - 1) * self.seats_in_row
+        end = (start + self.seats_in_row + 7) >> 3
+        chunk = self.bits[start >> 3 : end + 1]
+        return (int.from_bytes(chunk, "little") >> (start & 7)) & (
+            (1 << self.seats_in_row) - 1
+        )
+
+    def ranges(self):
+        """Runs of occupied seats as ``[row, first_seat, last_seat]``."""
+        occupied = int.from_bytes(self.bits, "little")
+        runs = []
+        index, total = 0, self.rows * self.seats_in_row
+
+        while index < total:
+            remaining = occupied >> index
+            if not remaining:
+                break
+            index += (remaining & -remaining).bit_length() - 1
+            row, first = divmod(index, self.seats_in_row)
+            end = min(total, (row + 1) * self.seats_in_row)
+            run = ~(occupied >> index) & ((1 << (end - index)) - 1)
+            length = (run & -run).bit_length() - 1 if run else end - index
+            runs.append([row + 1, first + 1, first + length])
+            index += length
+        return runs
+
+    def best_block(self, party, excluded=()):
+        """
+        Finds ``party`` adjacent free seats in one row, preferring rows and
+        seats closest to the middle of the cabin. Runs in O(seats) over the
+        bitmap; ``excluded`` holds extra ``(row, seat)`` pairs to skip.
+        Returns ``(row, first_seat)`` or ``None``.
+        """
+        if not 1 <= party <= self.seats_in_row:
+            return None
+
+        excluded_masks = {}
+        for row, seat in excluded:
+            if self._index(row, seat) is not None:
+                excluded_masks[row] = excluded_masks.get(row, 0) | 1 << (seat - 1)
+
+        full = (1 << self.seats_in_row) - 1
+        best, best_score = None, None
+        for row in range(1, self.rows + 1):
+            free = ~(self.row_mask(row) | excluded_masks.get(row, 0)) & full
+            while free:
+                start = (free & -free).bit_length() - 1
+                run = ~(free >> start)
+                length = (run & -run).bit_length() - 1
+                free &= ~(((1 << length) - 1) << start)
+                if length < party:
+                    continue
+
+                first = min(
+                    max((self.seats_in_row - party) // 2, start), start + length - party
+                )
+                score = (
+                    abs(2 * row - self.rows - 1),
+                    abs(2 * first + party - self.seats_in_row),
+                )
+                if best_score is None or score < best_score:
+                    best, best_score = (row, first + 1), score
+        return best
+
+    def to_base64(self):
+        return base64.b64encode(self.bits).decode()
+
+    @classmethod
+    def build(cls, spaceflight):
+        """Builds the map with a single ``values_list`` query."""
+        spaceship = spaceflight.spaceship
+        seat_map = cls(spaceship.rows, spaceship.seats_in_row)
+        tickets = Ticket.objects.using(shard_for_spaceflight(spaceflight.pk))
+        for row, seat in tickets.filter(spaceflight=spaceflight).values_list(
+            "row", "seat"
+        ):
+            seat_map.add(row, seat)
+        return seat_map
+
+
+def get_seat_map(spaceflight):
+    """
+    Returns the cached seat map of ``spaceflight``, rebuilding it when the
+    cached copy was taken at a different ``tickets_sold`` or layout.
+    """
+    spaceship = spaceflight.spaceship
+    layout = (spaceflight.tickets_sold, spaceship.rows, spaceship.seats_in_row)
+    cached = cache.get(CACHE_KEY.format(spaceflight.pk))
+
+    if cached and cached[:3] == layout:
+        return SeatMap(spaceship.rows, spaceship.seats_in_row, cached[3])
+
+    seat_map = SeatMap.build(spaceflight)
+    cache.set(
+        CACHE_KEY.format(spaceflight.pk), (*layout, bytes(seat_map.bits)), CACHE_TIMEOUT
+    )
+    return seat_map
+
+
+def add_to_seat_maps(tickets):
+    """Marks freshly booked tickets on the cached maps of their spaceflights."""
+    by_spaceflight = {}
+    for ticket in tickets:
+        by_spaceflight.setdefault(ticket.spaceflight_id, []).append(ticket)
+
+    for spaceflight_id, booked in by_spaceflight.items():
+        key = CACHE_KEY.format(spaceflight_id)
+        cached = cache.get(key)
+        if not cached:
+            continue
+        tickets_sold, rows, seats_in_row, bits = cached
+        seat_map = SeatMap(rows, seats_in_row, bits)
+        for ticket in booked:
+            seat_map.add(ticket.row, ticket.seat)
+        cache.set(
+            key,
+            (tickets_sold + len(booked), rows, seats_in_row, bytes(seat_map.bits)),
+            CACHE_TIMEOUT,
+        )
+
+
+def forget_seat_maps(*spaceflight_ids):
+    cache.delete_many([CACHE_KEY.format(pk) for pk in spaceflight_ids])
@@ -0,0 +1,553 @@
+"""
+Synthetic data for ``manage.py seed_spaceport``.
+
+Everything is drawn from one seeded generator, so the same options give the
+same rows on an empty database. Popularity is skewed the way traffic is:
+a few hub spaceports see most routes, busy routes get most spaceflights and
+fill them, and frequent flyers place most orders.
+"""
+
+import string
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.db.models import Max
+
+from spaceport import distances
+from spaceport.flightcache import forget_all_spaceflights
+from spaceport.models import (
+    Crew,
+    Order,
+    Planet,
+    Route,
+    Spaceflight,
+    Spaceport,
+    Spaceship,
+    SpaceshipType,
+    Ticket,
+)
+from spaceport.sharding import first_id, shard_for_spaceflight, ticket_databases
+from spaceport.versioning import VERSIONED_MODELS, bump_versions
+
+PLANETS = (
+    "Mercury",
+    "Venus",
+    "Earth",
+    "Mars",
+    "Ceres",
+    "Jupiter",
+    "Europa",
+    "Ganymede",
+    "Saturn",
+    "Titan",
+    "Uranus",
+    "Neptune",
+)
+SPACESHIP_TYPES = ("Shuttle", "Clipper", "Liner", "Cruiser", "Freighter")
+FIRST_NAMES = (
+    "Ada",
+    "Boris",
+    "Chen",
+    "Dana",
+    "Elena",
+    "Farid",
+    "Grace",
+    "Hiro",
+    "Ines",
+    "Jonas",
+    "Kira",
+    "Leon",
+    "Maya",
+    "Nikolai",
+    "Olga",
+    "Pavel",
+    "Rosa",
+    "Sami",
+    "Tereza",
+    "Yuri",
+)
+LAST_NAMES = (
+    "Armstrong",
+    "Bondar",
+    "Collins",
+    "Dvorak",
+    "Eriksen",
+    "Gagarin",
+    "Hadfield",
+    "Ivanova",
+    "Jemison",
+    "Kowalski",
+    "Leonov",
+    "Mori",
+    "Nakamura",
+    "Okafor",
+    "Peake",
+    "Ride",
+    "Shepard",
+    "Tereshkova",
+    "Walker",
+    "Yang",
+)
+
+# Orders book 1 to 4 adjacent seats, mostly one.
+PARTY_SIZES = np.array([1, 2, 3, 4])
+PARTY_WEIGHTS = np.array([0.55, 0.25, 0.12, 0.08])
+# Orders are placed this many days before departure on average.
+BOOKING_LEAD_DAYS = 30
+# Spaceflights drawn, placed and booked together, whatever the batch size.
+SPACEFLIGHT_CHUNK = 10_000
+SALT_CHARS = string.ascii_letters + string.digits
+
+
+def zipf_weights(count, exponent):
+    """Normalized weights of ``count`` items ranked by popularity."""
+    weights = 1 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def next_id(model, using="default"):
+    top = model.objects.using(using).aggregate(top=Max("pk"))["top"] or 0
+    return max(top, first_id(using)) + 1
+
+
+class Seeder:
+    def __init__(self, seed=42, batch_size=10_000, log=None):
+        self.rng = np.random.default_rng(seed)
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.counts = {}
+        # Bound once, the connection proxy is slow for millions of values.
+        self.adapt_datetime = connections["default"].ops.adapt_datetimefield_value
+
+    def seed(
+        self,
+        planets=12,
+        spaceports=200,
+        routes=2000,
+        spaceships=100,
+        crews=1000,
+        users=10_000,
+        spaceflights=100_000,
+        tickets=1_000_000,
+        start=datetime(2030, 1, 1, tzinfo=timezone.utc),
+        days=365,
+        password="spaceport",
+    ):
+        with transaction.atomic():
+            planet_ids = self.create_planets(planets)
+            ports, positions = self.create_spaceports(spaceports, planet_ids)
+            route_ids, route_weights, route_distances = self.create_routes(
+                routes, ports, positions
+            )
+            ships, capacities = self.create_spaceships(spaceships, crews)
+            user_ids = self.create_users(users, password, start)
+            bump_versions(*VERSIONED_MODELS)
+
+        self.create_bookings(
+            spaceflights,
+            tickets,
+            start,
+            days,
+            route_ids,
+            route_weights,
+            route_distances,
+            ships,
+            capacities,
+            user_ids,
+        )
+        distances.rebuild()
+        forget_all_spaceflights()
+        return self.counts
+
+    def bulk_create(self, model, objects, using="default"):
+        model.objects.using(using).bulk_create(objects, batch_size=self.batch_size)
+        label = model._meta.verbose_name_plural
+        self.counts[label] = self.counts.get(label, 0) + len(objects)
+
+    def create_planets(self, count):
+        first = next_id(Planet)
+        names = [
+            PLANETS[n] if n < len(PLANETS) else f"Kepler-{n}b" for n in range(count)
+        ]
+        self.bulk_create(
+            Planet,
+            [Planet(id=first + n, planet_name=name) for n, name in enumerate(names)],
+        )
+        self.log(f"{count} planets")
+        return np.arange(first, first + count)
+
+    def create_spaceports(self, count, planet_ids):
+        """Returns the ids by popularity and positions to measure routes by."""
+        orbits = self.rng.uniform(1, 50, len(planet_ids))
+        angles = self.rng.uniform(0, 2 * np.pi, len(planet_ids))
+        planets = self.rng.choice(
+            len(planet_ids), count, p=zipf_weights(len(planet_ids), 1)
+        )
+        positions = np.column_stack(
+            [
+                orbits[planets] * np.cos(angles[planets]),
+                orbits[planets] * np.sin(angles[planets]),
+            ]
+        ) + self.rng.normal(0, 0.1, (count, 2))
+
+        first = next_id(Spaceport)
+        names = {}
+        spaceports = []
+        for n, planet in enumerate(planets):
+            name = PLANETS[planet] if planet < len(PLANETS) else f"Kepler-{planet}b"
+            names[name] = names.get(name, 0) + 1
+            spaceports.append(
+                Spaceport(
+                    id=first + n,
+                    spaceport_name=f"{name} Port {names[name]}",
+                    closest_planet_id=planet_ids[planet],
+                )
+            )
+        self.bulk_create(Spaceport, spaceports)
+        self.log(f"{count} spaceports")
+        return np.arange(first, first + count), positions
+
+    def create_routes(self, count, ports, positions):
+        """Returns the ids, popularity and distances of the routes."""
+        most = len(ports) * (len(ports) - 1)
+        if count > most:
+            raise ValueError(f"{len(ports)} spaceports allow at most {most} routes.")
+        weights = zipf_weights(len(ports), 1)
+        pairs = {}
+        while len(pairs) < count:
+            sources = self.rng.choice(len(ports), count, p=weights)
+            destinations = self.rng.choice(len(ports), count, p=weights)
+            for source, destination in zip(sources.tolist(), destinations.tolist()):
+                if source != destination and len(pairs) < count:
+                    pairs.setdefault((source, destination), None)
+
+        pairs = np.array(list(pairs))
+        lengths = np.linalg.norm(
+            positions[pairs[:, 0]] - positions[pairs[:, 1]], axis=1
+        )
+        route_distances = (lengths * 1_000_000).astype(int) + 1000
+        first = next_id(Route)
+        self.bulk_create(
+            Route,
+            [
+                Route(
+                    id=first + n,
+                    source_id=ports[source],
+                    destination_id=ports[destination],
+                    distance=distance,
+                )
+                for n, (source, destination, distance) in enumerate(
+                    zip(
+                        pairs[:, 0].tolist(),
+                        pairs[:, 1].tolist(),
+                        route_distances.tolist(),
+                    )
+                )
+            ],
+        )
+        self.log(f"{count} routes")
+        popularity = weights[pairs[:, 0]] * weights[pairs[:, 1]]
+        return (
+            np.arange(first, first + count),
+            popularity / popularity.sum(),
+            route_distances,
+        )
+
+    def create_spaceships(self, count, crews):
+        """Returns the ids and seat counts of the spaceships."""
+        first_type = next_id(SpaceshipType)
+        self.bulk_create(
+            SpaceshipType,
+            [
+                SpaceshipType(id=first_type + n, spaceship_type_name=name)
+                for n, name in enumerate(SPACESHIP_TYPES)
+            ],
+        )
+
+        first_crew = next_id(Crew)
+        first_names = self.rng.integers(len(FIRST_NAMES), size=crews)
+        last_names = self.rng.integers(len(LAST_NAMES), size=crews)
+        self.bulk_create(
+            Crew,
+            [
+                Crew(
+                    id=first_crew + n,
+                    first_name=FIRST_NAMES[first_name],
+                    last_name=LAST_NAMES[last_name],
+                )
+                for n, (first_name, last_name) in enumerate(
+                    zip(first_names.tolist(), last_names.tolist())
+                )
+            ],
+        )
+
+        first = next_id(Spaceship)
+        types = self.rng.integers(len(SPACESHIP_TYPES), size=count)
+        rows = self.rng.integers(10, 61, size=count)
+        seats_in_row = self.rng.integers(4, 11, size=count)
+        self.bulk_create(
+            Spaceship,
+            [
+                Spaceship(
+                    id=first + n,
+                    spaceship_name=f"{SPACESHIP_TYPES[kind]} {first + n}",
+                    rows=ship_rows,
+                    seats_in_row=ship_seats,
+                    spaceship_types_id=first_type + kind,
+                )
+                for n, (kind, ship_rows, ship_seats) in enumerate(
+                    zip(types.tolist(), rows.tolist(), seats_in_row.tolist())
+                )
+            ],
+        )
+        if crews:
+            through = Spaceship.crews.through
+            self.bulk_create(
+                through,
+                [
+                    through(spaceship_id=first + n, crew_id=first_crew + crew)
+                    for n in range(count)
+                    for crew in self.rng.choice(
+                        crews, min(crews, self.rng.integers(2, 7)), replace=False
+                    ).tolist()
+                ],
+            )
+        self.log(f"{count} spaceships with {crews} crew members")
+        return (
+            np.arange(first, first + count),
+            np.column_stack([rows, seats_in_row]),
+        )
+
+    def create_users(self, count, password, start):
+        User = get_user_model()
+        first = next_id(User)
+        # One hash for everyone, hashing each password would take minutes;
+        # its salt is drawn too, for the same rows on every run.
+        salt = "".join(self.rng.choice(list(SALT_CHARS), 22).tolist())
+        hashed = make_password(password, salt)
+        # Ahead of all but a sliver of the orders, placed before departures.
+        joined = self.adapt_datetime(start - timedelta(days=10 * BOOKING_LEAD_DAYS))
+        first_names = self.rng.integers(len(FIRST_NAMES), size=count).tolist()
+        last_names = self.rng.integers(len(LAST_NAMES), size=count).tolist()
+        self.insert(
+            User,
+            (
+                "id",
+                "email",
+                "password",
+                "first_name",
+                "last_name",
+                "is_superuser",
+                "is_staff",
+                "is_active",
+                "date_joined",
+            ),
+            [
+                (
+                    first + n,
+                    f"user{first + n}@example.com",
+                    hashed,
+                    FIRST_NAMES[first_names[n]],
+                    LAST_NAMES[last_names[n]],
+                    False,
+                    False,
+                    True,
+                    joined,
+                )
+                for n in range(count)
+            ],
+        )
+        self.log(f"{count} users, password {password!r}")
+        return np.arange(first, first + count)
+
+    def create_bookings(
+        self,
+        count,
+        tickets,
+        start,
+        days,
+        route_ids,
+        route_weights,
+        route_distances,
+        ships,
+        capacities,
+        user_ids,
+    ):
+        """
+        Spaceflights in order of departure, each with ``tickets_sold`` set to
+        the tickets booked on it; ``tickets`` are shared out by the
+        popularity of the routes, as far as the spaceships have seats.
+        """
+        routes = self.rng.choice(len(route_ids), count, p=route_weights)
+        spaceships = self.rng.integers(len(ships), size=count)
+        departures = np.sort(self.rng.uniform(0, days * 86400, count))
+        hours = 1 + 29 * route_distances[routes] / route_distances.max()
+        arrivals = departures + hours * 3600 * self.rng.uniform(0.9, 1.1, count)
+
+        demand = route_weights[routes] * self.rng.lognormal(0, 0.5, count)
+        capacity = capacities[spaceships, 0] * capacities[spaceships, 1]
+        sold = np.minimum(capacity, self.rng.poisson(tickets * demand / demand.sum()))
+        user_cdf = np.cumsum(zipf_weights(len(user_ids), 0.8))
+
+        first = next_id(Spaceflight)
+        next_ids = {
+            using: [next_id(Order, using), next_id(Ticket, using)]
+            for using in ticket_databases()
+        }
+        pending = {using: ([], []) for using in ticket_databases()}
+        started = time.perf_counter()
+
+        for offset in range(0, count, SPACEFLIGHT_CHUNK):
+            chunk = slice(offset, min(offset + SPACEFLIGHT_CHUNK, count))
+            ids = range(first + chunk.start, first + chunk.stop)
+            departure_times = [
+                start + timedelta(seconds=seconds)
+                for seconds in departures[chunk].tolist()
+            ]
+            self.insert(
+                Spaceflight,
+                (
+                    "id",
+                    "route_id",
+                    "spaceship_id",
+                    "departure_time",
+                    "arrival_time",
+                    "tickets_sold",
+                ),
+                list(
+                    zip(
+                        ids,
+                        route_ids[routes[chunk]].tolist(),
+                        ships[spaceships[chunk]].tolist(),
+                        map(self.adapt_datetime, departure_times),
+                        (
+                            self.adapt_datetime(start + timedelta(seconds=seconds))
+                            for seconds in arrivals[chunk].tolist()
+                        ),
+                        sold[chunk].tolist(),
+                    )
+                ),
+            )
+
+            # At most one order per ticket; what the orders leave is unused.
+            booked = int(sold[chunk].sum())
+            orders = zip(
+                self.rng.choice(PARTY_SIZES, booked, p=PARTY_WEIGHTS).tolist(),
+                user_ids[
+                    np.minimum(
+                        np.searchsorted(user_cdf, self.rng.random(booked)),
+                        len(user_ids) - 1,
+                    )
+                ].tolist(),
+                self.rng.exponential(BOOKING_LEAD_DAYS * 86400, booked).tolist(),
+            )
+            first_rows = self.rng.random(len(ids)).tolist()
+            layouts = capacities[spaceships[chunk]].tolist()
+
+            for spaceflight_id, departure, seats, first_row, layout in zip(
+                ids, departure_times, sold[chunk].tolist(), first_rows, layouts
+            ):
+                if not seats:
+                    continue
+                rows, seats_in_row = layout
+                using = shard_for_spaceflight(spaceflight_id)
+                self.book(
+                    spaceflight_id,
+                    departure,
+                    seats,
+                    int(first_row * rows),
+                    rows,
+                    seats_in_row,
+                    orders,
+                    next_ids[using],
+                    *pending[using],
+                )
+                if len(pending[using][1]) >= self.batch_size:
+                    self.flush(using, *pending[using])
+            ticket_count = self.counts.get("tickets", 0) + sum(
+                len(tickets) for _, tickets in pending.values()
+            )
+            self.log(
+                f"{chunk.stop} spaceflights, {ticket_count} tickets "
+                f"({time.perf_counter() - started:.0f}s)"
+            )
+        for using, (orders, tickets) in pending.items():
+            self.flush(using, orders, tickets)
+
+    def book(
+        self,
+        spaceflight_id,
+        departure,
+        sold,
+        first_row,
+        rows,
+        seats_in_row,
+        parties,
+        next_ids,
+        orders,
+        tickets,
+    ):
+        """
+        Orders from ``parties`` filling ``sold`` seats row after row, from
+        ``first_row`` on, so the seats of an order are mostly adjacent.
+        """
+        order_id, ticket_id = next_ids
+        position = 0
+        while position < sold:
+            party, user_id, lead = next(parties)
+            orders.append(
+                (
+                    order_id,
+                    user_id,
+                    self.adapt_datetime(departure - timedelta(seconds=lead + 3600)),
+                )
+            )
+            for position in range(position, min(position + party, sold)):
+                row, seat = divmod(position, seats_in_row)
+                tickets.append(
+                    (
+                        ticket_id,
+                        spaceflight_id,
+                        order_id,
+                        (first_row + row) % rows + 1,
+                        seat + 1,
+                    )
+                )
+                ticket_id += 1
+            position += 1
+            order_id += 1
+        next_ids[:] = order_id, ticket_id
+
+    def flush(self, using, orders, tickets):
+        with transaction.atomic(using=using):
+            self.insert(Order, ("id", "user_id", "created_at"), orders, using)
+            self.insert(
+                Ticket,
+                ("id", "spaceflight_id", "order_id", "row", "seat"),
+                tickets,
+                using,
+            )
+        orders.clear()
+        tickets.clear()
+
+    def insert(self, model, columns, rows, using="default"):
+        """
+        ``bulk_create`` for the large tables: rows of database values go to
+        ``executemany``, without model instances and per-value SQL compiling.
+        """
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            quote(model._meta.db_table),
+            ", ".join(quote(model._meta.get_field(name).column) for name in columns),
+            ", ".join(["%s"] * len(columns)),
+        )
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            for batch in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[batch : batch + self.batch_size])
+        label = model._meta.verbose_name_plural
+        self.counts[label] = self.counts.get(label, 0) + len(rows)
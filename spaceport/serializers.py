@@ -1,5 +1,16 @@
-from django.db import transaction
+from collections import Counter
+from datetime import timedelta
+
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    DatabaseError,
+    IntegrityError,
+    connections,
+    transaction,
+)
+from django.utils.dateparse import parse_date
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from spaceport.models import (
     SpaceshipType,
     Crew,
@@ -10,24 +21,82 @@ from spaceport.models import (
     Order,
     Ticket,
     Spaceport,
+    BookingRequest,
 )
+from spaceport.holds import MAX_HOLD_MINUTES, DEFAULT_HOLD_MINUTES, active_holds
+from spaceport.exports import OUTPUTS
+from spaceport.flightcache import forget_spaceflights
+from spaceport.seatmap import add_to_seat_maps
+from spaceport.sharding import group_by_shard, shard_for_tickets
+
+
+class SparseFieldsMixin:
+    """
+    Lets GET requests choose fields with ``?fields=id,route`` and replace the
+    fields in ``expandable_fields`` with nested objects with ``?expand=route``.
+    Only the top-level serializer is affected and ``id`` is always kept.
+    Names the serializer does not know are a validation error.
+    """
+
+    expandable_fields = {}
+
+    def _query_list(self, request, name):
+        value = request.query_params.get(name, "")
+        return {item.strip() for item in value.split(",") if item.strip()}
+
+    @staticmethod
+    def _reject_unknown(parameter, unknown):
+        if unknown:
+            raise serializers.ValidationError(
+                {parameter: f"Unknown fields: {', '.join(sorted(unknown))}."}
+            )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        is_root = self.parent is None or (
+            isinstance(self.parent, serializers.ListSerializer)
+            and self.parent.parent is None
+        )
+        if getattr(request, "method", None) != "GET" or not is_root:
+            return fields
+
+        expanded = self._query_list(request, "expand")
+        self._reject_unknown("expand", expanded - self.expandable_fields.keys())
+        for name in expanded:
+            serializer_class, kwargs = self.expandable_fields[name]
+            fields[name] = serializer_class(read_only=True, **kwargs)
 
+        selected = self._query_list(request, "fields")
+        self._reject_unknown("fields", selected - fields.keys())
+        if selected:
+            fields = {
+                name: field
+                for name, field in fields.items()
+                if name in selected or name == "id"
+            }
+        return fields
 
-class SpaceshipTypeSerializer(serializers.ModelSerializer):
+
+class SpaceshipTypeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = SpaceshipType
         fields = ("id", "spaceship_type_name")
 
 
-class CrewSerializer(serializers.ModelSerializer):
+class CrewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Crew
         fields = ("id", "first_name", "last_name")
 
 
-class SpaceshipSerializer(serializers.ModelSerializer):
+class SpaceshipSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        "spaceship_types": (SpaceshipTypeSerializer, {}),
+        "crews": (CrewSerializer, {"many": True}),
+    }
 
     class Meta:
         model = Spaceship
@@ -69,21 +138,24 @@ class SpaceshipDetailSerializer(SpaceshipSerializer):
     crews = CrewSerializer(many=True, read_only=True)
 
 
-class SpaceshipImageSerializer(serializers.ModelSerializer):
+class SpaceshipImageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Spaceship
         fields = ("id", "image")
 
 
-class PlanetSerializer(serializers.ModelSerializer):
+class PlanetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Planet
         fields = ("id", "planet_name")
 
 
-class SpaceportSerializer(serializers.ModelSerializer):
+class SpaceportSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        "planet": (PlanetSerializer, {"source": "closest_planet"}),
+    }
 
     class Meta:
         model = Spaceport
@@ -101,7 +173,11 @@ class SpaceportListSerializer(SpaceportSerializer):
         fields = ("id", "spaceport_name", "planet")
 
 
-class RouteSerializer(serializers.ModelSerializer):
+class RouteSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        "source": (SpaceportListSerializer, {}),
+        "destination": (SpaceportListSerializer, {}),
+    }
 
     class Meta:
         model = Route
@@ -123,7 +199,11 @@ class RouteListSerializer(RouteSerializer):
         fields = ("id", "distance", "source_name", "destination")
 
 
-class SpaceflightSerializer(serializers.ModelSerializer):
+class SpaceflightSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        "route": (RouteListSerializer, {}),
+        "spaceship": (SpaceshipListSerializer, {}),
+    }
 
     class Meta:
         model = Spaceflight
@@ -158,13 +238,109 @@ class SpaceflightListSerializer(SpaceflightSerializer):
         )
 
 
-class TicketSerializer(serializers.ModelSerializer):
+class SpaceflightRelatedField(serializers.PrimaryKeyRelatedField):
+    """Resolves spaceflights preloaded by ``TicketBulkSerializer``."""
+
+    def to_internal_value(self, data):
+        spaceflights = self.context.get("spaceflights", {})
+        if isinstance(data, (int, str)) and not isinstance(data, bool):
+            try:
+                return spaceflights[int(data)]
+            except (KeyError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+class TicketBulkSerializer(serializers.ListSerializer):
+    """
+    Validates a batch of tickets with one query for the referenced
+    spaceflights (and their spaceships) and one for the seats already taken.
+    """
+
+    unique_message = "The fields spaceflight, row, seat must make a unique set."
+    held_message = "The seat is on hold for another customer."
+
+    @staticmethod
+    def _ints(values):
+        ids = set()
+        for value in values:
+            if isinstance(value, (int, str)) and not isinstance(value, bool):
+                try:
+                    ids.add(int(value))
+                except ValueError:
+                    pass
+        return ids
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            items = [item for item in data if isinstance(item, dict)]
+            spaceflight_ids = self._ints(item.get("spaceflight") for item in items)
+            rows = self._ints(item.get("row") for item in items)
+            seats = self._ints(item.get("seat") for item in items)
+
+            self.context["spaceflights"] = Spaceflight.objects.select_related(
+                "spaceship"
+            ).in_bulk(spaceflight_ids)
+            self._taken_seats = {
+                taken
+                for using, shard_spaceflight_ids in group_by_shard(
+                    spaceflight_ids
+                ).items()
+                for taken in Ticket.objects.using(using)
+                .filter(
+                    spaceflight_id__in=shard_spaceflight_ids,
+                    row__in=rows,
+                    seat__in=seats,
+                )
+                .values_list("spaceflight_id", "row", "seat")
+            }
+            held_seats = active_holds(
+                spaceflight_id__in=spaceflight_ids, row__in=rows, seat__in=seats
+            )
+            if "request" in self.context:
+                held_seats = held_seats.exclude(user=self.context["request"].user)
+            self._held_seats = set(
+                held_seats.values_list("spaceflight_id", "row", "seat")
+            )
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        ticket = super().run_child_validation(data)
+        seat = (ticket["spaceflight"].pk, ticket["row"], ticket["seat"])
+
+        if seat in self._taken_seats:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [self.unique_message]},
+                code="unique",
+            )
+        if seat in self._held_seats:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [self.held_message]},
+                code="held",
+            )
+        self._taken_seats.add(seat)
+        return ticket
+
+
+class TicketSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        "spaceflight": (SpaceflightListSerializer, {}),
+    }
+
+    spaceflight = SpaceflightRelatedField(
+        queryset=Spaceflight.objects.select_related("spaceship")
+    )
 
     def validate(self, attrs):
         data = super(TicketSerializer, self).validate(attrs)
+        Ticket.validate_row(
+            attrs["row"],
+            attrs["spaceflight"].spaceship.rows,
+            serializers.ValidationError,
+        )
         Ticket.validate_seat(
             attrs["seat"],
-            attrs["spaceflight"].spaceship.num_seats,
+            attrs["spaceflight"].spaceship.seats_in_row,
             serializers.ValidationError,
         )
         return data
@@ -172,6 +348,10 @@ class TicketSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ticket
         fields = ("id", "row", "seat", "spaceflight", "order")
+        read_only_fields = ("order",)
+        list_serializer_class = TicketBulkSerializer
+        # Seat uniqueness is checked set-based by TicketBulkSerializer.
+        validators = []
 
 
 class TicketListSerializer(TicketSerializer):
@@ -186,7 +366,7 @@ class SpaceflightDetailSerializer(SpaceflightSerializer):
     spaceship = SpaceshipDetailSerializer(many=False, read_only=True)
 
     taken_seats = serializers.SlugRelatedField(
-        source="ticket_set", many=True, read_only=True, slug_field="seat"
+        source="tickets", many=True, read_only=True, slug_field="seat"
     )
 
     class Meta:
@@ -201,8 +381,11 @@ class SpaceflightDetailSerializer(SpaceflightSerializer):
         )
 
 
-class OrderSerializer(serializers.ModelSerializer):
-    tickets = TicketSerializer(many=True, read_only=False, allow_empty=False)
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    tickets = TicketSerializer(
+        many=True, read_only=False, allow_empty=False, required=False
+    )
+    hold = serializers.UUIDField(write_only=True, required=False)
 
     class Meta:
         model = Order
@@ -210,18 +393,300 @@ class OrderSerializer(serializers.ModelSerializer):
             "id",
             "created_at",
             "tickets",
+            "hold",
         )
 
-    def create(self, validated_data):
+    def validate(self, attrs):
+        data = super(OrderSerializer, self).validate(attrs)
+
+        if ("tickets" in attrs) == ("hold" in attrs):
+            raise serializers.ValidationError(
+                "Provide either tickets or a seat hold to book."
+            )
+        if "hold" in attrs:
+            holds = active_holds(
+                token=attrs["hold"], user=self.context["request"].user
+            ).select_related("spaceflight__spaceship")
+            data["tickets"] = [
+                {"row": hold.row, "seat": hold.seat, "spaceflight": hold.spaceflight}
+                for hold in holds
+            ]
+            if not data["tickets"]:
+                raise serializers.ValidationError(
+                    {"hold": "The seat hold does not exist or has expired."}
+                )
+        return data
 
-        with transaction.atomic():
-            tickets_data = validated_data.pop("tickets")
-            order = Order.objects.create(**validated_data)
+    def create(self, validated_data):
 
-            for ticket_data in tickets_data:
-                Ticket.objects.create(order=order, **ticket_data)
-            return order
+        tickets_data = validated_data.pop("tickets")
+        hold = validated_data.pop("hold", None)
+        using = shard_for_tickets(tickets_data)
+
+        try:
+            with transaction.atomic(using=using):
+                order = Order.objects.using(using).create(**validated_data)
+
+                if hold:
+                    # On a shard, released holds commit just before the order.
+                    with transaction.atomic():
+                        released, _ = active_holds(token=hold, user=order.user).delete()
+                        if released != len(tickets_data):
+                            raise serializers.ValidationError(
+                                {"hold": "The seat hold does not exist or has expired."}
+                            )
+
+                tickets = [
+                    Ticket(order=order, **ticket_data) for ticket_data in tickets_data
+                ]
+                for ticket in tickets:
+                    ticket.clean()
+                Ticket.objects.using(using).bulk_create(tickets)
+                sold = Counter(ticket.spaceflight_id for ticket in tickets)
+                if using == DEFAULT_DB_ALIAS:
+                    Spaceflight.add_tickets_sold(sold)
+        except IntegrityError:
+            # A seat sold after validation, or held seats that were already
+            # sold, which validate() does not look for.
+            raise serializers.ValidationError(
+                {"tickets": [TicketBulkSerializer.unique_message]}, code="unique"
+            )
+
+        if using != DEFAULT_DB_ALIAS:
+            # Counted once the shard has the tickets, in a statement of its
+            # own, so shards only queue on default for that UPDATE.
+            try:
+                Spaceflight.add_tickets_sold(sold)
+            except DatabaseError:
+                self.discard(order, using)
+                raise
+        transaction.on_commit(lambda: add_to_seat_maps(tickets))
+        transaction.on_commit(lambda: forget_spaceflights(*sold))
+        return order
+
+    @staticmethod
+    def discard(order, using):
+        """
+        Removes a committed order whose tickets could not be counted, without
+        the ticket signals that would uncount them.
+        """
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {Ticket._meta.db_table} WHERE order_id = %s", [order.pk]
+            )
+            cursor.execute(
+                f"DELETE FROM {Order._meta.db_table} WHERE id = %s", [order.pk]
+            )
 
 
 class OrderListSerializer(OrderSerializer):
     tickets = TicketListSerializer(many=True, read_only=True)
+
+
+class SeatMapSerializer(serializers.Serializer):
+    ENCODINGS = ("bitmap", "ranges")
+
+    encoding = serializers.ChoiceField(choices=ENCODINGS, default="bitmap")
+
+
+class SeatSerializer(serializers.Serializer):
+    row = serializers.IntegerField(min_value=1)
+    seat = serializers.IntegerField(min_value=1)
+
+
+class SeatHoldSerializer(serializers.Serializer):
+    seats = SeatSerializer(many=True, allow_empty=False)
+    minutes = serializers.IntegerField(
+        min_value=1, max_value=MAX_HOLD_MINUTES, default=DEFAULT_HOLD_MINUTES
+    )
+
+    def validate_seats(self, seats):
+        spaceship = self.context["spaceflight"].spaceship
+        for seat in seats:
+            Ticket.validate_row(
+                seat["row"], spaceship.rows, serializers.ValidationError
+            )
+            Ticket.validate_seat(
+                seat["seat"], spaceship.seats_in_row, serializers.ValidationError
+            )
+        return [(seat["row"], seat["seat"]) for seat in seats]
+
+
+class SeatHoldReleaseSerializer(serializers.Serializer):
+    hold = serializers.UUIDField()
+
+
+class BestSeatsSerializer(serializers.Serializer):
+    party = serializers.IntegerField(min_value=1)
+
+
+class BookingRequestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        "spaceflight": (SpaceflightListSerializer, {}),
+    }
+
+    class Meta:
+        model = BookingRequest
+        fields = (
+            "id",
+            "status",
+            "spaceflight",
+            "order",
+            "errors",
+            "created_at",
+            "updated_at",
+        )
+
+
+class DayEndDateTimeField(serializers.DateTimeField):
+    """An inclusive upper bound; a bare date includes the whole day."""
+
+    def to_internal_value(self, value):
+        moment = super().to_internal_value(value)
+        if isinstance(value, str) and parse_date(value.strip()) is not None:
+            return moment + timedelta(days=1, microseconds=-1)
+        return moment
+
+
+class SpaceflightFilterSerializer(serializers.Serializer):
+    DATE_FORMATS = ("iso-8601", "%Y-%m-%d")
+
+    source = serializers.IntegerField(
+        required=False, help_text="Id of the source spaceport"
+    )
+    destination = serializers.IntegerField(
+        required=False, help_text="Id of the destination spaceport"
+    )
+    source_planet = serializers.IntegerField(
+        required=False, help_text="Id of the planet closest to the source"
+    )
+    destination_planet = serializers.IntegerField(
+        required=False, help_text="Id of the planet closest to the destination"
+    )
+    departure_after = serializers.DateTimeField(
+        required=False, input_formats=DATE_FORMATS
+    )
+    departure_before = DayEndDateTimeField(required=False, input_formats=DATE_FORMATS)
+    arrival_after = serializers.DateTimeField(
+        required=False, input_formats=DATE_FORMATS
+    )
+    arrival_before = DayEndDateTimeField(required=False, input_formats=DATE_FORMATS)
+    min_seats = serializers.IntegerField(
+        required=False, min_value=1, help_text="Minimum number of free seats"
+    )
+    spaceship_type = serializers.IntegerField(
+        required=False, help_text="Id of the spaceship type"
+    )
+
+
+class ExportSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=list(OUTPUTS), default="ndjson")
+    after = serializers.DateTimeField(
+        required=False,
+        input_formats=SpaceflightFilterSerializer.DATE_FORMATS,
+        help_text="Only rows dated at or after this time "
+        "(order creation, or departure for manifests)",
+    )
+    before = serializers.DateTimeField(
+        required=False,
+        input_formats=SpaceflightFilterSerializer.DATE_FORMATS,
+        help_text="Only rows dated before this time",
+    )
+    after_id = serializers.IntegerField(
+        required=False,
+        min_value=0,
+        help_text="Resume after the last id received",
+    )
+    spaceflight = serializers.IntegerField(
+        required=False, help_text="Id of the spaceflight (tickets and manifests)"
+    )
+
+    def validate(self, attrs):
+        data = super(ExportSerializer, self).validate(attrs)
+        export = self.context["export"]
+        if "spaceflight" in attrs and export.spaceflight_field is None:
+            raise serializers.ValidationError(
+                {"spaceflight": f"The {export.name} export has no spaceflight filter."}
+            )
+        return data
+
+
+class RoutePlanSerializer(serializers.Serializer):
+    to = serializers.IntegerField(help_text="Id of the destination spaceport")
+    k = serializers.IntegerField(
+        min_value=1, max_value=10, default=1, help_text="Number of paths to return"
+    )
+    max_stops = serializers.IntegerField(
+        min_value=0,
+        required=False,
+        help_text="Most spaceports to stop at between the two",
+    )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fields["from"] = serializers.IntegerField(
+            help_text="Id of the source spaceport"
+        )
+        return fields
+
+
+class DistanceLookupSerializer(serializers.Serializer):
+    pairs = serializers.ListField(
+        child=serializers.ListField(
+            child=serializers.IntegerField(min_value=1, max_value=2**53),
+            min_length=2,
+            max_length=2,
+        ),
+        allow_empty=False,
+        max_length=1000,
+        help_text="Pairs of source and destination spaceport ids",
+    )
+
+
+class ItinerarySearchSerializer(serializers.Serializer):
+    MAX_WINDOW = timedelta(days=31)
+
+    to = serializers.IntegerField(help_text="Id of the destination spaceport")
+    depart_after = serializers.DateTimeField(
+        input_formats=SpaceflightFilterSerializer.DATE_FORMATS
+    )
+    arrive_by = serializers.DateTimeField(
+        input_formats=SpaceflightFilterSerializer.DATE_FORMATS
+    )
+    min_layover = serializers.IntegerField(
+        min_value=0, default=30, help_text="Minimum layover in minutes"
+    )
+    max_layover = serializers.IntegerField(
+        min_value=0, default=24 * 60, help_text="Maximum layover in minutes"
+    )
+    seats = serializers.IntegerField(
+        min_value=1, default=1, help_text="Free seats needed on every leg"
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=20, default=5)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fields["from"] = serializers.IntegerField(
+            help_text="Id of the source spaceport"
+        )
+        return fields
+
+    def validate(self, attrs):
+        data = super(ItinerarySearchSerializer, self).validate(attrs)
+        if not attrs["depart_after"] < attrs["arrive_by"]:
+            raise serializers.ValidationError(
+                {"arrive_by": "arrive_by must be later than depart_after."}
+            )
+        if attrs["arrive_by"] - attrs["depart_after"] > self.MAX_WINDOW:
+            raise serializers.ValidationError(
+                {
+                    "arrive_by": f"The search window is limited to {self.MAX_WINDOW.days} days."
+                }
+            )
+        if attrs["min_layover"] > attrs["max_layover"]:
+            raise serializers.ValidationError(
+                {"max_layover": "max_layover must not be less than min_layover."}
+            )
+        data["min_layover"] = timedelta(minutes=attrs["min_layover"])
+        data["max_layover"] = timedelta(minutes=attrs["max_layover"])
+        return data
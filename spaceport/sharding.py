@@ -0,0 +1,161 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+# Rows created on shard N get ids from ``N << SHARD_ID_BITS`` up, so an order
+# or ticket id tells which shard holds it.
+SHARD_ID_BITS = 40
+SHARDED_MODELS = ("spaceport.order", "spaceport.ticket")
+# Deleting an order looks for its booking request on the same database; the
+# table stays empty on shards, queued bookings are made on default only.
+SHARD_TABLES = (*SHARDED_MODELS, "spaceport.bookingrequest")
+
+
+def is_sharded(model):
+    return bool(settings.SPACEPORT_SHARDS) and model._meta.label_lower in (
+        SHARDED_MODELS
+    )
+
+
+def ticket_databases():
+    """Every database holding orders and tickets."""
+    return settings.SPACEPORT_SHARDS or ["default"]
+
+
+def shard_for_spaceflight(spaceflight_id):
+    shards = settings.SPACEPORT_SHARDS
+    return shards[spaceflight_id % len(shards)] if shards else "default"
+
+
+def shard_for_id(pk):
+    """The database of an order or ticket, ``None`` for an unknown id."""
+    number = int(pk) >> SHARD_ID_BITS
+    if not settings.SPACEPORT_SHARDS:
+        return "default"
+    if 1 <= number <= len(settings.SPACEPORT_SHARDS):
+        return settings.SPACEPORT_SHARDS[number - 1]
+    return None
+
+
+def group_by_shard(spaceflight_ids):
+    groups = {}
+    for spaceflight_id in spaceflight_ids:
+        groups.setdefault(shard_for_spaceflight(spaceflight_id), []).append(
+            spaceflight_id
+        )
+    return groups
+
+
+def shard_for_tickets(tickets_data):
+    """The shard an order of ``tickets_data`` is booked on."""
+    shards = {
+        shard_for_spaceflight(ticket["spaceflight"].pk) for ticket in tickets_data
+    }
+    if len(shards) > 1:
+        raise serializers.ValidationError(
+            {"tickets": "Book spaceflights kept on different shards separately."}
+        )
+    return shards.pop()
+
+
+def first_id(using):
+    """Where the order and ticket ids of ``using`` start, after 0 on default."""
+    if using not in settings.SPACEPORT_SHARDS:
+        return 0
+    return (settings.SPACEPORT_SHARDS.index(using) + 1) << SHARD_ID_BITS
+
+
+def reserve_ids(using):
+    """Moves the id sequences of a fresh shard to its own range."""
+    from spaceport.models import Order, Ticket
+
+    start = first_id(using)
+    with connections[using].cursor() as cursor:
+        for model in (Order, Ticket):
+            table = model._meta.db_table
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)",
+                    [table, start],
+                )
+            elif row[0] < start:
+                cursor.execute(
+                    "UPDATE sqlite_sequence SET seq = %s WHERE name = %s",
+                    [start, table],
+                )
+
+
+class ShardRouter:
+    """
+    Keeps orders and tickets on the shard they were read from or created
+    on, and ``spaceflight.tickets`` on the shard of the spaceflight. Queries
+    without such a hint pick their shard with ``.using()``.
+    """
+
+    def _shard(self, model, hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get("instance")
+        if instance is None:
+            return None
+        if is_sharded(type(instance)):
+            return instance._state.db
+        if instance._meta.label_lower == "spaceport.spaceflight":
+            return shard_for_spaceflight(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.SPACEPORT_SHARDS:
+            return f"{app_label}.{model_name}" in SHARD_TABLES
+        return None
+
+
+class ShardedQuerySet:
+    """
+    The same queryset on every shard, with the part of the ``QuerySet`` API
+    ``KeysetPagination`` uses: slices run on each shard and are merged.
+    """
+
+    def __init__(self, querysets):
+        self.querysets = querysets
+        self.model = querysets[0].model
+        self.ordering = ()
+
+    def _clone(self, querysets):
+        clone = ShardedQuerySet(querysets)
+        clone.ordering = self.ordering
+        return clone
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def filter(self, *args, **kwargs):
+        return self._clone(
+            [queryset.filter(*args, **kwargs) for queryset in self.querysets]
+        )
+
+    def order_by(self, *ordering):
+        clone = self._clone(
+            [queryset.order_by(*ordering) for queryset in self.querysets]
+        )
+        clone.ordering = ordering
+        return clone
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.start or key.step:
+            raise TypeError("Sharded querysets only take [:stop] slices.")
+        rows = [row for queryset in self.querysets for row in queryset[key]]
+        # Sort by the last field first, the sort is stable.
+        for field in reversed(self.ordering):
+            rows.sort(key=attrgetter(field.lstrip("-")), reverse=field.startswith("-"))
+        return rows[key]
@@ -0,0 +1,128 @@
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import router, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from spaceport import distances, routing, sharding
+from spaceport.flightcache import (
+    forget_all_spaceflights,
+    forget_spaceflight_lists,
+    forget_spaceflights,
+)
+from spaceport.versioning import VERSIONED_MODELS, bump_versions, create_stamps
+from spaceport.models import (
+    Route,
+    Spaceflight,
+    Spaceport,
+    Spaceship,
+    Ticket,
+    VersionStamp,
+)
+from spaceport.seatmap import forget_seat_maps
+
+
+@receiver(post_save, sender=Ticket)
+def count_saved_ticket(sender, instance, created, **kwargs):
+    """Keeps ``Spaceflight.tickets_sold`` in step with admin and ORM saves."""
+    loaded_spaceflight_id = getattr(instance, "_loaded_spaceflight_id", None)
+
+    if created:
+        Spaceflight.add_tickets_sold({instance.spaceflight_id: 1})
+    elif loaded_spaceflight_id and loaded_spaceflight_id != instance.spaceflight_id:
+        Spaceflight.add_tickets_sold(
+            {loaded_spaceflight_id: -1, instance.spaceflight_id: 1}
+        )
+    spaceflight_ids = {loaded_spaceflight_id, instance.spaceflight_id} - {None}
+    transaction.on_commit(lambda: forget_seat_maps(*spaceflight_ids))
+    if len(spaceflight_ids) > 1:
+        # Freed seats may bring a spaceflight into ?min_seats results.
+        transaction.on_commit(lambda: forget_spaceflight_lists(*spaceflight_ids))
+    else:
+        transaction.on_commit(lambda: forget_spaceflights(*spaceflight_ids))
+    instance._loaded_spaceflight_id = instance.spaceflight_id
+
+
+@receiver(post_delete, sender=Ticket)
+def count_deleted_ticket(sender, instance, **kwargs):
+    Spaceflight.add_tickets_sold({instance.spaceflight_id: -1})
+    transaction.on_commit(lambda: forget_seat_maps(instance.spaceflight_id))
+    transaction.on_commit(lambda: forget_spaceflight_lists(instance.spaceflight_id))
+
+
+@receiver([post_save, post_delete], sender=Spaceflight)
+def forget_cached_spaceflight(sender, instance, **kwargs):
+    """Edits may move the spaceflight to other list pages."""
+    spaceflight_id = instance.id
+    transaction.on_commit(lambda: forget_spaceflight_lists(spaceflight_id))
+
+
+@receiver([post_save, post_delete], sender=Spaceship)
+@receiver([post_save, post_delete], sender=Spaceport)
+def forget_cached_spaceflights(sender, **kwargs):
+    transaction.on_commit(forget_all_spaceflights)
+
+
+@receiver(post_save, sender=Route)
+def update_route_graph(sender, instance, **kwargs):
+    transaction.on_commit(lambda: routing.route_saved(instance))
+    transaction.on_commit(distances.schedule_rebuild)
+    transaction.on_commit(forget_all_spaceflights)
+
+
+@receiver(post_delete, sender=Route)
+def remove_from_route_graph(sender, instance, **kwargs):
+    route_id = instance.id
+    transaction.on_commit(lambda: routing.route_deleted(route_id))
+    transaction.on_commit(distances.schedule_rebuild)
+    transaction.on_commit(forget_all_spaceflights)
+
+
+@receiver([post_save, post_delete])
+def bump_model_version(sender, **kwargs):
+    if sender in VERSIONED_MODELS:
+        bump_versions(sender)
+
+
+@receiver(m2m_changed)
+def bump_m2m_versions(sender, instance, action, model, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        changed = [
+            versioned
+            for versioned in VERSIONED_MODELS
+            if versioned in (type(instance), model)
+        ]
+        if changed:
+            bump_versions(*changed)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Applies ``SPACEPORT_SQLITE_PRAGMAS`` to every new SQLite connection."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SPACEPORT_SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(post_migrate)
+def reserve_shard_ids(sender, using, **kwargs):
+    if sender.name == "spaceport" and using in settings.SPACEPORT_SHARDS:
+        sharding.reserve_ids(using)
+
+
+@receiver(post_migrate)
+def stamp_versioned_models(sender, using, apps=global_apps, **kwargs):
+    if sender.name != "spaceport" or not router.allow_migrate_model(
+        using, VersionStamp
+    ):
+        return
+    try:
+        # Missing after migrating back past the stamp table; flush sends
+        # no migration state.
+        apps.get_model("spaceport", "VersionStamp")
+    except LookupError:
+        return
+    create_stamps(using)
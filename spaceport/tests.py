@@ -1,3 +1,1788 @@
-from django.test import TestCase
+import base64
+import contextvars
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import ExitStack, closing
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, router
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIClient
+
+from spaceport import bookings, distances, idempotency, replicas, routing
+from spaceport.cache import SQLiteCache
+from spaceport.distances import DistanceMatrix, get_distance_matrix
+from spaceport.flightcache import forget_all_spaceflights
+from spaceport.itineraries import Connection, find_itineraries
+from spaceport.fastlist import FastListMixin
+from spaceport.models import (
+    BookingRequest,
+    IdempotencyKey,
+    Order,
+    Crew,
+    Planet,
+    Route,
+    SeatHold,
+    Spaceflight,
+    Spaceport,
+    Spaceship,
+    SpaceshipType,
+    Ticket,
+    VersionStamp,
+)
+from spaceport.routing import Path, RouteGraph, get_route_graph
+from spaceport.seatmap import SeatMap, get_seat_map
+from spaceport.seeding import Seeder
+from spaceport.serializers import OrderSerializer, RouteSerializer, TicketSerializer
+from spaceport.sharding import first_id, shard_for_spaceflight
+from spaceport.throttling import (
+    ScopedThrottle,
+    SQLiteThrottleStore,
+    get_throttle_store,
+)
+from spaceport.versioning import VERSIONED_MODELS
+from spaceport.views import RouteViewSet, SpaceflightViewSet
+
+SPACEFLIGHTS_URL = "/api/spaceport/spaceflights/"
+ROUTES_URL = "/api/spaceport/routes/"
+ORDERS_URL = "/api/spaceport/orders/"
+
+DEPARTURE = datetime(2030, 1, 1, 8, tzinfo=timezone.utc)
+
+
+class IsolatedStateMixin:
+    """
+    Keeps the cache, throttles and distance matrix in files of the test run,
+    never those of the server. Orders stay on default and reads on the
+    primary unless a test case sets ``shards`` or ``replicas``.
+    """
+
+    shards = []
+    replicas = []
+
+    @classmethod
+    def setUpClass(cls):
+        cls.state_dir = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(
+            override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "spaceport.cache.SQLiteCache",
+                        "LOCATION": f"{cls.state_dir}/cache.sqlite3",
+                    }
+                },
+                SPACEPORT_DISTANCE_MATRIX=f"{cls.state_dir}/distances.npy",
+                SPACEPORT_THROTTLE_DB=f"{cls.state_dir}/throttle.sqlite3",
+                SPACEPORT_SHARDS=cls.shards,
+                SPACEPORT_REPLICAS=cls.replicas,
+            )
+        )
+        super().setUpClass()
+
+
+class SpaceportTestCase(IsolatedStateMixin, TestCase):
+    """
+    A small network of spaceports and spaceflights on one 4x3 spaceship,
+    and a customer who is logged in.
+    """
+
+    # Replicas mirror default, and are left out of the test transactions.
+    databases = {"default", *settings.SPACEPORT_SHARDS}
+
+    @classmethod
+    def setUpTestData(cls):
+        mars = Planet.objects.create(planet_name="Mars")
+        venus = Planet.objects.create(planet_name="Venus")
+        cls.spaceports = [
+            Spaceport.objects.create(spaceport_name=name, closest_planet=planet)
+            for name, planet in (
+                ("Olympus", mars),
+                ("Tharsis", mars),
+                ("Ishtar", venus),
+            )
+        ]
+        first, second, third = cls.spaceports
+        cls.routes = [
+            Route.objects.create(source=source, destination=destination, distance=d)
+            for source, destination, d in (
+                (first, second, 100),
+                (second, third, 250),
+                (first, third, 400),
+            )
+        ]
+
+        cls.spaceship = Spaceship.objects.create(
+            spaceship_name="Ares",
+            rows=4,
+            seats_in_row=3,
+            spaceship_types=SpaceshipType.objects.create(spaceship_type_name="Clipper"),
+        )
+        cls.spaceship.crews.add(
+            Crew.objects.create(first_name="Yuri", last_name="Mori")
+        )
+        cls.spaceflights = [
+            Spaceflight.objects.create(
+                route=cls.routes[number % len(cls.routes)],
+                spaceship=cls.spaceship,
+                departure_time=DEPARTURE + timedelta(hours=6 * number),
+                arrival_time=DEPARTURE + timedelta(hours=6 * number + 5),
+            )
+            for number in range(7)
+        ]
+        cls.user = get_user_model().objects.create_user(
+            "passenger@spaceport.com", "pass12345"
+        )
+
+    def setUp(self):
+        cache.clear()
+        get_throttle_store().connection.execute("DELETE FROM throttle")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class FastListTests(SpaceportTestCase):
+    """The values() fast path renders what the list serializers render."""
+
+    def assert_same_bodies(self, viewset, url, queries):
+        for query in queries:
+            with self.subTest(url=url, query=query):
+                bodies = []
+                for fast in (True, False):
+                    cache.clear()
+                    with mock.patch.object(viewset, "fast_list", fast):
+                        response = self.client.get(f"{url}?{query}")
+                    self.assertEqual(response.status_code, 200)
+                    bodies.append(response.json())
+                self.assertEqual(bodies[0], bodies[1])
+
+    def test_spaceflight_list(self):
+        self.assert_same_bodies(
+            SpaceflightViewSet,
+            SPACEFLIGHTS_URL,
+            [
+                "page_size=3",
+                "page_size=100",
+                "page_size=3&fields=id,route",
+                "page_size=3&fields=departure_time,tickets_available",
+            ],
+        )
+
+    def test_route_list(self):
+        self.assert_same_bodies(
+            RouteViewSet,
+            ROUTES_URL,
+            ["page_size=2", "page_size=100", "page_size=2&fields=id,source_name"],
+        )
+
+    def test_fast_path_is_opt_in(self):
+        self.assertIs(FastListMixin.fast_list, False)
+
+
+class SQLiteCacheTests(SpaceportTestCase):
+    """Two backends on one file behave as two workers sharing the cache."""
+
+    def setUp(self):
+        super().setUp()
+        location = f"{self.state_dir}/cache.sqlite3"
+        self.worker = SQLiteCache(location, {})
+        self.other_worker = SQLiteCache(location, {})
+
+    def test_add_is_exclusive_across_workers(self):
+        self.assertTrue(self.worker.add("lock", True, 10))
+        self.assertFalse(self.other_worker.add("lock", True, 10))
+        self.other_worker.delete("lock")
+        self.assertTrue(self.other_worker.add("lock", True, 10))
+
+    def test_add_replaces_an_expired_entry(self):
+        self.worker.set("lock", True, 10)
+        with mock.patch("spaceport.cache.time.time", return_value=time.time() + 11):
+            self.assertTrue(self.other_worker.add("lock", "mine", 10))
+        self.assertEqual(self.worker.get("lock"), "mine")
+
+    def test_incr_counts_every_worker(self):
+        self.worker.set("version", 1, None)
+        self.assertEqual(self.other_worker.incr("version"), 2)
+        self.assertEqual(self.worker.incr("version"), 3)
+        self.assertEqual(self.other_worker.get("version"), 3)
+        with self.assertRaises(ValueError):
+            self.worker.incr("missing")
+
+    def test_values_round_trip(self):
+        values = {"pin": True, "mark": 1.5, "entry": (1.0, [2, 3], {"id": 4})}
+        self.worker.set_many(values)
+        self.assertEqual(self.other_worker.get_many([*values, "missing"]), values)
+        self.worker.delete_many(values)
+        self.assertEqual(self.other_worker.get_many(values), {})
+
+
+class BookingQueueTests(SpaceportTestCase):
+    def setUp(self):
+        super().setUp()
+        spaceflight = self.spaceflights[0]
+        self.booking = BookingRequest.objects.create(
+            user=self.user,
+            spaceflight=spaceflight,
+            payload={"tickets": [{"row": 1, "seat": 1, "spaceflight": spaceflight.pk}]},
+        )
+
+    def test_operational_error_escapes_process_batch(self):
+        with mock.patch.object(
+            OrderSerializer, "save", side_effect=OperationalError("database is locked")
+        ):
+            with self.assertRaises(OperationalError):
+                bookings.process_batch(bookings.claim_batch(10))
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, BookingRequest.Status.PROCESSING)
+
+    def test_drain_requeues_a_batch_that_hit_a_locked_database(self):
+        save = OrderSerializer.save
+        failures = [OperationalError("database is locked")]
+
+        def save_once_locked(serializer, **kwargs):
+            if failures:
+                raise failures.pop()
+            return save(serializer, **kwargs)
+
+        with mock.patch.object(OrderSerializer, "save", save_once_locked):
+            with mock.patch.object(bookings.time, "sleep") as sleep:
+                self.assertEqual(bookings.drain(10), 1)
+
+        sleep.assert_called_once_with(bookings.LOCKED_BACKOFF)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, BookingRequest.Status.DONE)
+        self.assertEqual(self.booking.order.tickets.count(), 1)
+
+    def test_drain_backs_off_while_the_claim_is_locked(self):
+        claim_batch = bookings.claim_batch
+        failures = [OperationalError("database is locked")] * 3
+
+        def claim_after_locks(size):
+            if failures:
+                raise failures.pop()
+            return claim_batch(size)
+
+        with mock.patch.object(bookings, "claim_batch", claim_after_locks):
+            with mock.patch.object(bookings.time, "sleep") as sleep:
+                self.assertEqual(bookings.drain(10), 1)
+
+        delay = bookings.LOCKED_BACKOFF
+        self.assertEqual(
+            sleep.call_args_list,
+            [mock.call(delay), mock.call(2 * delay), mock.call(4 * delay)],
+        )
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, BookingRequest.Status.DONE)
+
+    def test_drain_gives_up_on_a_database_that_stays_locked(self):
+        with mock.patch.object(
+            bookings,
+            "claim_batch",
+            side_effect=OperationalError("database is locked"),
+        ):
+            with mock.patch.object(bookings.time, "sleep") as sleep:
+                with self.assertRaises(OperationalError):
+                    bookings.drain(10)
+        self.assertEqual(sleep.call_count, bookings.LOCKED_RETRIES)
+
+
+class BestSeatsTests(SpaceportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"{SPACEFLIGHTS_URL}{self.spaceflights[0].pk}/best-seats/"
+
+    def test_post_books_the_block(self):
+        response = self.client.post(self.url, {"party": 2}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["tickets"]), 2)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+    def test_post_replays_a_repeated_idempotency_key(self):
+        first = self.client.post(
+            self.url, {"party": 2}, format="json", HTTP_IDEMPOTENCY_KEY="k1"
+        )
+        again = self.client.post(
+            self.url, {"party": 2}, format="json", HTTP_IDEMPOTENCY_KEY="k1"
+        )
+        self.assertEqual(again.status_code, 201)
+        self.assertEqual(again.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+    def test_post_uses_the_orders_throttle(self):
+        rates = {**ScopedThrottle.THROTTLE_RATES, "orders": "1/minute"}
+        with mock.patch.object(ScopedThrottle, "THROTTLE_RATES", rates):
+            self.assertEqual(self.client.get(f"{self.url}?party=2").status_code, 200)
+            self.assertEqual(self.client.get(f"{self.url}?party=2").status_code, 200)
+            self.assertEqual(
+                self.client.post(self.url, {"party": 2}, format="json").status_code,
+                201,
+            )
+            self.assertEqual(
+                self.client.post(self.url, {"party": 2}, format="json").status_code,
+                429,
+            )
+
+    @override_settings(SPACEPORT_ASYNC_BOOKING=True)
+    def test_post_is_queued_with_async_booking(self):
+        response = self.client.post(self.url, {"party": 2}, format="json")
+        self.assertEqual(response.status_code, 202)
+        booking = BookingRequest.objects.get(user=self.user)
+        self.assertEqual(len(booking.payload["tickets"]), 2)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderCreationTests(SpaceportTestCase):
+    unique_error = {
+        "non_field_errors": [
+            "The fields spaceflight, row, seat must make a unique set."
+        ]
+    }
+
+    def book(self, *seats, spaceflight=None):
+        spaceflight = spaceflight or self.spaceflights[0]
+        return self.client.post(
+            ORDERS_URL,
+            {
+                "tickets": [
+                    {"row": row, "seat": seat, "spaceflight": spaceflight.pk}
+                    for row, seat in seats
+                ]
+            },
+            format="json",
+        )
+
+    def test_books_every_ticket(self):
+        response = self.book((1, 1), (1, 2), (2, 1))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["tickets"]), 3)
+        self.spaceflights[0].refresh_from_db()
+        self.assertEqual(self.spaceflights[0].tickets_sold, 3)
+
+    def test_errors_match_the_ticket_serializer(self):
+        spaceflight = self.spaceflights[0].pk
+        tickets = [
+            {"row": 9, "seat": 1, "spaceflight": spaceflight},
+            {"row": 1, "seat": 0, "spaceflight": spaceflight},
+            {"row": 1, "seat": 1, "spaceflight": 999},
+            {"row": "a", "seat": 1, "spaceflight": spaceflight},
+            {"row": 1, "seat": 1},
+        ]
+        response = self.client.post(ORDERS_URL, {"tickets": tickets}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+        expected = []
+        for ticket in tickets:
+            serializer = TicketSerializer(data=ticket)
+            serializer.is_valid()
+            expected.append(serializer.errors)
+        self.assertEqual(response.json(), {"tickets": expected})
+        self.assertEqual(expected[0], {"row": ["row must be in range [1, 4], not 9"]})
+        self.assertFalse(Order.objects.exists())
+
+    def test_rejects_a_seat_twice_in_one_order(self):
+        response = self.book((1, 1), (1, 2), (1, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"tickets": [{}, {}, self.unique_error]})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Ticket.objects.exists())
+
+    def test_rejects_a_taken_seat(self):
+        self.assertEqual(self.book((1, 1)).status_code, 201)
+        response = self.book((1, 2), (1, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"tickets": [{}, self.unique_error]})
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_queries_do_not_grow_with_the_tickets(self):
+        with CaptureQueriesContext(connection) as one:
+            self.assertEqual(self.book((1, 1)).status_code, 201)
+        with CaptureQueriesContext(connection) as row:
+            self.assertEqual(self.book((2, 1), (2, 2), (2, 3)).status_code, 201)
+        self.assertEqual(len(row), len(one))
+
+    def test_same_seat_on_another_spaceflight(self):
+        self.assertEqual(self.book((1, 1)).status_code, 201)
+        response = self.book((1, 1), spaceflight=self.spaceflights[1])
+        self.assertEqual(response.status_code, 201)
+
+
+class SeatHoldTests(SpaceportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.spaceflight = self.spaceflights[0]
+        self.url = f"{SPACEFLIGHTS_URL}{self.spaceflight.pk}/holds/"
+        self.rival = get_user_model().objects.create_user(
+            "rival@spaceport.com", "pass12345"
+        )
+        self.other = APIClient()
+        self.other.force_authenticate(self.rival)
+
+    def hold(self, client, *seats, minutes=10):
+        return client.post(
+            self.url,
+            {
+                "seats": [{"row": row, "seat": seat} for row, seat in seats],
+                "minutes": minutes,
+            },
+            format="json",
+        )
+
+    def expire_holds(self):
+        SeatHold.objects.update(
+            expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+        )
+
+    def test_held_seats_are_refused_to_others(self):
+        self.assertEqual(self.hold(self.client, (1, 1), (1, 2)).status_code, 201)
+        response = self.hold(self.other, (1, 2), (1, 3))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["seats"], [{"row": 1, "seat": 2}])
+        self.assertEqual(SeatHold.objects.count(), 2)
+
+    def test_holder_can_hold_again(self):
+        first = self.hold(self.client, (1, 1))
+        again = self.hold(self.client, (1, 1), minutes=20)
+        self.assertEqual(again.status_code, 201)
+        self.assertNotEqual(again.data["hold"], first.data["hold"])
+        self.assertEqual(SeatHold.objects.count(), 1)
+
+    def test_sold_seats_are_refused(self):
+        self.client.post(
+            ORDERS_URL,
+            {"tickets": [{"row": 2, "seat": 2, "spaceflight": self.spaceflight.pk}]},
+            format="json",
+        )
+        response = self.hold(self.other, (2, 2))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["seats"], [{"row": 2, "seat": 2}])
+
+    def test_others_cannot_book_held_seats(self):
+        self.hold(self.client, (1, 1))
+        response = self.other.post(
+            ORDERS_URL,
+            {"tickets": [{"row": 1, "seat": 1, "spaceflight": self.spaceflight.pk}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {
+                "tickets": [
+                    {"non_field_errors": ["The seat is on hold for another customer."]}
+                ]
+            },
+        )
+
+    def test_order_from_a_hold_on_a_sold_seat(self):
+        token = self.hold(self.client, (2, 3)).data["hold"]
+        # Sold without going through the hold check, e.g. by an admin.
+        Ticket.objects.create(
+            order=Order.objects.create(user=self.rival),
+            spaceflight=self.spaceflight,
+            row=2,
+            seat=3,
+        )
+        response = self.client.post(ORDERS_URL, {"hold": str(token)}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {"tickets": ["The fields spaceflight, row, seat must make a unique set."]},
+        )
+        self.assertFalse(Order.objects.filter(user=self.user).exists())
+        self.assertTrue(SeatHold.objects.filter(token=token).exists())
+        self.spaceflight.refresh_from_db(fields=["tickets_sold"])
+        self.assertEqual(self.spaceflight.tickets_sold, 1)
+
+    def test_order_converts_the_hold(self):
+        token = self.hold(self.client, (3, 1), (3, 2)).data["hold"]
+        response = self.client.post(ORDERS_URL, {"hold": str(token)}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(
+                (ticket["row"], ticket["seat"]) for ticket in response.data["tickets"]
+            ),
+            [(3, 1), (3, 2)],
+        )
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_expired_holds_free_their_seats(self):
+        self.hold(self.client, (1, 1), (1, 2))
+        self.expire_holds()
+        self.assertEqual(self.hold(self.other, (1, 1)).status_code, 201)
+        # Expired holds of the spaceflight are swept by the next hold.
+        self.assertEqual(SeatHold.objects.count(), 1)
+
+    def test_expired_hold_cannot_be_booked(self):
+        token = self.hold(self.client, (1, 1)).data["hold"]
+        self.expire_holds()
+        response = self.client.post(ORDERS_URL, {"hold": str(token)}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {"hold": ["The seat hold does not exist or has expired."]},
+        )
+        self.assertFalse(Order.objects.exists())
+
+    def test_released_seats_can_be_held(self):
+        token = self.hold(self.client, (1, 1)).data["hold"]
+        response = self.client.delete(f"{self.url}?hold={token}")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.hold(self.other, (1, 1)).status_code, 201)
+
+
+class IdempotencyTests(SpaceportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = {
+            "tickets": [{"row": 1, "seat": 1, "spaceflight": self.spaceflights[0].pk}]
+        }
+
+    def post(self, data=None, key="retry-1", client=None):
+        return (client or self.client).post(
+            ORDERS_URL, data or self.order, format="json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_repeated_key_replays_the_response(self):
+        first = self.post()
+        self.assertEqual(first.status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            again = self.post()
+        self.assertEqual(again.status_code, 201)
+        self.assertEqual(again.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(
+            [query for query in queries if "spaceport_ticket" in query["sql"]]
+        )
+
+    def test_rejected_request_frees_the_key(self):
+        Ticket.objects.create(
+            order=Order.objects.create(user=self.user),
+            spaceflight=self.spaceflights[0],
+            row=1,
+            seat=1,
+        )
+        self.assertEqual(self.post().status_code, 400)
+        Order.objects.all().delete()
+        response = self.post()
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+
+    def test_key_reused_with_another_body(self):
+        self.post()
+        other_seat = {
+            "tickets": [{"row": 1, "seat": 2, "spaceflight": self.spaceflights[0].pk}]
+        }
+        response = self.post(other_seat)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_keys_are_per_user(self):
+        other = APIClient()
+        other.force_authenticate(
+            get_user_model().objects.create_user("rival@spaceport.com", "pass12345")
+        )
+        self.assertEqual(self.post().status_code, 201)
+        response = self.post(client=other)
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+
+    def test_duplicate_waits_for_the_request_in_flight(self):
+        record = IdempotencyKey.objects.create(
+            user=self.user,
+            key="retry-1",
+            fingerprint=self.fingerprint(self.order),
+            expires_at=datetime.now(timezone.utc) + timedelta(minutes=1),
+        )
+
+        def finish_first_request(seconds):
+            record.status_code, record.response = 201, {"id": 42}
+            record.save()
+
+        with mock.patch.object(idempotency.time, "sleep", finish_first_request):
+            response = self.post()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"id": 42})
+        self.assertFalse(Order.objects.exists())
+
+    def test_duplicate_gives_up_on_a_slow_request(self):
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key="retry-1",
+            fingerprint=self.fingerprint(self.order),
+            expires_at=datetime.now(timezone.utc) + timedelta(minutes=1),
+        )
+        with mock.patch.object(idempotency, "WAIT_TIMEOUT", 0):
+            response = self.post()
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_concurrent_requests_create_the_key_once(self):
+        """
+        The other request inserts the key after this one looked it up; the
+        insert of this one fails and it replays the other's response.
+        """
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key="retry-1",
+            fingerprint=self.fingerprint(self.order),
+            status_code=201,
+            response={"id": 42},
+            expires_at=datetime.now(timezone.utc) + timedelta(minutes=1),
+        )
+        first = QuerySet.first
+        lookups = []
+
+        def look_up_before_the_other_request(queryset):
+            if queryset.model is IdempotencyKey:
+                lookups.append(queryset)
+                if len(lookups) == 1:
+                    return None
+            return first(queryset)
+
+        with mock.patch.object(QuerySet, "first", look_up_before_the_other_request):
+            response = self.post()
+        self.assertEqual(len(lookups), 2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"id": 42})
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+        self.assertFalse(Order.objects.exists())
+
+    @staticmethod
+    def fingerprint(data):
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+class KeysetPaginationTests(SpaceportTestCase):
+    def walk(self, url, link="next"):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item["id"] for item in response.data["results"]])
+            url = response.data[link]
+        return pages
+
+    def assert_walks(self, url, expected):
+        forward = self.walk(url)
+        self.assertEqual([pk for page in forward for pk in page], expected)
+        self.assertTrue(all(forward))
+
+        # From the last page back, the same pages in reverse.
+        last = self.client.get(url)
+        while last.data["next"]:
+            last = self.client.get(last.data["next"])
+        backward = self.walk(last.data["previous"], link="previous")
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_spaceflights_with_equal_departures(self):
+        tied = self.spaceflights[2]
+        for _ in range(3):
+            Spaceflight.objects.create(
+                route=tied.route,
+                spaceship=tied.spaceship,
+                departure_time=tied.departure_time,
+                arrival_time=tied.arrival_time,
+            )
+        expected = list(
+            Spaceflight.objects.order_by("departure_time", "id").values_list(
+                "id", flat=True
+            )
+        )
+        for page_size in (1, 2, 3, 100):
+            with self.subTest(page_size=page_size):
+                self.assert_walks(f"{SPACEFLIGHTS_URL}?page_size={page_size}", expected)
+
+    def test_orders_created_at_the_same_time(self):
+        for _ in range(7):
+            Order.objects.create(user=self.user)
+        created_at = datetime.now(timezone.utc)
+        Order.objects.filter(pk__lte=3).update(created_at=created_at)
+        Order.objects.filter(pk__gt=3).update(
+            created_at=created_at - timedelta(hours=1)
+        )
+        expected = list(
+            Order.objects.order_by("-created_at", "id").values_list("id", flat=True)
+        )
+        for page_size in (2, 3):
+            with self.subTest(page_size=page_size):
+                self.assert_walks(f"{ORDERS_URL}?page_size={page_size}", expected)
+
+    def test_routes(self):
+        expected = sorted(route.pk for route in self.routes)
+        self.assert_walks(f"{ROUTES_URL}?page_size=2", expected)
+
+    def test_count_on_request_only(self):
+        response = self.client.get(f"{SPACEFLIGHTS_URL}?page_size=2")
+        self.assertNotIn("count", response.data)
+        response = self.client.get(f"{SPACEFLIGHTS_URL}?page_size=2&count=true")
+        self.assertEqual(response.data["count"], len(self.spaceflights))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f"{SPACEFLIGHTS_URL}?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+
+class ExportTests(SpaceportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = APIClient()
+        self.admin.force_authenticate(
+            get_user_model().objects.create_superuser("admin@spaceport.com", "pass")
+        )
+        self.order = Order.objects.create(user=self.user)
+        Order.objects.filter(pk=self.order.pk).update(
+            created_at=datetime(2030, 1, 1, 8, 30, 15, 123456, tzinfo=timezone.utc)
+        )
+        self.order.refresh_from_db()
+
+    def export(self, name, output):
+        response = self.admin.get(f"/api/spaceport/exports/{name}/?output={output}")
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_datetimes_keep_microseconds(self):
+        created_at = self.order.created_at.isoformat()
+        self.assertEqual(created_at, "2030-01-01T08:30:15.123456+00:00")
+
+        (line,) = self.export("orders", "ndjson").splitlines()
+        self.assertEqual(json.loads(line)["created_at"], created_at)
+        (row,) = csv.DictReader(self.export("orders", "csv").splitlines())
+        self.assertEqual(row["created_at"], created_at)
+
+
+class SeederTests(SpaceportTestCase):
+    SEEDED_MODELS = (
+        Planet,
+        Spaceport,
+        Route,
+        SpaceshipType,
+        Crew,
+        Spaceship,
+        get_user_model(),
+        Spaceflight,
+        Order,
+        Ticket,
+    )
+
+    def seed(self, seed, batch_size):
+        # From an empty database each time, ids included.
+        for model in reversed(self.SEEDED_MODELS):
+            model.objects.all().delete()
+        counts = Seeder(seed=seed, batch_size=batch_size).seed(
+            planets=3,
+            spaceports=8,
+            routes=20,
+            spaceships=3,
+            crews=10,
+            users=20,
+            spaceflights=60,
+            tickets=400,
+            days=30,
+        )
+        self.assertEqual(counts["tickets"], Ticket.objects.count())
+
+        rows = {
+            model._meta.label: list(model.objects.order_by("pk").values_list())
+            for model in self.SEEDED_MODELS
+        }
+        rows["crews"] = list(
+            Spaceship.crews.through.objects.order_by(
+                "spaceship_id", "crew_id"
+            ).values_list("spaceship_id", "crew_id")
+        )
+        return rows
+
+    def test_same_seed_same_rows(self):
+        rows = self.seed(7, batch_size=1000)
+        self.assertTrue(rows["spaceport.Ticket"])
+        # The batch size only changes how the rows are written.
+        self.assertEqual(self.seed(7, batch_size=25), rows)
+        self.assertNotEqual(self.seed(8, batch_size=1000), rows)
+
+    def test_command_rejects_counts_below_one(self):
+        for arguments in (
+            ["--routes", "0"],
+            ["--spaceflights", "-5"],
+            ["--batch-size", "0"],
+            ["--tickets", "-1"],
+        ):
+            with self.subTest(arguments), mock.patch(
+                "spaceport.management.commands.seed_spaceport.Seeder"
+            ) as seeder:
+                with self.assertRaisesMessage(CommandError, arguments[0]):
+                    call_command("seed_spaceport", *arguments)
+                seeder.assert_not_called()
+
+    def test_command_start_keeps_its_offset(self):
+        for value, expected in (
+            ("2030-01-01", datetime(2030, 1, 1, tzinfo=timezone.utc)),
+            ("2030-01-01T02:00:00+02:00", datetime(2030, 1, 1, tzinfo=timezone.utc)),
+            ("2030-01-01T00:00:00-05:00", datetime(2030, 1, 1, 5, tzinfo=timezone.utc)),
+        ):
+            with self.subTest(value), mock.patch(
+                "spaceport.management.commands.seed_spaceport.Seeder"
+            ) as seeder:
+                seeder.return_value.seed.return_value = {}
+                call_command("seed_spaceport", "--start", value, stdout=StringIO())
+                start = seeder.return_value.seed.call_args.kwargs["start"]
+                self.assertEqual(start, expected)
+                self.assertEqual(start.utcoffset(), timedelta(0))
+
+
+class SpaceflightFilterTests(SpaceportTestCase):
+    def ids(self, query):
+        response = self.client.get(f"{SPACEFLIGHTS_URL}?page_size=100&{query}")
+        self.assertEqual(response.status_code, 200)
+        return [spaceflight["id"] for spaceflight in response.data["results"]]
+
+    def departing(self, first, last):
+        return [
+            spaceflight.pk
+            for spaceflight in self.spaceflights
+            if first <= spaceflight.departure_time <= last
+        ]
+
+    def test_bare_date_before_includes_the_whole_day(self):
+        # Departures at 08:00, 14:00 and 20:00 on 2030-01-01.
+        day = DEPARTURE.replace(hour=0)
+        expected = self.departing(day, day + timedelta(days=1, microseconds=-1))
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(self.ids("departure_before=2030-01-01"), expected)
+        self.assertEqual(
+            self.ids("departure_after=2030-01-01&departure_before=2030-01-01"),
+            expected,
+        )
+
+    def test_datetime_before_is_exact(self):
+        self.assertEqual(
+            self.ids("departure_before=2030-01-01T14:00:00Z"),
+            self.departing(DEPARTURE, DEPARTURE + timedelta(hours=6)),
+        )
+
+    def test_bare_date_arrival_before(self):
+        # Arrivals at 13:00 and 19:00 on 2030-01-01, then 01:00 the next day.
+        self.assertEqual(
+            self.ids("arrival_before=2030-01-01"),
+            [spaceflight.pk for spaceflight in self.spaceflights[:2]],
+        )
+
+
+@skipUnless(
+    len(settings.SPACEPORT_SHARDS) > 1,
+    "Set SPACEPORT_SHARD_DBS to at least two shards.",
+)
+class ShardingTests(SpaceportTestCase):
+    shards = settings.SPACEPORT_SHARDS
+
+    def book(self, spaceflight, *seats):
+        response = self.client.post(
+            ORDERS_URL,
+            {
+                "tickets": [
+                    {"row": row, "seat": seat, "spaceflight": spaceflight.pk}
+                    for row, seat in seats
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data["id"]
+
+    def test_order_is_created_on_the_shard_of_its_spaceflight(self):
+        for spaceflight in self.spaceflights[:2]:
+            order_id = self.book(spaceflight, (1, 1), (1, 2))
+            using = shard_for_spaceflight(spaceflight.pk)
+            self.assertGreater(order_id, first_id(using))
+            self.assertTrue(Order.objects.using(using).filter(pk=order_id).exists())
+            self.assertEqual(
+                Ticket.objects.using(using).filter(order=order_id).count(), 2
+            )
+            self.assertFalse(Order.objects.filter(pk=order_id).exists())
+            spaceflight.refresh_from_db()
+            self.assertEqual(spaceflight.tickets_sold, 2)
+
+    def test_rejects_an_order_across_shards(self):
+        first, second = self.spaceflights[:2]
+        self.assertNotEqual(
+            shard_for_spaceflight(first.pk), shard_for_spaceflight(second.pk)
+        )
+        response = self.client.post(
+            ORDERS_URL,
+            {
+                "tickets": [
+                    {"row": 1, "seat": 1, "spaceflight": first.pk},
+                    {"row": 1, "seat": 1, "spaceflight": second.pk},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {"tickets": "Book spaceflights kept on different shards separately."},
+        )
+        for using in self.shards:
+            self.assertFalse(Ticket.objects.using(using).exists())
+
+    def test_list_merges_the_shards(self):
+        order_ids = [
+            self.book(spaceflight, (1, 1)) for spaceflight in self.spaceflights[:5]
+        ]
+        for using in self.shards:
+            Order.objects.using(using).update(
+                created_at=datetime(2030, 1, 1, tzinfo=timezone.utc)
+            )
+
+        url, pages = f"{ORDERS_URL}?page_size=2", []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item["id"] for item in response.data["results"]])
+            url = response.data["next"]
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([pk for page in pages for pk in page], sorted(order_ids))
+
+    def test_detail_and_delete(self):
+        spaceflight = self.spaceflights[1]
+        order_id = self.book(spaceflight, (2, 1), (2, 2))
+
+        response = self.client.get(f"{ORDERS_URL}{order_id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["tickets"]), 2)
+        unknown = order_id + len(self.shards) * first_id(self.shards[0])
+        self.assertEqual(self.client.get(f"{ORDERS_URL}{unknown}/").status_code, 404)
+
+        response = self.client.delete(f"{ORDERS_URL}{order_id}/")
+        self.assertEqual(response.status_code, 204)
+        using = shard_for_spaceflight(spaceflight.pk)
+        self.assertFalse(Order.objects.using(using).filter(pk=order_id).exists())
+        self.assertFalse(Ticket.objects.using(using).exists())
+        spaceflight.refresh_from_db()
+        self.assertEqual(spaceflight.tickets_sold, 0)
+
+    def test_rebuild_tickets_sold_counts_every_shard(self):
+        for spaceflight in self.spaceflights[:3]:
+            self.book(spaceflight, (1, 1), (1, 2), (1, 3))
+        call_command("rebuild_tickets_sold", "--verify", stdout=StringIO())
+
+        Spaceflight.objects.update(tickets_sold=0)
+        with self.assertRaisesMessage(CommandError, "3 counters are out of date."):
+            call_command("rebuild_tickets_sold", "--verify", stdout=StringIO())
+        call_command("rebuild_tickets_sold", stdout=StringIO())
+        call_command("rebuild_tickets_sold", "--verify", stdout=StringIO())
+        self.assertEqual(
+            list(
+                Spaceflight.objects.order_by("pk").values_list(
+                    "tickets_sold", flat=True
+                )
+            ),
+            [3, 3, 3, 0, 0, 0, 0],
+        )
+
+
+class AnalyzeEndpointsTests(SpaceportTestCase):
+    def test_reports_query_plans_and_keeps_the_shared_cache(self):
+        Order.objects.create(user=self.user)
+        cache.set("shared", "kept")
+        output = f"{self.state_dir}/report.json"
+        stdout = StringIO()
+        call_command("analyze_endpoints", "--output", output, stdout=stdout)
+
+        with open(output) as report_file:
+            report = json.load(report_file)
+        endpoints = {endpoint["name"]: endpoint for endpoint in report["endpoints"]}
+        self.assertIn(f"Analyzed {len(endpoints)} endpoints", stdout.getvalue())
+        spaceflights = endpoints["spaceport:spaceflight-list"]
+        self.assertEqual(spaceflights["status"], 200)
+        self.assertTrue(spaceflights["statements"])
+        for statement in spaceflights["statements"]:
+            self.assertTrue(statement["plan"])
+            self.assertNotRegex(statement["sql"], r"\d{4}-\d{2}-\d{2}")
+        self.assertEqual(cache.get("shared"), "kept")
+
+
+class DistanceMatrixTests(SpaceportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ids = [spaceport.pk for spaceport in self.spaceports]
+
+    def test_shortest_distances(self):
+        first, second, third = self.ids
+        matrix = DistanceMatrix.load_from_db()
+        self.assertEqual(list(matrix.spaceports), sorted(self.ids))
+        self.assertEqual(
+            matrix.lookup(
+                [
+                    (first, second),
+                    (first, third),
+                    (second, third),
+                    (first, first),
+                    (third, first),
+                    (first, max(self.ids) + 1),
+                ]
+            ),
+            [100, 350, 250, 0, None, None],
+        )
+
+    def test_saves_the_ids_above_the_distances(self):
+        path = settings.SPACEPORT_DISTANCE_MATRIX
+        DistanceMatrix.load_from_db().save(path)
+
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+        data = np.load(path)
+        self.assertEqual(data.shape, (4, 3))
+        self.assertEqual(list(data[0]), sorted(self.ids))
+        self.assertEqual(DistanceMatrix.open(path).lookup([self.ids[:2]]), [100])
+
+    def test_rebuilt_when_a_route_is_saved(self):
+        first, _, third = self.ids
+        self.assertEqual(get_distance_matrix().lookup([(third, first)]), [None])
+
+        with mock.patch.object(
+            distances, "schedule_rebuild", side_effect=distances.rebuild
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                Route.objects.create(
+                    source=self.spaceports[2],
+                    destination=self.spaceports[0],
+                    distance=500,
+                )
+        self.assertEqual(get_distance_matrix().lookup([(third, first)]), [500])
+
+
+@skipUnless(settings.SPACEPORT_REPLICAS, "Set SPACEPORT_REPLICA_DBS.")
+class ReplicaTests(IsolatedStateMixin, TransactionTestCase):
+    """Replicas mirror default on separate connections: data is committed."""
+
+    databases = {"default", *settings.SPACEPORT_REPLICAS}
+    replicas = settings.SPACEPORT_REPLICAS
+
+    def setUp(self):
+        # The commit of a route would rebuild distances in another thread.
+        self.enterContext(mock.patch.object(distances, "schedule_rebuild"))
+        mars = Planet.objects.create(planet_name="Mars")
+        route = Route.objects.create(
+            source=Spaceport.objects.create(spaceport_name="A", closest_planet=mars),
+            destination=Spaceport.objects.create(
+                spaceport_name="B", closest_planet=mars
+            ),
+            distance=100,
+        )
+        self.spaceflight = Spaceflight.objects.create(
+            route=route,
+            spaceship=Spaceship.objects.create(
+                spaceship_name="Ares",
+                rows=4,
+                seats_in_row=3,
+                spaceship_types=SpaceshipType.objects.create(
+                    spaceship_type_name="Clipper"
+                ),
+            ),
+            departure_time=DEPARTURE,
+            arrival_time=DEPARTURE + timedelta(hours=5),
+        )
+        users = get_user_model().objects
+        self.writer = users.create_user("writer@spaceport.com", "pass12345")
+        self.reader = users.create_user("reader@spaceport.com", "pass12345")
+
+    def list_spaceflights(self, user):
+        """The response, and which databases read the spaceflight table."""
+        forget_all_spaceflights()
+        client = APIClient()
+        client.force_authenticate(user)
+        with ExitStack() as stack:
+            captured = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in ("default", *self.replicas)
+            }
+            response = client.get(SPACEFLIGHTS_URL)
+        self.assertEqual(response.status_code, 200)
+        read_by = {
+            "replica" if alias in self.replicas else alias
+            for alias, queries in captured.items()
+            if any(
+                '"spaceport_spaceflight"' in query["sql"]
+                for query in queries.captured_queries
+            )
+        }
+        return response, read_by
+
+    def test_lists_are_read_from_a_replica(self):
+        response, read_by = self.list_spaceflights(self.reader)
+        self.assertEqual(read_by, {"replica"})
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]], [self.spaceflight.pk]
+        )
+
+    def test_writer_reads_from_the_primary_until_replicas_catch_up(self):
+        client = APIClient()
+        client.force_authenticate(self.writer)
+        ticket = {"row": 1, "seat": 1, "spaceflight": self.spaceflight.pk}
+        response = client.post(ORDERS_URL, {"tickets": [ticket]}, format="json")
+        self.assertEqual(response.status_code, 201)
+
+        response, read_by = self.list_spaceflights(self.writer)
+        self.assertEqual(read_by, {"default"})
+        self.assertEqual(response.data["results"][0]["tickets_available"], 11)
+        self.assertEqual(self.list_spaceflights(self.reader)[1], {"replica"})
+
+    def test_a_write_moves_the_rest_of_the_request_to_the_primary(self):
+        read_from = []
+
+        def view(request):
+            replicas._use_replica.set(True)
+            read_from.append(router.db_for_read(Spaceflight))
+            Planet.objects.create(planet_name="Venus")
+            read_from.append(router.db_for_read(Spaceflight))
+            return HttpResponse()
+
+        request = RequestFactory().get(SPACEFLIGHTS_URL)
+        context = contextvars.copy_context()
+        context.run(replicas.PrimaryPinMiddleware(view), request)
+        self.assertIn(read_from[0], self.replicas)
+        self.assertEqual(read_from[1], "default")
+
+    def test_sync_replicas_copies_the_primary(self):
+        # Mirrors share the test database, so sync into files instead.
+        mirrors = {alias: connections[alias] for alias in self.replicas}
+        for alias in self.replicas:
+            copy = connections.create_connection(alias)
+            copy.settings_dict = {
+                **copy.settings_dict,
+                "NAME": f"{self.state_dir}/{alias}.sqlite3",
+            }
+            connections[alias] = copy
+        stdout = StringIO()
+        try:
+            call_command("sync_replicas", stdout=stdout)
+        finally:
+            for alias, mirror in mirrors.items():
+                connections[alias].close()
+                connections[alias] = mirror
+
+        for alias in self.replicas:
+            self.assertIn(f"Synced {alias}", stdout.getvalue())
+            with closing(sqlite3.connect(f"{self.state_dir}/{alias}.sqlite3")) as copy:
+                (spaceflights,) = copy.execute(
+                    "SELECT COUNT(*) FROM spaceport_spaceflight"
+                ).fetchone()
+            self.assertEqual(spaceflights, 1)
+
+
+class ListQueryCountTests(SpaceportTestCase):
+    """Every list page takes as many queries for one row as for several."""
+
+    urls = (
+        "/api/spaceport/spaceship_types/",
+        "/api/spaceport/crews/",
+        "/api/spaceport/spaceships/",
+        "/api/spaceport/planets/",
+        "/api/spaceport/spaceports/",
+        ROUTES_URL,
+        SPACEFLIGHTS_URL,
+        ORDERS_URL,
+        "/api/spaceport/bookings/",
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(5):
+            spaceship = Spaceship.objects.create(
+                spaceship_name=f"Spaceship {number}",
+                rows=2,
+                seats_in_row=2,
+                spaceship_types=SpaceshipType.objects.create(
+                    spaceship_type_name=f"Type {number}"
+                ),
+            )
+            spaceship.crews.add(
+                Crew.objects.create(first_name="Crew", last_name=f"Member {number}"),
+                *Crew.objects.all()[:1],
+            )
+            planet = Planet.objects.create(planet_name=f"Planet {number}")
+            source = Spaceport.objects.create(
+                spaceport_name=f"Spaceport {number}", closest_planet=planet
+            )
+            Route.objects.create(
+                source=source, destination=cls.spaceports[0], distance=100
+            )
+            spaceflight = cls.spaceflights[number]
+            order = Order.objects.create(user=cls.user)
+            Ticket.objects.bulk_create(
+                Ticket(row=1, seat=seat, spaceflight=spaceflight, order=order)
+                for seat in (1, 2)
+            )
+            BookingRequest.objects.create(
+                user=cls.user,
+                spaceflight=spaceflight,
+                payload={"tickets": []},
+            )
+
+    def get_page(self, url, page_size):
+        # Only the keyset paginated lists take a page_size parameter.
+        with mock.patch.object(PageNumberPagination, "page_size", page_size):
+            response = self.client.get(f"{url}?page_size={page_size}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), page_size)
+
+    def test_queries_do_not_grow_with_the_page_size(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as one:
+                    self.get_page(url, 1)
+                for page_size in (2, 5):
+                    with self.assertNumQueries(len(one)):
+                        self.get_page(url, page_size)
+
+
+class ConditionalGetTests(SpaceportTestCase):
+    url = "/api/spaceport/planets/"
+
+    def test_stamps_exist_after_migrate(self):
+        self.assertEqual(
+            set(VersionStamp.objects.values_list("key", flat=True)),
+            {model._meta.label_lower for model in VERSIONED_MODELS},
+        )
+
+    def test_matching_etag_gets_304(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.headers["Last-Modified"])
+        etag = first.headers["ETag"]
+
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["ETag"], etag)
+
+    def test_write_gives_a_new_etag(self):
+        etag = self.client.get(self.url).headers["ETag"]
+        Planet.objects.create(planet_name="Jupiter")
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.data["count"], 3)
+
+    def test_last_modified_alone_is_not_a_validator(self):
+        last_modified = self.client.get(self.url).headers["Last-Modified"]
+        Planet.objects.create(planet_name="Jupiter")
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 3)
+
+    def test_reads_only(self):
+        VersionStamp.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get(self.url)
+            again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first.headers["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertFalse(VersionStamp.objects.exists())
+        self.assertFalse(
+            [
+                query["sql"]
+                for query in queries.captured_queries
+                if not query["sql"].startswith("SELECT")
+            ]
+        )
+
+
+class SeatMapTests(SpaceportTestCase):
+    def seat_map(self, *taken):
+        seat_map = SeatMap(4, 3)
+        for row, seat in taken:
+            seat_map.add(row, seat)
+        return seat_map
+
+    def test_bits(self):
+        seat_map = self.seat_map((1, 1), (1, 2), (4, 3), (5, 1), (1, 4))
+        self.assertEqual(seat_map.bits, bytearray([0b11, 0b1000]))
+        self.assertEqual(seat_map.taken, 3)
+        self.assertIn((4, 3), seat_map)
+        self.assertNotIn((2, 2), seat_map)
+        self.assertNotIn((5, 1), seat_map)
+        self.assertEqual(seat_map.row_mask(1), 0b011)
+        self.assertEqual(seat_map.row_mask(3), 0)
+        self.assertEqual(seat_map.row_mask(4), 0b100)
+
+    def test_ranges(self):
+        self.assertEqual(
+            self.seat_map((1, 1), (1, 2), (4, 3)).ranges(), [[1, 1, 2], [4, 3, 3]]
+        )
+        # Runs stop at the end of a row.
+        self.assertEqual(
+            self.seat_map((1, 3), (2, 1), (2, 2)).ranges(), [[1, 3, 3], [2, 1, 2]]
+        )
+        self.assertEqual(self.seat_map().ranges(), [])
+
+    def test_base64(self):
+        seat_map = self.seat_map((1, 1), (1, 2), (4, 3))
+        self.assertEqual(seat_map.to_base64(), "Awg=")
+        copy = SeatMap(4, 3, base64.b64decode(seat_map.to_base64()))
+        self.assertEqual(copy.ranges(), seat_map.ranges())
+
+    def test_best_block(self):
+        seat_map = self.seat_map((1, 1), (1, 2), (4, 3))
+        self.assertEqual(seat_map.best_block(2), (2, 1))
+        self.assertEqual(seat_map.best_block(2, excluded=[(2, 1)]), (2, 2))
+        self.assertEqual(seat_map.best_block(3, excluded=[(2, 2)]), (3, 1))
+        self.assertIsNone(seat_map.best_block(3, excluded=[(2, 2), (3, 2)]))
+        self.assertIsNone(seat_map.best_block(4))
+        self.assertIsNone(
+            self.seat_map(*((row, 2) for row in range(1, 5))).best_block(2)
+        )
+
+    def test_cached_map_is_rebuilt_after_a_sale(self):
+        spaceflight = Spaceflight.objects.select_related("spaceship").get(
+            pk=self.spaceflights[0].pk
+        )
+        self.assertEqual(get_seat_map(spaceflight).taken, 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_seat_map(spaceflight).taken, 0)
+
+        Ticket.objects.create(
+            row=2,
+            seat=3,
+            spaceflight=spaceflight,
+            order=Order.objects.create(user=self.user),
+        )
+        spaceflight.refresh_from_db(fields=["tickets_sold"])
+        self.assertIn((2, 3), get_seat_map(spaceflight))
+
+    def test_cached_map_is_rebuilt_for_a_new_layout(self):
+        spaceflight = Spaceflight.objects.select_related("spaceship").get(
+            pk=self.spaceflights[0].pk
+        )
+        get_seat_map(spaceflight)
+        spaceflight.spaceship.rows = 5
+        seat_map = get_seat_map(spaceflight)
+        self.assertEqual((seat_map.rows, len(seat_map.bits)), (5, 2))
+
+
+class ThrottleStoreTests(SpaceportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = f"{self.state_dir}/gcra.sqlite3"
+        self.store = SQLiteThrottleStore(self.path)
+        self.store.connection.execute("DELETE FROM throttle")
+
+    def test_burst_up_to_the_limit(self):
+        # 3 per minute: one request every 20 seconds, all 3 at once.
+        for _ in range(3):
+            self.assertEqual(self.store.hit("key", 3, 60, 1000.0), (True, None))
+        self.assertEqual(self.store.hit("key", 3, 60, 1000.0), (False, 20.0))
+        self.assertEqual(self.store.hit("key", 3, 60, 1015.0), (False, 5.0))
+        self.assertEqual(self.store.hit("other", 3, 60, 1015.0), (True, None))
+
+    def test_recovers_one_request_per_emission_interval(self):
+        for _ in range(3):
+            self.store.hit("key", 3, 60, 1000.0)
+        self.assertEqual(self.store.hit("key", 3, 60, 1020.0), (True, None))
+        self.assertEqual(self.store.hit("key", 3, 60, 1020.0), (False, 20.0))
+        # A full period later the whole burst is back.
+        for _ in range(3):
+            self.assertEqual(self.store.hit("key", 3, 60, 1100.0), (True, None))
+
+    def test_refused_requests_do_not_count(self):
+        for _ in range(10):
+            self.store.hit("key", 3, 60, 1000.0)
+        self.assertEqual(self.store.hit("key", 3, 60, 1020.0), (True, None))
+
+    def test_stores_on_one_file_share_state(self):
+        other = SQLiteThrottleStore(self.path)
+        self.assertIsNot(other.connection, self.store.connection)
+        self.store.hit("key", 2, 60, 1000.0)
+        other.hit("key", 2, 60, 1000.0)
+        self.assertEqual(self.store.hit("key", 2, 60, 1000.0), (False, 30.0))
+        self.assertEqual(other.hit("key", 2, 60, 1000.0), (False, 30.0))
+
+    def test_throttle_waits_as_the_store_says(self):
+        throttle = ScopedThrottle()
+        view = mock.Mock(throttle_scope="orders")
+        request = mock.Mock(user=self.user)
+        with mock.patch.object(ScopedThrottle, "timer", return_value=1000.0):
+            for _ in range(20):
+                self.assertTrue(throttle.allow_request(request, view))
+            self.assertFalse(throttle.allow_request(request, view))
+        self.assertEqual(throttle.wait(), 3.0)
+
+
+class TicketsSoldTests(SpaceportTestCase):
+    def sold(self):
+        return list(
+            Spaceflight.objects.filter(
+                pk__in=[spaceflight.pk for spaceflight in self.spaceflights[:3]]
+            )
+            .order_by("pk")
+            .values_list("tickets_sold", flat=True)
+        )
+
+    def ticket(self, spaceflight, row=1, seat=1, order=None):
+        return Ticket.objects.create(
+            row=row,
+            seat=seat,
+            spaceflight=spaceflight,
+            order=order or Order.objects.create(user=self.user),
+        )
+
+    def test_create_and_delete(self):
+        ticket = self.ticket(self.spaceflights[0])
+        self.ticket(self.spaceflights[0], seat=2)
+        self.assertEqual(self.sold(), [2, 0, 0])
+        ticket.delete()
+        self.assertEqual(self.sold(), [1, 0, 0])
+
+    def test_order_with_many_tickets(self):
+        first, second = self.spaceflights[:2]
+        response = self.client.post(
+            ORDERS_URL,
+            {
+                "tickets": [
+                    {"row": 1, "seat": 1, "spaceflight": first.pk},
+                    {"row": 1, "seat": 2, "spaceflight": first.pk},
+                    {"row": 1, "seat": 1, "spaceflight": second.pk},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.sold(), [2, 1, 0])
+
+        Order.objects.get(pk=response.data["id"]).delete()
+        self.assertEqual(self.sold(), [0, 0, 0])
+
+    def test_move_to_another_spaceflight(self):
+        self.ticket(self.spaceflights[0])
+        ticket = Ticket.objects.get()
+        ticket.spaceflight = self.spaceflights[1]
+        ticket.save()
+        self.assertEqual(self.sold(), [0, 1, 0])
+        ticket.spaceflight = self.spaceflights[2]
+        ticket.save()
+        self.assertEqual(self.sold(), [0, 0, 1])
+        ticket.save()
+        self.assertEqual(self.sold(), [0, 0, 1])
+
+    def test_rebuild_reports_and_repairs_drift(self):
+        self.ticket(self.spaceflights[0])
+        self.ticket(self.spaceflights[1])
+        Spaceflight.objects.filter(pk=self.spaceflights[1].pk).update(tickets_sold=5)
+
+        stdout = StringIO()
+        with self.assertRaisesMessage(CommandError, "1 counters are out of date."):
+            call_command("rebuild_tickets_sold", "--verify", stdout=stdout)
+        self.assertIn(
+            f"Spaceflight {self.spaceflights[1].pk}: tickets_sold should be 1",
+            stdout.getvalue(),
+        )
+        self.assertEqual(self.sold(), [1, 5, 0])
+
+        stdout = StringIO()
+        call_command("rebuild_tickets_sold", stdout=stdout)
+        self.assertIn("1 out of date, fixed.", stdout.getvalue())
+        self.assertEqual(self.sold(), [1, 1, 0])
+        call_command("rebuild_tickets_sold", "--verify", stdout=StringIO())
+
+
+class RouteGraphTests(SpaceportTestCase):
+    # (route id, source, destination, distance)
+    edges = (
+        (1, 1, 2, 1),
+        (2, 2, 3, 1),
+        (3, 3, 4, 1),
+        (4, 1, 4, 10),
+        (5, 1, 3, 5),
+        (6, 2, 4, 4),
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.graph = RouteGraph(self.edges)
+
+    def test_dijkstra(self):
+        self.assertEqual(
+            self.graph.shortest_path(1, 4), Path(3, [1, 2, 3, 4], [1, 2, 3])
+        )
+        self.assertEqual(
+            self.graph.shortest_path(1, 4, banned_routes={1}),
+            Path(6, [1, 3, 4], [5, 3]),
+        )
+        self.assertEqual(
+            self.graph.shortest_path(1, 4, banned_spaceports={2, 3}),
+            Path(10, [1, 4], [4]),
+        )
+        self.assertEqual(self.graph.shortest_path(1, 1), Path(0, [1], []))
+        self.assertIsNone(self.graph.shortest_path(4, 1))
+
+    def test_k_shortest_paths(self):
+        paths = self.graph.k_shortest_paths(1, 4, 10)
+        self.assertEqual(
+            [(path.distance, path.routes) for path in paths],
+            [(3, [1, 2, 3]), (5, [1, 6]), (6, [5, 3]), (10, [4])],
+        )
+        self.assertEqual(self.graph.k_shortest_paths(1, 4, 2), paths[:2])
+        self.assertEqual(self.graph.k_shortest_paths(4, 1, 3), [])
+
+    def test_max_routes(self):
+        self.assertEqual(
+            self.graph.shortest_path(1, 4, max_routes=2), Path(5, [1, 2, 4], [1, 6])
+        )
+        self.assertEqual(
+            [
+                path.routes
+                for path in self.graph.k_shortest_paths(1, 4, 10, max_routes=2)
+            ],
+            [[1, 6], [5, 3], [4]],
+        )
+        self.assertEqual(
+            self.graph.k_shortest_paths(1, 4, 10, max_routes=1),
+            [Path(10, [1, 4], [4])],
+        )
+        self.assertIsNone(self.graph.shortest_path(1, 4, max_routes=0))
+
+    def test_plan_with_max_stops(self):
+        first, _, third = self.spaceports
+        url = f"{ROUTES_URL}plan/?from={first.pk}&to={third.pk}&k=5"
+        response = self.client.get(url)
+        self.assertEqual(
+            [path["distance"] for path in response.data["paths"]], [350, 400]
+        )
+        response = self.client.get(f"{url}&max_stops=0")
+        self.assertEqual(
+            response.data["paths"],
+            [
+                {
+                    "distance": 400,
+                    "spaceports": [first.pk, third.pk],
+                    "routes": [self.routes[2].pk],
+                }
+            ],
+        )
+
+    def test_saving_a_route_bumps_the_graph_version(self):
+        first, _, third = self.spaceports
+        get_route_graph()
+        version = cache.get(routing.VERSION_KEY) or 0
+        with self.captureOnCommitCallbacks(execute=True):
+            route = Route.objects.create(source=third, destination=first, distance=50)
+        self.assertEqual(cache.get(routing.VERSION_KEY), version + 1)
+        self.assertEqual(
+            get_route_graph().shortest_path(third.pk, first.pk).routes, [route.pk]
+        )
+
+    def test_reloads_after_a_bump_elsewhere(self):
+        first, second, _ = self.spaceports
+        self.assertEqual(
+            get_route_graph().shortest_path(first.pk, second.pk).distance, 100
+        )
+        Route.objects.filter(pk=self.routes[0].pk).update(distance=20)
+        cache.set(routing.VERSION_KEY, 1000, None)
+        self.assertEqual(
+            get_route_graph().shortest_path(first.pk, second.pk).distance, 20
+        )
+
+    def test_negative_distance_is_refused(self):
+        first, second, _ = self.spaceports
+        serializer = RouteSerializer(
+            data={"source": first.pk, "destination": second.pk, "distance": -1}
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("distance", serializer.errors)
+
+
+class ItineraryTests(SpaceportTestCase):
+    ORIGIN, HUB, TARGET = 1, 2, 3
+
+    @staticmethod
+    def at(hours, minutes=0):
+        return DEPARTURE + timedelta(hours=hours, minutes=minutes)
+
+    def setUp(self):
+        super().setUp()
+        origin, hub, target = self.ORIGIN, self.HUB, self.TARGET
+        # Sorted by departure, as load_connections returns them.
+        self.timetable = [
+            Connection(10, self.at(0), self.at(2), origin, hub),
+            Connection(11, self.at(1), self.at(6), origin, target),
+            Connection(12, self.at(2, 20), self.at(4), hub, target),
+            Connection(13, self.at(3), self.at(5), hub, target),
+            Connection(14, self.at(7), self.at(9), target, origin),
+        ]
+
+    def search(self, min_layover=30, max_layover=24 * 60, limit=5):
+        return [
+            [leg.spaceflight for leg in legs]
+            for legs in find_itineraries(
+                self.timetable,
+                self.ORIGIN,
+                self.TARGET,
+                timedelta(minutes=min_layover),
+                timedelta(minutes=max_layover),
+                limit,
+            )
+        ]
+
+    def test_minimum_layover(self):
+        # The 20 minute change at the hub is too short for 30 minutes.
+        self.assertEqual(self.search(), [[10, 13], [11]])
+        self.assertEqual(self.search(min_layover=10), [[10, 12], [10, 13], [11]])
+
+    def test_ordered_by_arrival_and_limited(self):
+        self.assertEqual(self.search(min_layover=0, limit=2), [[10, 12], [10, 13]])
+
+    def test_maximum_layover(self):
+        self.assertEqual(self.search(max_layover=45), [[11]])
+
+    def test_missed_connection(self):
+        origin, hub, target = self.ORIGIN, self.HUB, self.TARGET
+        self.timetable = [
+            Connection(10, self.at(0), self.at(2), origin, hub),
+            Connection(12, self.at(1), self.at(3), hub, target),
+        ]
+        self.assertEqual(self.search(min_layover=0), [])
+
+    def test_endpoint(self):
+        first, _, third = self.spaceports
+        flights = [spaceflight.pk for spaceflight in self.spaceflights]
+        url = (
+            f"{SPACEFLIGHTS_URL}itineraries/?from={first.pk}&to={third.pk}"
+            f"&depart_after=2030-01-01T00:00:00Z&arrive_by=2030-01-03T00:00:00Z"
+        )
+
+        def legs(response):
+            self.assertEqual(response.status_code, 200)
+            return [
+                [leg["spaceflight"] for leg in itinerary["legs"]]
+                for itinerary in response.data["itineraries"]
+            ]
+
+        self.assertEqual(
+            legs(self.client.get(url)),
+            [
+                [flights[0], flights[1]],
+                [flights[2]],
+                [flights[3], flights[4]],
+                [flights[5]],
+            ],
+        )
+        # Each hour long change is missed, the overnight one from flight 0 is not.
+        self.assertEqual(
+            legs(self.client.get(f"{url}&min_layover=90")),
+            [[flights[2]], [flights[0], flights[4]], [flights[5]]],
+        )
+        response = self.client.get(f"{url}&min_layover=90&max_layover=60")
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsTests(SpaceportTestCase):
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        selects = [
+            query["sql"]
+            for query in queries.captured_queries
+            if 'FROM "spaceport_route"' in query["sql"] and "COUNT(" not in query["sql"]
+        ]
+        self.assertEqual(len(selects), 1)
+        return response.data, selects[0]
+
+    def test_fields_limit_keys_and_columns(self):
+        data, sql = self.get(f"{ROUTES_URL}?fields=distance")
+        self.assertEqual(data["results"][0], {"id": self.routes[0].pk, "distance": 100})
+        self.assertIn('"spaceport_route"."distance"', sql)
+        self.assertNotIn("spaceport_spaceport", sql)
+
+        data, sql = self.get(f"{ROUTES_URL}{self.routes[0].pk}/?fields=id")
+        self.assertEqual(data, {"id": self.routes[0].pk})
+        self.assertNotIn('"spaceport_route"."distance"', sql)
+
+    def test_expand_nests_objects(self):
+        first, second, _ = self.spaceports
+        data, _ = self.get(f"{ROUTES_URL}?expand=source&fields=source")
+        self.assertEqual(
+            data["results"][0],
+            {
+                "id": self.routes[0].pk,
+                "source": {
+                    "id": first.pk,
+                    "spaceport_name": "Olympus",
+                    "planet": "Mars",
+                },
+            },
+        )
+        data, _ = self.get(f"{ROUTES_URL}{self.routes[0].pk}/?expand=destination")
+        self.assertEqual(
+            data["destination"],
+            {"id": second.pk, "spaceport_name": "Tharsis", "planet": "Mars"},
+        )
+
+    def test_unknown_fields_are_rejected(self):
+        for query, parameter in (
+            ("fields=distance,speed", "fields"),
+            ("expand=spaceship", "expand"),
+            ("expand=source&fields=source,planet", "fields"),
+        ):
+            with self.subTest(query):
+                response = self.client.get(f"{ROUTES_URL}?{query}")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(parameter, response.data)
+
+
+class SQLitePragmaTests(SpaceportTestCase):
+    def read_pragmas(self, profile, *names):
+        copy = connections.create_connection("default")
+        copy.settings_dict = {
+            **copy.settings_dict,
+            "NAME": f"{self.state_dir}/{profile}.sqlite3",
+        }
+        pragmas = settings.SPACEPORT_SQLITE_PROFILES[profile]
+        try:
+            with override_settings(SPACEPORT_SQLITE_PRAGMAS=pragmas):
+                with copy.cursor() as cursor:
+                    values = {}
+                    for name in names:
+                        cursor.execute(f"PRAGMA {name}")
+                        (values[name],) = cursor.fetchone()
+        finally:
+            copy.close()
+        return values
+
+    def test_production_pragmas_apply_to_new_connections(self):
+        self.assertEqual(
+            self.read_pragmas(
+                "production", "journal_mode", "synchronous", "busy_timeout"
+            ),
+            # synchronous reads back as a number, 1 for NORMAL.
+            {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000},
+        )
+
+    def test_development_keeps_sqlite_defaults(self):
+        self.assertEqual(
+            self.read_pragmas("development", "journal_mode", "synchronous"),
+            {"journal_mode": "delete", "synchronous": 2},
+        )
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+
+from django.conf import settings
+from rest_framework.throttling import (
+    AnonRateThrottle,
+    ScopedRateThrottle,
+    SimpleRateThrottle,
+    UserRateThrottle,
+)
+
+PURGE_EVERY = 1000
+
+
+class SQLiteThrottleStore:
+    """
+    GCRA state shared by every worker on the host through one SQLite file:
+    a single "theoretical arrival time" per throttle key.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        self._hits = 0
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS throttle "
+                "(key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID"
+            )
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def hit(self, key, limit, period, now):
+        """
+        Records a request for ``key`` at ``now`` unless it would exceed
+        ``limit`` requests per ``period`` seconds. Returns ``(allowed, wait)``.
+        """
+        interval = period / limit
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tat FROM throttle WHERE key = ?", (key,)
+            ).fetchone()
+            tat = max(row[0], now) if row else now
+            allowed = tat + interval - now <= period
+            if allowed:
+                connection.execute(
+                    "INSERT INTO throttle (key, tat) VALUES (?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET tat = excluded.tat",
+                    (key, tat + interval),
+                )
+            self._hits += 1
+            if self._hits % PURGE_EVERY == 0:
+                connection.execute("DELETE FROM throttle WHERE tat < ?", (now,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed, None if allowed else tat + interval - period - now
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_throttle_store():
+    global _store
+
+    if _store is None or _store.path != str(settings.SPACEPORT_THROTTLE_DB):
+        with _store_lock:
+            if _store is None or _store.path != str(settings.SPACEPORT_THROTTLE_DB):
+                _store = SQLiteThrottleStore(settings.SPACEPORT_THROTTLE_DB)
+    return _store
+
+
+class GCRARateThrottle(SimpleRateThrottle):
+    """
+    Replaces the cached timestamp list of ``SimpleRateThrottle`` with one
+    GCRA timestamp per key in the shared ``SQLiteThrottleStore``, so limits
+    hold across workers and a check costs the same at any rate.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        allowed, self._wait = get_throttle_store().hit(
+            self.key, self.num_requests, self.duration, self.timer()
+        )
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class AnonThrottle(AnonRateThrottle, GCRARateThrottle):
+    pass
+
+
+class UserThrottle(UserRateThrottle, GCRARateThrottle):
+    pass
+
+
+class ScopedThrottle(ScopedRateThrottle, GCRARateThrottle):
+    """Rates per ``throttle_scope`` of the view, e.g. for order creation."""
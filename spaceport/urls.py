@@ -8,6 +8,8 @@ from spaceport.views import (
     PlanetViewSet,
     SpaceportViewSet,
     RouteViewSet,
+    BookingRequestViewSet,
+    ExportViewSet,
 )
 from rest_framework import routers
 
@@ -21,6 +23,8 @@ router.register("spaceports", SpaceportViewSet)
 router.register("routes", RouteViewSet)
 router.register("spaceflights", SpaceflightViewSet)
 router.register("orders", OrderViewSet)
+router.register("bookings", BookingRequestViewSet, basename="booking")
+router.register("exports", ExportViewSet, basename="export")
 
 urlpatterns = [path("", include(router.urls))]
 
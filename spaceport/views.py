@@ -1,8 +1,9 @@
-from django.db.models import Count, F
+from functools import partial
+
+from django.conf import settings
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import viewsets, status, mixins
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 
@@ -16,7 +17,19 @@ from spaceport.models import (
     Planet,
     Spaceport,
     Route,
+    BookingRequest,
+)
+from spaceport.bookings import QueuedCreateMixin, queue_order
+from spaceport.idempotency import IdempotentCreateMixin, idempotent
+from spaceport.optimizer import QuerysetOptimizerMixin
+from spaceport.replicas import ReplicaReadMixin
+from spaceport.pagination import (
+    OrderPagination,
+    RoutePagination,
+    SpaceflightPagination,
 )
+from spaceport.throttling import ScopedThrottle
+from spaceport.versioning import ConditionalGetMixin
 from spaceport.permissions import IsAdminOrIfAuthenticatedReadOnly
 
 from spaceport.serializers import (
@@ -32,13 +45,41 @@ from spaceport.serializers import (
     RouteSerializer,
     RouteListSerializer,
     SpaceportListSerializer,
+    SeatMapSerializer,
+    SeatHoldSerializer,
+    SeatHoldReleaseSerializer,
+    BestSeatsSerializer,
+    BookingRequestSerializer,
+    SpaceflightFilterSerializer,
+    RoutePlanSerializer,
+    ItinerarySearchSerializer,
+    DistanceLookupSerializer,
+    ExportSerializer,
 )
+from spaceport.distances import get_distance_matrix
+from spaceport.exports import EXPORTS
+from spaceport.fastlist import FastListMixin
+from spaceport.filters import filter_spaceflights
+from spaceport.flightcache import SpaceflightCacheMixin
+from spaceport.itineraries import find_itineraries, load_connections
+from spaceport.holds import (
+    SeatsUnavailable,
+    active_holds,
+    place_holds,
+    release_holds,
+)
+from spaceport.routing import get_route_graph
+from spaceport.seatmap import get_seat_map
+from spaceport.sharding import ShardedQuerySet, shard_for_id, ticket_databases
 
 
-class SpaceshipTypeViewSet(viewsets.ModelViewSet):
+class SpaceshipTypeViewSet(
+    ReplicaReadMixin, ConditionalGetMixin, QuerysetOptimizerMixin, viewsets.ModelViewSet
+):
     queryset = SpaceshipType.objects.all()
     serializer_class = SpaceshipTypeSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    versioned_models = (SpaceshipType,)
 
     def get_permissions(self):
         if self.action in (
@@ -50,10 +91,13 @@ class SpaceshipTypeViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
-class CrewViewSet(viewsets.ModelViewSet):
+class CrewViewSet(
+    ReplicaReadMixin, ConditionalGetMixin, QuerysetOptimizerMixin, viewsets.ModelViewSet
+):
     queryset = Crew.objects.all()
     serializer_class = CrewSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    versioned_models = (Crew,)
 
     def get_permissions(self):
         if self.action in (
@@ -65,13 +109,19 @@ class CrewViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
-class PlanetViewSet(viewsets.ModelViewSet):
+class PlanetViewSet(
+    ReplicaReadMixin, ConditionalGetMixin, QuerysetOptimizerMixin, viewsets.ModelViewSet
+):
     queryset = Planet.objects.all()
     serializer_class = PlanetSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    versioned_models = (Planet,)
 
 
 class SpaceportViewSet(
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    QuerysetOptimizerMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
@@ -80,9 +130,13 @@ class SpaceportViewSet(
     queryset = Spaceport.objects.all()
     serializer_class = SpaceportListSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    versioned_models = (Spaceport, Planet)
 
 
 class RouteViewSet(
+    ReplicaReadMixin,
+    FastListMixin,
+    QuerysetOptimizerMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
@@ -91,6 +145,8 @@ class RouteViewSet(
     queryset = Route.objects.all()
     serializer_class = RouteSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    pagination_class = RoutePagination
+    fast_list = True
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -100,8 +156,43 @@ class RouteViewSet(
 
         return RouteSerializer
 
+    @extend_schema(parameters=[RoutePlanSerializer])
+    @action(methods=["GET"], detail=False, url_path="plan")
+    def plan(self, request):
+        """Endpoint for the shortest multi-route paths between two spaceports"""
+        params = RoutePlanSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        max_stops = params.validated_data.get("max_stops")
+        paths = get_route_graph().k_shortest_paths(
+            params.validated_data["from"],
+            params.validated_data["to"],
+            params.validated_data["k"],
+            max_routes=None if max_stops is None else max_stops + 1,
+        )
+        return Response(
+            {"paths": [path._asdict() for path in paths]}, status=status.HTTP_200_OK
+        )
+
+    @extend_schema(request=DistanceLookupSerializer)
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="distances",
+        permission_classes=[IsAuthenticated],
+    )
+    def distances(self, request):
+        """Endpoint for shortest distances between many pairs of spaceports"""
+        serializer = DistanceLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        distances = get_distance_matrix().lookup(serializer.validated_data["pairs"])
+        return Response({"distances": distances}, status=status.HTTP_200_OK)
+
 
 class SpaceshipViewSet(
+    ReplicaReadMixin,
+    QuerysetOptimizerMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
@@ -125,8 +216,6 @@ class SpaceshipViewSet(
             crew_ids = self._params_to_ints(crews)
             queryset = Spaceship.objects.filter(crews__id__in=crew_ids)
 
-        if self.action in ("list", "retrieve"):
-            queryset = queryset.prefetch_related("crews")
         return queryset.distinct()
 
     def get_serializer_class(self):
@@ -170,42 +259,249 @@ class SpaceshipViewSet(
         return super().list(request, *args, **kwargs)
 
 
-class SpaceflightViewSet(viewsets.ModelViewSet):
+class SpaceflightViewSet(
+    ReplicaReadMixin,
+    SpaceflightCacheMixin,
+    FastListMixin,
+    QuerysetOptimizerMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Spaceflight.objects.all()
     serializer_class = SpaceflightListSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    pagination_class = SpaceflightPagination
+    fast_list = True
+    # Of bookings with POST best-seats/, see get_throttles().
+    throttle_scope = "orders"
 
     def get_queryset(self):
         queryset = self.queryset
         if self.action == "list":
-            queryset = (
-                queryset.select_related("spaceship").annotate(
-                    tickets_available=F("spaceship__seats_in_row")
-                    * F("spaceship__rows")
-                    - Count("tickets")
-                )
-            ).order_by("id")
+            params = SpaceflightFilterSerializer(data=self.request.query_params)
+            params.is_valid(raise_exception=True)
+            queryset = filter_spaceflights(queryset, params.validated_data)
+        if self.action in ("seats", "holds", "best_seats"):
+            queryset = queryset.select_related("spaceship")
         return queryset
 
+    def get_throttles(self):
+        throttles = super().get_throttles()
+        if self.action == "best_seats" and self.request.method == "POST":
+            throttles.append(ScopedThrottle())
+        return throttles
+
+    @extend_schema(parameters=[SpaceflightFilterSerializer])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @extend_schema(parameters=[ItinerarySearchSerializer])
+    @action(methods=["GET"], detail=False, url_path="itineraries")
+    def itineraries(self, request):
+        """Endpoint for connecting spaceflights between two spaceports"""
+        params = ItinerarySearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        search = params.validated_data
+
+        connections = load_connections(
+            search["depart_after"], search["arrive_by"], search["seats"]
+        )
+        itineraries = find_itineraries(
+            connections,
+            search["from"],
+            search["to"],
+            search["min_layover"],
+            search["max_layover"],
+            search["limit"],
+        )
+        return Response(
+            {
+                "itineraries": [
+                    {
+                        "departure_time": legs[0].departure_time,
+                        "arrival_time": legs[-1].arrival_time,
+                        "legs": [leg._asdict() for leg in legs],
+                    }
+                    for legs in itineraries
+                ]
+            },
+            status=status.HTTP_200_OK,
+        )
 
-class OrderPagination(PageNumberPagination):
-    page_size = 5
-    page_size_query_param = "page_size"
-    max_page_size = 100
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="encoding",
+                type=str,
+                enum=SeatMapSerializer.ENCODINGS,
+                description="Taken seats as a base64 bitmap (default) "
+                "or as [row, first_seat, last_seat] ranges",
+            )
+        ]
+    )
+    @action(methods=["GET"], detail=True, url_path="seats")
+    def seats(self, request, pk=None):
+        """Endpoint for the taken seats of specific spaceflight"""
+        spaceflight = self.get_object()
+        params = SeatMapSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        seat_map = get_seat_map(spaceflight)
+
+        data = {
+            "id": spaceflight.id,
+            "rows": seat_map.rows,
+            "seats_in_row": seat_map.seats_in_row,
+            "taken": seat_map.taken,
+        }
+        if params.validated_data["encoding"] == "ranges":
+            data["ranges"] = seat_map.ranges()
+        else:
+            data["bitmap"] = seat_map.to_base64()
+        return Response(data, status=status.HTTP_200_OK)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="party",
+                type=int,
+                description="Number of adjacent seats to find (ex. ?party=3)",
+            )
+        ]
+    )
+    @action(
+        methods=["GET", "POST"],
+        detail=True,
+        url_path="best-seats",
+        permission_classes=[IsAuthenticated],
+    )
+    def best_seats(self, request, pk=None):
+        """
+        Endpoint for the best block of adjacent free seats of specific
+        spaceflight; POST books the block right away
+        """
+        if request.method == "POST":
+            # Booked like POST /orders/: throttled, idempotent and queued.
+            return idempotent(request, partial(self.find_best_seats, request))
+        return self.find_best_seats(request)
+
+    def find_best_seats(self, request):
+        spaceflight = self.get_object()
+        params = BestSeatsSerializer(
+            data=request.data if request.method == "POST" else request.query_params
+        )
+        params.is_valid(raise_exception=True)
+        party = params.validated_data["party"]
+
+        held_seats = (
+            active_holds(spaceflight=spaceflight)
+            .exclude(user=request.user)
+            .values_list("row", "seat")
+        )
+        block = get_seat_map(spaceflight).best_block(party, held_seats)
+        if block is None:
+            return Response(
+                {"detail": f"There are no {party} adjacent free seats in one row."},
+                status=status.HTTP_409_CONFLICT,
+            )
 
-class OrderViewSet(viewsets.ModelViewSet):
+        row, first_seat = block
+        tickets = [
+            {"row": row, "seat": seat, "spaceflight": spaceflight.id}
+            for seat in range(first_seat, first_seat + party)
+        ]
+        if request.method != "POST":
+            return Response({"tickets": tickets}, status=status.HTTP_200_OK)
+
+        serializer = OrderSerializer(
+            data={"tickets": tickets}, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        if settings.SPACEPORT_ASYNC_BOOKING:
+            return queue_order(request, serializer)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(
+        methods=["POST"],
+        detail=True,
+        url_path="holds",
+        permission_classes=[IsAuthenticated],
+    )
+    def holds(self, request, pk=None):
+        """Endpoint for holding seats of specific spaceflight for a few minutes"""
+        spaceflight = self.get_object()
+        serializer = SeatHoldSerializer(
+            data=request.data,
+            context={**self.get_serializer_context(), "spaceflight": spaceflight},
+        )
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            holds = place_holds(
+                spaceflight,
+                request.user,
+                serializer.validated_data["seats"],
+                serializer.validated_data["minutes"],
+            )
+        except SeatsUnavailable as error:
+            return Response(
+                {
+                    "detail": str(error),
+                    "seats": [{"row": row, "seat": seat} for row, seat in error.seats],
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(
+            {
+                "hold": holds[0].token,
+                "expires_at": holds[0].expires_at,
+                "seats": [{"row": hold.row, "seat": hold.seat} for hold in holds],
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="hold",
+                type=str,
+                description="Token of the seat hold to release",
+            )
+        ]
+    )
+    @holds.mapping.delete
+    def release(self, request, pk=None):
+        """Endpoint for releasing seats held on specific spaceflight"""
+        serializer = SeatHoldReleaseSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        release_holds(request.user, serializer.validated_data["hold"])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class OrderViewSet(
+    IdempotentCreateMixin,
+    QueuedCreateMixin,
+    QuerysetOptimizerMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = (IsAuthenticated,)
 
     pagination_class = OrderPagination
+    throttle_scope = "orders"
+
+    def get_throttles(self):
+        throttles = super().get_throttles()
+        if self.action == "create":
+            throttles.append(ScopedThrottle())
+        return throttles
 
     def get_queryset(self):
         queryset = self.queryset.filter(user=self.request.user.id)
-
-        if self.action == "list":
-            queryset = queryset.prefetch_related("tickets__spaceflight__spaceship")
+        if self.detail and settings.SPACEPORT_SHARDS:
+            pk = self.kwargs.get("pk", "")
+            using = shard_for_id(pk) if pk.isdigit() else None
+            return queryset.using(using) if using else queryset.none()
         return queryset
 
     def get_serializer_class(self):
@@ -213,5 +509,64 @@ class OrderViewSet(viewsets.ModelViewSet):
             return OrderListSerializer
         return OrderSerializer
 
+    def list(self, request, *args, **kwargs):
+        if not settings.SPACEPORT_SHARDS:
+            return super().list(request, *args, **kwargs)
+
+        # The newest orders of every shard, merged.
+        page = self.paginate_queryset(
+            ShardedQuerySet(
+                [
+                    self.filter_queryset(self.get_queryset().using(using))
+                    for using in ticket_databases()
+                ]
+            )
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+
+class BookingRequestViewSet(
+    QuerysetOptimizerMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    queryset = BookingRequest.objects.all()
+    serializer_class = BookingRequestSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user.id).order_by("-id")
+
+
+class ExportViewSet(viewsets.GenericViewSet):
+    permission_classes = (IsAdminUser,)
+    serializer_class = ExportSerializer
+
+    def export(self, request, name):
+        export = EXPORTS[name]
+        params = ExportSerializer(data=request.query_params, context={"export": export})
+        params.is_valid(raise_exception=True)
+        return export.response(params.validated_data)
+
+    @extend_schema(parameters=[ExportSerializer])
+    @action(methods=["GET"], detail=False, url_path="orders")
+    def orders(self, request):
+        """Endpoint for streaming every order with its ticket count"""
+        return self.export(request, "orders")
+
+    @extend_schema(parameters=[ExportSerializer])
+    @action(methods=["GET"], detail=False, url_path="tickets")
+    def tickets(self, request):
+        """Endpoint for streaming every ticket"""
+        return self.export(request, "tickets")
+
+    @extend_schema(parameters=[ExportSerializer])
+    @action(methods=["GET"], detail=False, url_path="manifests")
+    def manifests(self, request):
+        """Endpoint for streaming passengers by seat of spaceflights"""
+        return self.export(request, "manifests")
@@ -14,6 +14,8 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -59,6 +61,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "spaceport.replicas.PrimaryPinMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -95,6 +98,55 @@ DATABASES = {
     }
 }
 
+# SPACEPORT_DB_PROFILE=production keeps connections open between requests and
+# tunes every new SQLite connection (see spaceport.signals): WAL lets readers
+# run alongside a booking write, which only waits for other writers.
+SPACEPORT_DB_PROFILE = os.environ.get("SPACEPORT_DB_PROFILE", "development")
+SPACEPORT_SQLITE_PROFILES = {
+    "development": {},
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+    },
+}
+SPACEPORT_SQLITE_PRAGMAS = SPACEPORT_SQLITE_PROFILES[SPACEPORT_DB_PROFILE]
+
+if SPACEPORT_DB_PROFILE == "production":
+    DATABASES["default"].update(CONN_MAX_AGE=600, CONN_HEALTH_CHECKS=True)
+
+# Read replicas for safe requests (see spaceport.replicas), e.g. SQLite copies
+# of the primary refreshed by `manage.py sync_replicas --every 10`. Users stay
+# on the primary for SPACEPORT_REPLICA_LAG seconds after a write.
+SPACEPORT_REPLICAS = []
+for number, name in enumerate(
+    filter(None, os.environ.get("SPACEPORT_REPLICA_DBS", "").split(",")), 1
+):
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "NAME": name,
+        "TEST": {"MIRROR": "default"},
+    }
+    SPACEPORT_REPLICAS.append(f"replica{number}")
+SPACEPORT_REPLICA_LAG = 30
+
+# Orders and tickets sharded by spaceflight (see spaceport.sharding), e.g.
+# SPACEPORT_SHARD_DBS=shard1.sqlite3,shard2.sqlite3; set up each shard with
+# `manage.py migrate --database shardN` before it takes orders.
+SPACEPORT_SHARDS = []
+for number, name in enumerate(
+    filter(None, os.environ.get("SPACEPORT_SHARD_DBS", "").split(",")), 1
+):
+    DATABASES[f"shard{number}"] = {**DATABASES["default"], "NAME": name}
+    SPACEPORT_SHARDS.append(f"shard{number}")
+
+DATABASE_ROUTERS = [
+    "spaceport.sharding.ShardRouter",
+    "spaceport.replicas.ReplicaRouter",
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -148,15 +200,17 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 2,
-    "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    ),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("user.authentication.CachedJWTAuthentication",),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",
-        "rest_framework.throttling.UserRateThrottle",
+        "spaceport.throttling.AnonThrottle",
+        "spaceport.throttling.UserThrottle",
     ],
-    "DEFAULT_THROTTLE_RATES": {"anon": "100/day", "user": "1000/day"},
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": "100/day",
+        "user": "1000/day",
+        "orders": "20/minute",
+    },
 }
 
 SPECTACULAR_SETTINGS = {
@@ -172,6 +226,35 @@ SPECTACULAR_SETTINGS = {
     },
 }
 
+# Queue POST /api/spaceport/orders/ for `manage.py process_bookings` workers
+# instead of booking within the request.
+SPACEPORT_ASYNC_BOOKING = os.environ.get("SPACEPORT_ASYNC_BOOKING") == "1"
+if SPACEPORT_ASYNC_BOOKING and SPACEPORT_SHARDS:
+    raise ImproperlyConfigured(
+        "Queued bookings link orders on the default database, "
+        "turn off SPACEPORT_ASYNC_BOOKING to shard orders."
+    )
+
+# All-pairs route distances, memory-mapped by every worker and rebuilt in the
+# background when routes change.
+SPACEPORT_DISTANCE_MATRIX = os.environ.get(
+    "SPACEPORT_DISTANCE_MATRIX", BASE_DIR / "distances.npy"
+)
+
+# Shared state of the API throttles, see spaceport.throttling.
+SPACEPORT_THROTTLE_DB = os.environ.get(
+    "SPACEPORT_THROTTLE_DB", BASE_DIR / "throttle.sqlite3"
+)
+
+# Cached responses, their change marks and locks, replica pins and the route
+# graph version, shared by every worker on the host, see spaceport.cache.
+CACHES = {
+    "default": {
+        "BACKEND": "spaceport.cache.SQLiteCache",
+        "LOCATION": os.environ.get("SPACEPORT_CACHE_DB", BASE_DIR / "cache.sqlite3"),
+    }
+}
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+USER_CACHE_SIZE = 10_000
+USER_CACHE_TTL = 60
+
+
+class UserCache:
+    """Least recently used user rows, each kept for at most ``ttl`` seconds."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            cached = self._rows.get(user_id)
+            if cached is None:
+                return None
+            expires_at, row = cached
+            if expires_at < time.monotonic():
+                del self._rows[user_id]
+                return None
+            self._rows.move_to_end(user_id)
+            return row
+
+    def set(self, user_id, row):
+        with self._lock:
+            self._rows[user_id] = (time.monotonic() + self.ttl, row)
+            self._rows.move_to_end(user_id)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._rows.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that loads the user from ``user_cache`` when it
+    can. Users are built from the cached columns permission checks read, the
+    others are deferred.
+
+    The cache is per process: saves and deletes evict the user only in the
+    worker that made them. Other workers keep serving the cached row, e.g.
+    of a user just deactivated or with a changed password, for up to
+    ``USER_CACHE_TTL`` seconds.
+    """
+
+    def get_fields(self):
+        fields = [
+            self.user_model._meta.pk.attname,
+            self.user_model.USERNAME_FIELD,
+            "is_active",
+            "is_staff",
+            "is_superuser",
+        ]
+        if api_settings.CHECK_REVOKE_TOKEN:
+            fields.append("password")
+        # Model.from_db() takes partial rows in concrete field order.
+        return [
+            field.attname
+            for field in self.user_model._meta.concrete_fields
+            if field.attname in fields
+        ]
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        fields = self.get_fields()
+        row = user_cache.get(user_id)
+        if row is None:
+            row = (
+                self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                .values_list(*fields)
+                .first()
+            )
+            if row is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user_id, row)
+
+        user = self.user_model.from_db(router.db_for_read(self.user_model), fields, row)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
@@ -0,0 +1,16 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+
+from user.authentication import user_cache
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def evict_cached_user(sender, instance, **kwargs):
+    """Drops the user cached for authentication, e.g. on a password change."""
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    user_cache.evict(user_id)
+    # Again after commit, in case a request cached the old row meanwhile.
+    transaction.on_commit(lambda: user_cache.evict(user_id))
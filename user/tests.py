@@ -1,3 +1,80 @@
-from django.test import TestCase
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from user.authentication import USER_CACHE_TTL, user_cache
+
+PLANETS_URL = "/api/spaceport/planets/"
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        state_dir = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(
+            override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+                    }
+                },
+                SPACEPORT_THROTTLE_DB=f"{state_dir}/throttle.sqlite3",
+                SPACEPORT_REPLICAS=[],
+            )
+        )
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            "passenger@spaceport.com", "pass12345"
+        )
+
+    def setUp(self):
+        user_cache.clear()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+    def get(self, status=200):
+        """Requests a page, returning how many queries read the user."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(PLANETS_URL)
+        self.assertEqual(response.status_code, status)
+        table = get_user_model()._meta.db_table
+        return sum(table in query["sql"] for query in queries.captured_queries)
+
+    def test_second_request_reads_the_cached_user(self):
+        self.assertEqual(self.get(), 1)
+        self.assertEqual(self.get(), 0)
+
+    def test_save_evicts_the_user(self):
+        self.get()
+        self.user.first_name = "Yuri"
+        self.user.save()
+        self.assertEqual(self.get(), 1)
+
+    def test_deactivated_user_is_refused(self):
+        self.get()
+        self.user.is_active = False
+        self.user.save()
+        self.get(status=401)
+
+    def test_cached_user_expires(self):
+        self.get()
+        # update() sends no signal: like a save in another worker, it shows
+        # once the cached row expires.
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        self.get()
+
+        expired = time.monotonic() + USER_CACHE_TTL + 1
+        with mock.patch("user.authentication.time.monotonic", return_value=expired):
+            self.get(status=401)